@@ -26,7 +26,11 @@ if ($job['status'] !== 'completed') {
     die("El documento aún no está listo para descargar");
 }
 
-if (empty($job['pdf_data'])) {
+// PDF en el almacén de blobs; los trabajos anteriores lo tienen por bloques o en pdf_data
+$blob = !empty($job['pdf_sha256']);
+$chunked = !empty($job['pdf_chunks']);
+
+if (!$blob && !$chunked && empty($job['pdf_data'])) {
     http_response_code(404);
     die("PDF no encontrado");
 }
@@ -44,5 +48,11 @@ header('Pragma: no-cache');
 header('Expires: 0');
 
 // Enviar contenido del PDF
-echo $job['pdf_data'];
+if ($blob) {
+    streamBlob($job['pdf_sha256']);
+} elseif ($chunked) {
+    streamPdfChunks($jobId, (int)$job['pdf_chunks']);
+} else {
+    echo $job['pdf_data'];
+}
 exit;
@@ -18,6 +18,11 @@ define('REVISTA_CODIGO', getenv('REVISTA_CODIGO') ?: 'ideas'); // ideas, informa
 // Configuración de archivos
 define('MAX_FILE_SIZE', 50 * 1024 * 1024); // 50 MB
 define('ALLOWED_EXTENSIONS', ['doc', 'docx', 'tex']);
+define('BLOB_CHUNK_SIZE', 1024 * 1024); // Bloques del almacén de archivos (menor que max_allowed_packet)
+
+// Clases de prioridad de la cola (jobs.priority, mayor = antes)
+define('JOB_PRIORITY_NORMAL', 0);
+define('JOB_PRIORITY_EDITOR', 2); // Reprocesados pedidos por el editor
 
 // Configuración de email (SMTP)
 define('SMTP_HOST', 'smtp.hostinger.com'); // Ajustar según tu proveedor
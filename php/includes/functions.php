@@ -186,40 +186,139 @@ function getRevistaConfig() {
 
 /**
  * Crea un nuevo trabajo de procesamiento
+ * $priority: clase de prioridad en la cola (JOB_PRIORITY_EDITOR para reprocesados del editor)
  */
-function createJob($userId, $revistaConfig, $file) {
+function createJob($userId, $revistaConfig, $file, $priority = JOB_PRIORITY_NORMAL) {
     $db = getDB();
 
     $jobId = generateUUID();
     $filename = $file['name'];
     $extension = strtolower(pathinfo($filename, PATHINFO_EXTENSION));
-    $fileData = file_get_contents($file['tmp_name']);
     $fileSize = $file['size'];
 
     // Calcular fecha de eliminación (30 días)
     $deleteAt = date('Y-m-d H:i:s', strtotime('+30 days'));
 
-    $stmt = $db->prepare("
-        INSERT INTO jobs (
-            job_id, user_id, revista_codigo, filename_original,
-            file_extension, file_data, file_size, delete_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ");
+    // El archivo va al almacén de blobs (una sola vez por contenido)
+    $db->beginTransaction();
+    try {
+        $fileSha256 = storeBlob($file['tmp_name']);
+
+        $stmt = $db->prepare("
+            INSERT INTO jobs (
+                job_id, user_id, revista_codigo, filename_original,
+                file_extension, file_size, file_sha256, delete_at, priority
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ");
+
+        $stmt->execute([
+            $jobId,
+            $userId,
+            $revistaConfig['codigo'],
+            $filename,
+            $extension,
+            $fileSize,
+            $fileSha256,
+            $deleteAt,
+            $priority
+        ]);
+
+        $db->commit();
+    } catch (Exception $e) {
+        $db->rollBack();
+        throw $e;
+    }
 
-    $stmt->execute([
-        $jobId,
-        $userId,
-        $revistaConfig['codigo'],
-        $filename,
-        $extension,
-        $fileData,
-        $fileSize,
-        $deleteAt
-    ]);
+    notifyWorkers();
 
     return $jobId;
 }
 
+/**
+ * Guarda un archivo en el almacén de blobs si su contenido no estaba ya
+ * (mismo protocolo que blob_store.py del worker). Debe llamarse dentro de una
+ * transacción. Devuelve el SHA-256 del archivo.
+ */
+function storeBlob($path) {
+    $db = getDB();
+    $sha256 = hash_file('sha256', $path);
+
+    // La fila de blobs hace de cerrojo: otra subida del mismo contenido espera
+    // a que esta transacción termine y lo encuentra completo
+    $stmt = $db->prepare("INSERT IGNORE INTO blobs (sha256, size, chunk_count) VALUES (?, 0, NULL)");
+    $stmt->execute([$sha256]);
+    if ($stmt->rowCount() === 0) {
+        $stmt = $db->prepare("SELECT chunk_count FROM blobs WHERE sha256 = ?");
+        $stmt->execute([$sha256]);
+        if ($stmt->fetchColumn() !== null) {
+            return $sha256;
+        }
+        // Escritura anterior interrumpida: se reescribe
+        $db->prepare("DELETE FROM blob_chunks WHERE sha256 = ?")->execute([$sha256]);
+    }
+
+    $insert = $db->prepare("INSERT INTO blob_chunks (sha256, chunk_index, data) VALUES (?, ?, ?)");
+    $handle = fopen($path, 'rb');
+    $size = 0;
+    $chunkIndex = 0;
+    while (!feof($handle)) {
+        $chunk = fread($handle, BLOB_CHUNK_SIZE);
+        if ($chunk === false || $chunk === '') {
+            break;
+        }
+        $insert->execute([$sha256, $chunkIndex, $chunk]);
+        $size += strlen($chunk);
+        $chunkIndex++;
+    }
+    fclose($handle);
+
+    $stmt = $db->prepare("UPDATE blobs SET size = ?, chunk_count = ? WHERE sha256 = ?");
+    $stmt->execute([$size, $chunkIndex, $sha256]);
+
+    return $sha256;
+}
+
+/**
+ * Envía un blob bloque a bloque (sin cargarlo completo en memoria)
+ */
+function streamBlob($sha256) {
+    $db = getDB();
+    $stmt = $db->prepare("SELECT chunk_count FROM blobs WHERE sha256 = ?");
+    $stmt->execute([$sha256]);
+    $chunkCount = (int)$stmt->fetchColumn();
+    $stmt->closeCursor();
+
+    $stmt = $db->prepare("SELECT data FROM blob_chunks WHERE sha256 = ? AND chunk_index = ?");
+    for ($i = 0; $i < $chunkCount; $i++) {
+        $stmt->execute([$sha256, $i]);
+        $chunk = $stmt->fetchColumn();
+        $stmt->closeCursor();
+
+        if ($chunk === false) {
+            break;
+        }
+
+        echo $chunk;
+        flush();
+    }
+}
+
+/**
+ * Avisa a los workers que hay un trabajo nuevo en la cola
+ */
+function notifyWorkers() {
+    try {
+        $db = getDB();
+        $db->exec("
+            INSERT INTO job_queue_signal (id, seq) VALUES (1, 1)
+            ON DUPLICATE KEY UPDATE seq = seq + 1
+        ");
+    } catch (Exception $e) {
+        // Los workers siguen detectando el trabajo por polling
+        error_log("Error al notificar workers: " . $e->getMessage());
+    }
+}
+
 /**
  * Obtiene información de un trabajo
  */
@@ -230,6 +329,27 @@ function getJob($jobId) {
     return $stmt->fetch();
 }
 
+/**
+ * Envía el PDF guardado por bloques, uno a la vez para no cargarlo completo en memoria
+ */
+function streamPdfChunks($jobId, $chunkCount) {
+    $db = getDB();
+    $stmt = $db->prepare("SELECT data FROM job_pdf_chunks WHERE job_id = ? AND chunk_index = ?");
+
+    for ($i = 0; $i < $chunkCount; $i++) {
+        $stmt->execute([$jobId, $i]);
+        $chunk = $stmt->fetchColumn();
+        $stmt->closeCursor();
+
+        if ($chunk === false) {
+            break;
+        }
+
+        echo $chunk;
+        flush();
+    }
+}
+
 /**
  * Valida archivo subido
  */
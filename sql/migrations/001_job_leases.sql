@@ -0,0 +1,10 @@
+-- Reclamo atómico de trabajos con lease (varios workers comparten la cola)
+-- Requiere MySQL 8.0+ o MariaDB 10.6+ (SELECT ... FOR UPDATE SKIP LOCKED)
+USE editor_latex;
+
+ALTER TABLE jobs
+    ADD COLUMN lease_owner VARCHAR(100) COMMENT 'Worker que reclamó el trabajo',
+    ADD COLUMN lease_expires DATETIME COMMENT 'Si expira, otro worker puede reclamarlo',
+    ADD COLUMN heartbeat_at DATETIME,
+    ADD COLUMN attempts INT NOT NULL DEFAULT 0,
+    ADD INDEX idx_status_lease (status, lease_expires);
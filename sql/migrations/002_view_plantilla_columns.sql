@@ -0,0 +1,22 @@
+-- La vista expone plantilla_folder y plantilla_main (el worker pide columnas
+-- explícitas para no transferir los LONGBLOB en cada consulta)
+USE editor_latex;
+
+CREATE OR REPLACE VIEW v_jobs_with_config AS
+SELECT
+    j.*,
+    u.nombre,
+    u.apellidos,
+    u.email,
+    r.nombre as revista_nombre,
+    r.nombre_completo as revista_nombre_completo,
+    r.compilador,
+    r.plantilla_folder,
+    r.plantilla_main,
+    r.volumen,
+    r.año,
+    r.numero,
+    r.pagina_inicial
+FROM jobs j
+INNER JOIN users u ON j.user_id = u.id
+INNER JOIN revista_config r ON j.revista_codigo = r.codigo;
@@ -0,0 +1,10 @@
+-- Señal de trabajos nuevos para despertar a los workers sin consultar la cola
+USE editor_latex;
+
+CREATE TABLE IF NOT EXISTS job_queue_signal (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO job_queue_signal (id, seq) VALUES (1, 0);
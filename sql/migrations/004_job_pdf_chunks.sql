@@ -0,0 +1,33 @@
+-- PDF guardado por bloques (subida y descarga con memoria acotada)
+USE editor_latex;
+
+ALTER TABLE jobs
+    ADD COLUMN pdf_chunks INT COMMENT 'Si no es NULL, el PDF está en job_pdf_chunks' AFTER pdf_size;
+
+CREATE TABLE IF NOT EXISTS job_pdf_chunks (
+    job_id VARCHAR(36) NOT NULL,
+    chunk_index INT NOT NULL,
+    data MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (job_id, chunk_index),
+    FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Recrear la vista para que j.* incluya la nueva columna
+CREATE OR REPLACE VIEW v_jobs_with_config AS
+SELECT
+    j.*,
+    u.nombre,
+    u.apellidos,
+    u.email,
+    r.nombre as revista_nombre,
+    r.nombre_completo as revista_nombre_completo,
+    r.compilador,
+    r.plantilla_folder,
+    r.plantilla_main,
+    r.volumen,
+    r.año,
+    r.numero,
+    r.pagina_inicial
+FROM jobs j
+INNER JOIN users u ON j.user_id = u.id
+INNER JOIN revista_config r ON j.revista_codigo = r.codigo;
@@ -0,0 +1,31 @@
+-- Planificador justo: prioridad por trabajo, peso por revista e índices de la cola
+USE editor_latex;
+
+ALTER TABLE jobs
+    ADD COLUMN priority TINYINT NOT NULL DEFAULT 0 COMMENT 'Clase de prioridad (mayor = antes; 2 = reprocesado del editor)' AFTER status,
+    ADD INDEX idx_status_created (status, created_at),
+    ADD INDEX idx_status_priority (status, revista_codigo, user_id, priority, created_at),
+    DROP INDEX idx_status;
+
+ALTER TABLE revista_config
+    ADD COLUMN peso INT NOT NULL DEFAULT 1 COMMENT 'Peso de la revista en el reparto de la cola' AFTER pagina_inicial;
+
+-- La vista se vuelve a crear para que j.* incluya la columna nueva
+CREATE OR REPLACE VIEW v_jobs_with_config AS
+SELECT
+    j.*,
+    u.nombre,
+    u.apellidos,
+    u.email,
+    r.nombre as revista_nombre,
+    r.nombre_completo as revista_nombre_completo,
+    r.compilador,
+    r.plantilla_folder,
+    r.plantilla_main,
+    r.volumen,
+    r.año,
+    r.numero,
+    r.pagina_inicial
+FROM jobs j
+INNER JOIN users u ON j.user_id = u.id
+INNER JOIN revista_config r ON j.revista_codigo = r.codigo;
@@ -0,0 +1,75 @@
+-- Almacén de archivos por contenido (SHA-256): documentos y PDFs fuera de jobs
+-- Las filas de jobs quedan pequeñas y un mismo archivo se guarda una sola vez.
+-- Los trabajos anteriores conservan file_data / pdf_data / job_pdf_chunks y
+-- se siguen leyendo hasta que los borre la limpieza.
+USE editor_latex;
+
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 CHAR(64) NOT NULL PRIMARY KEY,
+    size BIGINT NOT NULL,
+    chunk_count INT COMMENT 'NULL mientras se escriben los bloques',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS blob_chunks (
+    sha256 CHAR(64) NOT NULL,
+    chunk_index INT NOT NULL,
+    data MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (sha256, chunk_index),
+    FOREIGN KEY (sha256) REFERENCES blobs(sha256) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+ALTER TABLE jobs
+    MODIFY file_data LONGBLOB NULL COMMENT 'Solo trabajos anteriores al almacén de blobs',
+    ADD COLUMN file_sha256 CHAR(64) COMMENT 'Documento subido (blobs)' AFTER file_size,
+    ADD COLUMN pdf_sha256 CHAR(64) COMMENT 'PDF generado (blobs)' AFTER pdf_chunks,
+    ADD INDEX idx_file_sha256 (file_sha256),
+    ADD INDEX idx_pdf_sha256 (pdf_sha256);
+
+-- Recrear la vista para que j.* incluya las columnas nuevas
+CREATE OR REPLACE VIEW v_jobs_with_config AS
+SELECT
+    j.*,
+    u.nombre,
+    u.apellidos,
+    u.email,
+    r.nombre as revista_nombre,
+    r.nombre_completo as revista_nombre_completo,
+    r.compilador,
+    r.plantilla_folder,
+    r.plantilla_main,
+    r.volumen,
+    r.año,
+    r.numero,
+    r.pagina_inicial
+FROM jobs j
+INNER JOIN users u ON j.user_id = u.id
+INNER JOIN revista_config r ON j.revista_codigo = r.codigo;
+
+-- La limpieza también borra los blobs que ya no usa ningún trabajo
+DROP PROCEDURE IF EXISTS clean_old_jobs;
+
+DELIMITER //
+CREATE PROCEDURE clean_old_jobs()
+BEGIN
+    DELETE FROM jobs
+    WHERE delete_at IS NOT NULL
+    AND delete_at < NOW();
+
+    -- También limpiar jobs completados hace más de 30 días
+    DELETE FROM jobs
+    WHERE status = 'completed'
+    AND completed_at < DATE_SUB(NOW(), INTERVAL 30 DAY);
+
+    -- Limpiar jobs con error hace más de 7 días
+    DELETE FROM jobs
+    WHERE status = 'error'
+    AND created_at < DATE_SUB(NOW(), INTERVAL 7 DAY);
+
+    -- Blobs sin referencias (con margen para los que se están subiendo ahora)
+    DELETE b FROM blobs b
+    WHERE b.created_at < DATE_SUB(NOW(), INTERVAL 1 DAY)
+    AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.file_sha256 = b.sha256)
+    AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.pdf_sha256 = b.sha256);
+END //
+DELIMITER ;
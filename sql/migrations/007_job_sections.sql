@@ -0,0 +1,17 @@
+-- Secciones del LaTeX de cada trabajo completado, con el hash de su contenido
+-- de origen: cuando el autor sube una revisión del mismo artículo, el worker
+-- solo vuelve a convertir con Gemini las secciones que cambiaron.
+USE editor_latex;
+
+CREATE TABLE IF NOT EXISTS job_sections (
+    job_id VARCHAR(36) NOT NULL,
+    section_index INT NOT NULL COMMENT '-1 = marco (preámbulo, título, resumen)',
+    content_sha256 CHAR(64) NOT NULL COMMENT 'Hash del contenido de origen y la plantilla',
+    latex MEDIUMTEXT NOT NULL,
+    PRIMARY KEY (job_id, section_index),
+    FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Búsqueda de la versión anterior del mismo artículo
+ALTER TABLE jobs
+    ADD INDEX idx_revision (user_id, revista_codigo, filename_original, status);
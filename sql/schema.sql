@@ -31,6 +31,7 @@ CREATE TABLE IF NOT EXISTS revista_config (
     año INT NOT NULL DEFAULT 2025,
     numero INT NOT NULL DEFAULT 1,
     pagina_inicial INT NOT NULL DEFAULT 1,
+    peso INT NOT NULL DEFAULT 1 COMMENT 'Peso de la revista en el reparto de la cola',
     activa BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
@@ -53,24 +54,74 @@ CREATE TABLE IF NOT EXISTS jobs (
     revista_codigo VARCHAR(20) NOT NULL,
     filename_original VARCHAR(255) NOT NULL,
     file_extension VARCHAR(10) NOT NULL,
-    file_data LONGBLOB NOT NULL,
+    file_data LONGBLOB NULL COMMENT 'Solo trabajos anteriores al almacén de blobs',
     file_size INT NOT NULL,
+    file_sha256 CHAR(64) COMMENT 'Documento subido (blobs)',
     status ENUM('pending', 'processing', 'completed', 'error') DEFAULT 'pending',
+    priority TINYINT NOT NULL DEFAULT 0 COMMENT 'Clase de prioridad (mayor = antes; 2 = reprocesado del editor)',
     error_message TEXT,
     pdf_data LONGBLOB,
     pdf_size INT,
+    pdf_chunks INT COMMENT 'Si no es NULL, el PDF está en job_pdf_chunks',
+    pdf_sha256 CHAR(64) COMMENT 'PDF generado (blobs)',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     started_at DATETIME,
     completed_at DATETIME,
     notified BOOLEAN DEFAULT FALSE,
     delete_at DATETIME,
+    lease_owner VARCHAR(100) COMMENT 'Worker que reclamó el trabajo',
+    lease_expires DATETIME COMMENT 'Si expira, otro worker puede reclamarlo',
+    heartbeat_at DATETIME,
+    attempts INT NOT NULL DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (revista_codigo) REFERENCES revista_config(codigo),
     INDEX idx_job_id (job_id),
-    INDEX idx_status (status),
+    INDEX idx_status_created (status, created_at),
+    INDEX idx_status_priority (status, revista_codigo, user_id, priority, created_at),
     INDEX idx_user_id (user_id),
     INDEX idx_created_at (created_at),
-    INDEX idx_delete_at (delete_at)
+    INDEX idx_delete_at (delete_at),
+    INDEX idx_status_lease (status, lease_expires),
+    INDEX idx_file_sha256 (file_sha256),
+    INDEX idx_pdf_sha256 (pdf_sha256),
+    INDEX idx_revision (user_id, revista_codigo, filename_original, status)
+) ENGINE=InnoDB;
+
+-- Almacén de archivos por contenido (SHA-256): documentos y PDFs se guardan
+-- una sola vez, por bloques menores que max_allowed_packet
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 CHAR(64) NOT NULL PRIMARY KEY,
+    size BIGINT NOT NULL,
+    chunk_count INT COMMENT 'NULL mientras se escriben los bloques',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS blob_chunks (
+    sha256 CHAR(64) NOT NULL,
+    chunk_index INT NOT NULL,
+    data MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (sha256, chunk_index),
+    FOREIGN KEY (sha256) REFERENCES blobs(sha256) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- PDF generado por bloques (trabajos anteriores al almacén de blobs)
+CREATE TABLE IF NOT EXISTS job_pdf_chunks (
+    job_id VARCHAR(36) NOT NULL,
+    chunk_index INT NOT NULL,
+    data MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (job_id, chunk_index),
+    FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Secciones del LaTeX de cada trabajo completado con el hash de su origen:
+-- en una revisión del mismo artículo solo se reconvierten las que cambiaron
+CREATE TABLE IF NOT EXISTS job_sections (
+    job_id VARCHAR(36) NOT NULL,
+    section_index INT NOT NULL COMMENT '-1 = marco (preámbulo, título, resumen)',
+    content_sha256 CHAR(64) NOT NULL COMMENT 'Hash del contenido de origen y la plantilla',
+    latex MEDIUMTEXT NOT NULL,
+    PRIMARY KEY (job_id, section_index),
+    FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
 -- Tabla de logs de procesamiento
@@ -84,6 +135,16 @@ CREATE TABLE IF NOT EXISTS processing_logs (
     INDEX idx_job_id (job_id)
 ) ENGINE=InnoDB;
 
+-- Señal de trabajos nuevos: PHP incrementa seq al crear un trabajo y los
+-- workers consultan esta única fila en lugar de la cola completa
+CREATE TABLE IF NOT EXISTS job_queue_signal (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO job_queue_signal (id, seq) VALUES (1, 0);
+
 -- Vista para consultas comunes
 CREATE VIEW v_jobs_with_config AS
 SELECT
@@ -94,7 +155,8 @@ SELECT
     r.nombre as revista_nombre,
     r.nombre_completo as revista_nombre_completo,
     r.compilador,
-    r.plantilla_nombre,
+    r.plantilla_folder,
+    r.plantilla_main,
     r.volumen,
     r.año,
     r.numero,
@@ -120,6 +182,12 @@ BEGIN
     DELETE FROM jobs
     WHERE status = 'error'
     AND created_at < DATE_SUB(NOW(), INTERVAL 7 DAY);
+
+    -- Blobs sin referencias (con margen para los que se están subiendo ahora)
+    DELETE b FROM blobs b
+    WHERE b.created_at < DATE_SUB(NOW(), INTERVAL 1 DAY)
+    AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.file_sha256 = b.sha256)
+    AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.pdf_sha256 = b.sha256);
 END //
 DELIMITER ;
 
@@ -0,0 +1,643 @@
+"""
+Benchmark sin conexión del procesamiento de trabajos
+Ejecuta los trabajos de principio a fin con el pipeline de worker.py contra una
+base SQLite local (en lugar de MySQL) y un modelo de Gemini simulado, sobre
+documentos .docx/.tex generados para cada plantilla. Informa trabajos por
+minuto, p50/p95 por etapa y el pico de memoria de Python.
+
+Uso:
+    python benchmark.py --jobs 40 --workers 3
+    python benchmark.py --jobs 40 --fake-compile --json resultado.json
+
+Si pdflatex/xelatex no están instalados se usa una compilación simulada.
+"""
+
+import os
+import re
+import hashlib
+import importlib.util
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PLANTILLAS = os.path.join(os.path.dirname(BASE_DIR), 'plantillas')
+
+# Esquema equivalente al de MySQL (solo lo que usa el worker)
+SQLITE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    apellidos TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE revista_config (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codigo TEXT NOT NULL UNIQUE,
+    nombre TEXT NOT NULL,
+    nombre_completo TEXT NOT NULL,
+    compilador TEXT NOT NULL DEFAULT 'pdflatex',
+    plantilla_folder TEXT NOT NULL,
+    plantilla_main TEXT NOT NULL DEFAULT 'main.tex',
+    volumen INTEGER NOT NULL DEFAULT 1,
+    año INTEGER NOT NULL DEFAULT 2025,
+    numero INTEGER NOT NULL DEFAULT 1,
+    pagina_inicial INTEGER NOT NULL DEFAULT 1,
+    activa INTEGER NOT NULL DEFAULT 1,
+    peso INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    revista_codigo TEXT NOT NULL,
+    filename_original TEXT NOT NULL,
+    file_extension TEXT NOT NULL,
+    file_data BLOB,
+    file_size INTEGER NOT NULL,
+    file_sha256 TEXT,
+    status TEXT DEFAULT 'pending',
+    priority INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    pdf_data BLOB,
+    pdf_size INTEGER,
+    pdf_chunks INTEGER,
+    pdf_sha256 TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    started_at TEXT,
+    completed_at TEXT,
+    notified INTEGER DEFAULT 0,
+    delete_at TEXT,
+    lease_owner TEXT,
+    lease_expires TEXT,
+    heartbeat_at TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    chunk_count INTEGER,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE blob_chunks (
+    sha256 TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (sha256, chunk_index)
+);
+
+CREATE TABLE job_pdf_chunks (
+    job_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, chunk_index)
+);
+
+CREATE TABLE job_sections (
+    job_id TEXT NOT NULL,
+    section_index INTEGER NOT NULL,
+    content_sha256 TEXT NOT NULL,
+    latex TEXT NOT NULL,
+    PRIMARY KEY (job_id, section_index)
+);
+
+CREATE TABLE processing_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    log_level TEXT DEFAULT 'info',
+    message TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE job_queue_signal (
+    id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO job_queue_signal (id, seq) VALUES (1, 0);
+
+CREATE VIEW v_jobs_with_config AS
+SELECT
+    j.*,
+    u.nombre,
+    u.apellidos,
+    u.email,
+    r.nombre as revista_nombre,
+    r.nombre_completo as revista_nombre_completo,
+    r.compilador,
+    r.plantilla_folder,
+    r.plantilla_main,
+    r.volumen,
+    r.año,
+    r.numero,
+    r.pagina_inicial
+FROM jobs j
+INNER JOIN users u ON j.user_id = u.id
+INNER JOIN revista_config r ON j.revista_codigo = r.codigo;
+"""
+
+# Traducción de las construcciones de MySQL que usa el worker
+SQL_REWRITES = [
+    (re.compile(r'DATE_ADD\(NOW\(\),\s*INTERVAL\s+(\S+)\s+SECOND\)'), r"datetime('now', '+' || \1 || ' seconds')"),
+    (re.compile(r'DATE_SUB\(NOW\(\),\s*INTERVAL\s+(\S+)\s+SECOND\)'), r"datetime('now', '-' || \1 || ' seconds')"),
+    (re.compile(r'NOW\(\)'), "datetime('now')"),
+    (re.compile(r'FOR UPDATE SKIP LOCKED'), ''),
+    (re.compile(r'INSERT IGNORE'), 'INSERT OR IGNORE'),
+    (re.compile(r'%s'), '?'),
+]
+
+# Columnas de fecha que se devuelven como datetime (igual que mysql.connector)
+DATETIME_COLUMN = re.compile(r'_at$|_expires$')
+
+
+def translate_sql(query):
+    for pattern, replacement in SQL_REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+class SQLiteCursor:
+    """Cursor con la interfaz de mysql.connector (dictionary=True)"""
+
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate_sql(query), tuple(params or ()))
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(translate_sql(query), [tuple(params) for params in seq_params])
+
+    def _row(self, row):
+        if row is None:
+            return None
+        result = {}
+        for (name, *_), value in zip(self._cursor.description, row):
+            if isinstance(value, str) and DATETIME_COLUMN.search(name):
+                try:
+                    value = datetime.fromisoformat(value)
+                except ValueError:
+                    pass
+            result[name] = value
+        return result
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Sustituto de MySQLConnection sobre un archivo SQLite compartido"""
+
+    path = None
+
+    def __init__(self):
+        self.connection = None
+        self.connect()
+
+    def connect(self):
+        # Sin transacción implícita: start_transaction abre una explícita
+        self.connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+
+    def get_cursor(self, prepared=False):
+        return SQLiteCursor(self.connection)
+
+    def start_transaction(self):
+        # IMMEDIATE toma el bloqueo de escritura al inicio (equivale a FOR UPDATE)
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self.connection.in_transaction:
+            self.connection.execute('COMMIT')
+
+    def rollback(self):
+        if self.connection and self.connection.in_transaction:
+            self.connection.execute('ROLLBACK')
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeGenerativeModel:
+    """
+    Sustituto de genai.GenerativeModel con respuestas de LaTeX válidas.
+    Simula la latencia de red y la velocidad de generación.
+    """
+
+    plantillas = {}
+    latency = 1.0
+    tokens_per_second = 400.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @classmethod
+    def _template(cls, prompt):
+        match = re.search(r'\\documentclass(?:\[[^\]]*\])?\{(\w+)\}', prompt)
+        name = match.group(1) if match else None
+        return cls.plantillas.get(name) or (
+            "\\documentclass{article}\n\\begin{document}\n\\end{document}\n"
+        )
+
+    @staticmethod
+    def _paragraphs(count):
+        paragraph = ("Texto de prueba generado para el benchmark con contenido "
+                     "suficiente para ocupar varias líneas en el documento compilado. ")
+        return '\n\n'.join(paragraph * 3 for _ in range(max(1, count)))
+
+    def _answer(self, prompt):
+        from worker import SECTIONS_PLACEHOLDER
+
+        # Reparación: devolver las mismas líneas (el benchmark no genera errores)
+        if 'Corrige el error' in prompt:
+            match = re.search(r'del documento:\n\n(.*?)\n\nINSTRUCCIONES', prompt, re.DOTALL)
+            return match.group(1) if match else ''
+
+        # Sección de un documento largo
+        match = re.search(r'Empieza con \\section\{(.*)\}', prompt)
+        if match:
+            size = prompt.count('\n') // 4
+            return f"\\section{{{match.group(1)}}}\n\n{self._paragraphs(size)}"
+
+        template = self._template(prompt)
+        if SECTIONS_PLACEHOLDER in prompt:
+            body = f"\\title{{Documento}}\n\\author{{Autor}}\n\\date{{}}\n\\maketitle\n\n{SECTIONS_PLACEHOLDER}"
+        else:
+            content = prompt.split('CONTENIDO DEL DOCUMENTO:')[-1]
+            content = content.split('DOCUMENTO ORIGINAL:')[-1]
+            body = f"\\section{{Introducción}}\n\n{self._paragraphs(content.count(chr(10)) // 4)}"
+
+        begin = template.find('\\begin{document}')
+        end = template.rfind('\\end{document}')
+        return f"{template[:begin]}\\begin{{document}}\n\n{body}\n\n{template[end:]}"
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            FakeGenerativeModel.calls += 1
+
+        text = '```latex\n' + self._answer(prompt) + '\n```'
+        generation = len(text) / 4 / self.tokens_per_second
+        time.sleep(self.latency)
+
+        if not stream:
+            time.sleep(generation)
+            return FakeResponse(text)
+
+        def chunks(size=200):
+            pieces = range(0, len(text), size)
+            for start in pieces:
+                time.sleep(generation / len(pieces))
+                yield FakeResponse(text[start:start + size])
+        return chunks()
+
+
+# PDF mínimo válido para la compilación simulada
+MINIMAL_PDF = (b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+               b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+               b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+               b"trailer<</Root 1 0 R>>\n%%EOF\n")
+
+FAKE_COMPILE_SECONDS = float(os.environ.get('BENCHMARK_FAKE_COMPILE_SECONDS', '0.5'))
+
+
+def fake_latex_passes(temp_dir, job_id, compilador, env=None, fmt=None, max_passes=5):
+    """Compilación simulada (sin TeX): dos pasadas con un tiempo fijo"""
+    time.sleep(FAKE_COMPILE_SECONDS)
+    pdf_file = os.path.join(temp_dir, f"{job_id}.pdf")
+    with open(pdf_file, 'wb') as f:
+        f.write(MINIMAL_PDF)
+    return pdf_file, 2
+
+
+def _docx_bytes(index, kind):
+    """Documento Word de prueba: simple, con tabla o largo"""
+    import io
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading(f'Artículo de prueba {index}', 0)
+    doc.add_paragraph('Ana Pérez, Universidad de Prueba')
+    doc.add_paragraph(f'Resumen: Documento {index} generado para medir el rendimiento del worker.')
+    doc.add_paragraph('Palabras clave: benchmark, latex, worker')
+
+    sections = 12 if kind == 'largo' else 3
+    paragraphs = 12 if kind == 'largo' else 3
+    for number in range(1, sections + 1):
+        doc.add_heading(f'Sección {number}', 1)
+        for _ in range(paragraphs):
+            p = doc.add_paragraph('Este párrafo contiene texto con ')
+            p.add_run('negrita').bold = True
+            p.add_run(' y ')
+            p.add_run('cursiva').italic = True
+            p.add_run(' para ejercitar la conversión del formato en línea. ' * 4)
+        doc.add_paragraph('Primer elemento', style='List Bullet')
+        doc.add_paragraph('Segundo elemento', style='List Bullet')
+
+    if kind in ('tabla', 'largo'):
+        table = doc.add_table(rows=3, cols=3)
+        for row in range(3):
+            for col in range(3):
+                table.cell(row, col).text = f'{row}-{col}'
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _tex_bytes(index):
+    paragraphs = '\n\n'.join(
+        f"Párrafo {n} del documento {index} con \\textbf{{negrita}} y \\emph{{énfasis}}." for n in range(20)
+    )
+    return (f"\\documentclass{{article}}\n\\begin{{document}}\n\\title{{Documento {index}}}\n\\maketitle\n"
+            f"\\section{{Introducción}}\n{paragraphs}\n\\end{{document}}\n").encode('utf-8')
+
+
+def build_corpus(count, plantillas):
+    """Lista de (revista, nombre, extensión, datos) repartida entre plantillas y tipos"""
+    if importlib.util.find_spec('docx'):
+        kinds = ['simple', 'tabla', 'largo', 'tex']
+    else:
+        print("⚠ python-docx no está instalado: solo se generan documentos .tex")
+        kinds = ['tex']
+
+    corpus = []
+    for index in range(count):
+        revista = plantillas[index % len(plantillas)]
+        kind = kinds[(index // len(plantillas)) % len(kinds)]
+        if kind == 'tex':
+            corpus.append((revista, f'doc{index}.tex', 'tex', _tex_bytes(index)))
+        else:
+            corpus.append((revista, f'doc{index}_{kind}.docx', 'docx', _docx_bytes(index, kind)))
+    return corpus
+
+
+def create_database(path, plantillas_folder, plantillas, corpus, users=1):
+    connection = sqlite3.connect(path)
+    connection.executescript(SQLITE_SCHEMA)
+    for user in range(1, users + 1):
+        connection.execute(
+            "INSERT INTO users (nombre, apellidos, email) VALUES ('Bench', 'Mark', ?)",
+            (f'bench{user}@example.com',)
+        )
+    for name in plantillas:
+        cls_path = os.path.join(plantillas_folder, name, f'{name}.cls')
+        cls_text = open(cls_path, encoding='utf-8').read() if os.path.exists(cls_path) else ''
+        compilador = 'xelatex' if 'fontspec' in cls_text else 'pdflatex'
+        connection.execute(
+            "INSERT INTO revista_config (codigo, nombre, nombre_completo, compilador, plantilla_folder) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (name, name.upper(), f'Revista {name.upper()}', compilador, name)
+        )
+    for index, (revista, filename, extension, data) in enumerate(corpus):
+        # Como createJob() en PHP: el archivo va al almacén de blobs
+        sha256 = hashlib.sha256(data).hexdigest()
+        connection.execute(
+            "INSERT OR IGNORE INTO blobs (sha256, size, chunk_count) VALUES (?, ?, 1)",
+            (sha256, len(data))
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO blob_chunks (sha256, chunk_index, data) VALUES (?, 0, ?)",
+            (sha256, data)
+        )
+        connection.execute(
+            "INSERT INTO jobs (job_id, user_id, revista_codigo, filename_original, file_extension, "
+            "file_size, file_sha256) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f'bench-{index:05d}', index % users + 1, revista, filename, extension, len(data), sha256)
+        )
+    connection.commit()
+    connection.close()
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark sin conexión del worker')
+    parser.add_argument('--jobs', type=int, default=20, help='Trabajos a procesar')
+    parser.add_argument('--workers', type=int, default=3, help='Hilos de la etapa de conversión (MAX_WORKERS)')
+    parser.add_argument('--queue-size', type=int, default=2,
+                        help='Trabajos en espera entre etapas (STAGE_QUEUE_SIZE)')
+    parser.add_argument('--users', type=int, default=1, help='Usuarios entre los que se reparten los trabajos')
+    parser.add_argument('--compile-processes', type=int, default=0,
+                        help='Procesos de compilación (COMPILE_PROCESSES, 0 = en el hilo)')
+    parser.add_argument('--plantillas', default=DEFAULT_PLANTILLAS, help='Carpeta de plantillas')
+    parser.add_argument('--latency', type=float, default=1.0, help='Latencia simulada de Gemini (s)')
+    parser.add_argument('--tokens-per-second', type=float, default=400.0,
+                        help='Velocidad simulada de generación de Gemini')
+    parser.add_argument('--fake-compile', action='store_true',
+                        help='No ejecutar TeX (también si no está instalado)')
+    parser.add_argument('--warmup', action='store_true',
+                        help='Compilar cada plantilla una vez antes de medir (formatos y cachés)')
+    parser.add_argument('--cache', action='store_true', help='Activar la caché de conversiones')
+    parser.add_argument('--json', help='Guardar el resultado en este archivo JSON')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix='benchmark-worker-')
+    db_path = os.path.join(work_dir, 'benchmark.sqlite')
+
+    # Configuración del worker antes de importarlo (se lee al importar)
+    os.environ.update({
+        'PLANTILLAS_FOLDER': args.plantillas,
+        'TEMP_FOLDER': os.path.join(work_dir, 'temp'),
+        'CACHE_FOLDER': os.path.join(work_dir, 'cache'),
+        'CACHE_MAX_MB': '500' if args.cache else '0',
+        'FORMATS_FOLDER': os.path.join(work_dir, 'formats'),
+        'MAX_WORKERS': str(args.workers),
+        'COMPILE_PROCESSES': str(args.compile_processes),
+        'STAGE_QUEUE_SIZE': str(args.queue_size),
+        'GEMINI_RPM': '0',
+        'GEMINI_TPM': '0',
+        'METRICS_PORT': '0',
+        'MYSQL_USER': 'benchmark',
+        'MYSQL_PASS': 'benchmark',
+    })
+    sys.path.insert(0, BASE_DIR)
+    import worker
+
+    plantillas = sorted(
+        name for name in os.listdir(args.plantillas)
+        if os.path.exists(os.path.join(args.plantillas, name, 'main.tex'))
+    )
+    if not plantillas:
+        print(f"✗ No hay plantillas en {args.plantillas}")
+        sys.exit(1)
+
+    compilers_missing = not all(shutil.which(c) for c in ('pdflatex', 'xelatex'))
+    fake_compile = args.fake_compile or compilers_missing
+    if fake_compile and not args.fake_compile:
+        print("⚠ pdflatex/xelatex no encontrados: se usa compilación simulada")
+    if fake_compile:
+        worker.run_latex_passes = fake_latex_passes
+        worker.PRECOMPILE_FORMATS = []
+
+    # Sustitutos de MySQL y Gemini
+    SQLiteConnection.path = db_path
+    worker.MySQLConnection = SQLiteConnection
+    worker.genai.configure = lambda **kwargs: None
+    worker.genai.GenerativeModel = FakeGenerativeModel
+    FakeGenerativeModel.latency = args.latency
+    FakeGenerativeModel.tokens_per_second = args.tokens_per_second
+    FakeGenerativeModel.plantillas = {
+        name: open(os.path.join(args.plantillas, name, 'main.tex'), encoding='utf-8').read()
+        for name in plantillas
+    }
+
+    print(f"→ Generando {args.jobs} documentos para {len(plantillas)} plantilla(s)...")
+    corpus = build_corpus(args.jobs, plantillas)
+    create_database(db_path, args.plantillas, plantillas, corpus, args.users)
+
+    # Tiempos por trabajo (job['timings'] lo rellena DocumentProcessor.stage)
+    results = []
+    results_lock = threading.Lock()
+
+    class BenchmarkProcessor(worker.DocumentProcessor):
+        def finish_job(self, job, status):
+            timings = dict(job.get('timings', {}))
+            timings['total'] = time.monotonic() - job.get('start_time', time.monotonic())
+            super().finish_job(job, status)
+            with results_lock:
+                results.append((job.get('conversion', 'none'), timings))
+
+    worker.DocumentProcessor = BenchmarkProcessor
+
+    tracemalloc.start()
+    pool = worker.WorkerPool('benchmark', args.workers, args.compile_processes)
+    claimer = worker.MySQLJobSource(SQLiteConnection())
+    status_db = SQLiteConnection()
+
+    def pending():
+        cursor = status_db.get_cursor()
+        cursor.execute("SELECT COUNT(*) AS n FROM jobs WHERE status IN ('pending', 'processing')")
+        count = cursor.fetchone()['n']
+        cursor.close()
+        return count
+
+    if args.warmup:
+        print("→ Calentando plantillas...")
+        pool.warmup(wait=True)
+
+    print(f"→ Procesando con {args.workers} hilo(s) de conversión...")
+    start = time.monotonic()
+    try:
+        while pending():
+            free_slots = pool.free_slots()
+            if free_slots == 0:
+                pool.slot_freed.wait(1)
+                pool.slot_freed.clear()
+                continue
+            jobs = claimer.claim(limit=free_slots)
+            for job in jobs:
+                pool.submit(job)
+            if not jobs:
+                pool.slot_freed.wait(0.2)
+                pool.slot_freed.clear()
+    finally:
+        pool.shutdown()
+    elapsed = time.monotonic() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cursor = status_db.get_cursor()
+    cursor.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+    statuses = {row['status']: row['n'] for row in cursor.fetchall()}
+    cursor.close()
+    status_db.close()
+
+    stages = {}
+    for _, timings in results:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    conversions = {}
+    for conversion, _ in results:
+        conversions[conversion] = conversions.get(conversion, 0) + 1
+
+    summary = {
+        'jobs': args.jobs,
+        'workers': args.workers,
+        'compile_processes': args.compile_processes,
+        'fake_compile': fake_compile,
+        'elapsed_seconds': round(elapsed, 3),
+        'jobs_per_minute': round(len(results) / elapsed * 60, 2) if elapsed else 0,
+        'statuses': statuses,
+        'conversions': conversions,
+        'gemini_calls': FakeGenerativeModel.calls,
+        'peak_python_memory_mb': round(peak_memory / 1024 / 1024, 2),
+        'stages': {
+            stage: {
+                'p50': round(percentile(values, 0.50), 3),
+                'p95': round(percentile(values, 0.95), 3),
+                'max': round(max(values), 3),
+            }
+            for stage, values in stages.items()
+        },
+    }
+
+    print("\n" + "=" * 60)
+    print("RESULTADO DEL BENCHMARK")
+    print("=" * 60)
+    print(f"Trabajos: {len(results)} en {elapsed:.1f} s → {summary['jobs_per_minute']} trabajos/min")
+    print(f"Estados: {statuses}")
+    print(f"Conversiones: {conversions} | Consultas a Gemini: {FakeGenerativeModel.calls}")
+    print(f"Pico de memoria (Python): {summary['peak_python_memory_mb']} MB")
+    print(f"{'Etapa':<12}{'p50 (s)':>10}{'p95 (s)':>10}{'máx (s)':>10}")
+    for stage, values in summary['stages'].items():
+        print(f"{stage:<12}{values['p50']:>10.3f}{values['p95']:>10.3f}{values['max']:>10.3f}")
+    print("=" * 60)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"✓ Resultado guardado en {args.json}")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Almacén de archivos por contenido
+Los documentos subidos y los PDF generados se guardan una sola vez por
+SHA-256 en blobs/blob_chunks (bloques menores que max_allowed_packet); jobs
+solo guarda el hash, así sus filas son pequeñas y un mismo archivo subido o
+generado varias veces ocupa espacio una sola vez. PHP (createJob, download)
+usa el mismo protocolo.
+"""
+
+import hashlib
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 (hex) de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobNotFound(Exception):
+    """El blob no existe o está incompleto"""
+
+
+class MySQLBlobStore:
+    """
+    Blobs direccionados por SHA-256 en MySQL.
+    Las operaciones usan el cursor del llamador, así forman parte de su transacción.
+    """
+
+    def __init__(self, chunk_size=1024 * 1024):
+        self.chunk_size = chunk_size
+
+    def put_file(self, cursor, path):
+        """
+        Guarda el archivo si su contenido no estaba ya almacenado.
+        Devuelve (sha256, tamaño, bloques, nuevo).
+        """
+        sha256 = file_sha256(path, self.chunk_size)
+
+        # La fila de blobs hace de cerrojo: otro escritor del mismo contenido
+        # espera a que esta transacción termine y lo encuentra completo
+        cursor.execute(
+            "INSERT IGNORE INTO blobs (sha256, size, chunk_count) VALUES (%s, %s, NULL)",
+            (sha256, 0)
+        )
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT size, chunk_count FROM blobs WHERE sha256 = %s", (sha256,))
+            row = cursor.fetchone()
+            if row and row['chunk_count'] is not None:
+                return sha256, row['size'], row['chunk_count'], False
+            # Escritura anterior interrumpida: se reescribe
+            cursor.execute("DELETE FROM blob_chunks WHERE sha256 = %s", (sha256,))
+
+        size = 0
+        chunk_index = 0
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                cursor.execute(
+                    "INSERT INTO blob_chunks (sha256, chunk_index, data) VALUES (%s, %s, %s)",
+                    (sha256, chunk_index, chunk)
+                )
+                size += len(chunk)
+                chunk_index += 1
+
+        cursor.execute(
+            "UPDATE blobs SET size = %s, chunk_count = %s WHERE sha256 = %s",
+            (size, chunk_index, sha256)
+        )
+        return sha256, size, chunk_index, True
+
+    def iter_chunks(self, cursor, sha256):
+        """Bloques del blob en orden (uno en memoria a la vez)"""
+        cursor.execute("SELECT size, chunk_count FROM blobs WHERE sha256 = %s", (sha256,))
+        row = cursor.fetchone()
+        if not row or row['chunk_count'] is None:
+            raise BlobNotFound(f"Archivo no encontrado en el almacén: {sha256}")
+
+        for chunk_index in range(row['chunk_count']):
+            cursor.execute(
+                "SELECT data FROM blob_chunks WHERE sha256 = %s AND chunk_index = %s",
+                (sha256, chunk_index)
+            )
+            chunk = cursor.fetchone()
+            if not chunk:
+                raise BlobNotFound(f"Falta el bloque {chunk_index} de {sha256}")
+            yield chunk['data']
+
+    def read(self, cursor, sha256):
+        """Contenido completo del blob"""
+        return b''.join(self.iter_chunks(cursor, sha256))
@@ -0,0 +1,107 @@
+"""
+Caché persistente de conversiones a LaTeX
+La clave es el hash del documento, la plantilla, los metadatos y el modelo,
+así un reenvío idéntico no vuelve a consultar Gemini.
+"""
+
+import os
+import hashlib
+import threading
+
+
+class ConversionCache:
+    """Caché en disco del LaTeX generado, con expulsión LRU por tamaño"""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(self.folder, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(*parts):
+        """Calcula la clave SHA-256 de las partes (bytes o texto)"""
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, (bytes, bytearray)):
+                part = str(part).encode('utf-8')
+            # Prefijo de longitud para que ('ab', 'c') y ('a', 'bc') no colisionen
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.tex")
+
+    def _entries(self):
+        """Lista (ruta, tamaño, último uso) de las entradas en disco"""
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith('.tex'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        """Devuelve el LaTeX guardado o None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            # El mtime marca el último uso para la expulsión LRU
+            os.utime(path, None)
+            return content
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"  ⚠ Error leyendo caché: {e}")
+            return None
+
+    def put(self, key, latex_content):
+        """Guarda el LaTeX generado y expulsa entradas antiguas si hace falta"""
+        path = self._path(key)
+        data = latex_content.encode('utf-8')
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            with self._lock:
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self._total_bytes += len(data) - previous
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+        except OSError as e:
+            print(f"  ⚠ Error guardando en caché: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def discard(self, key):
+        """Elimina una entrada (p. ej. si su LaTeX no compila)"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Elimina las entradas menos usadas hasta quedar bajo el límite"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+        self._total_bytes = total
@@ -0,0 +1,524 @@
+"""
+Extracción de contenido de documentos Word
+Lee el .docx en memoria y produce una representación intermedia compacta
+(títulos, negritas/cursivas, listas, tablas, ecuaciones, notas e imágenes)
+que se envía a Gemini en lugar del texto plano.
+
+Formato intermedio (similar a Markdown):
+    # Título de sección / ## Subsección
+    **negrita**, *cursiva*
+    - elemento de lista / 1. elemento numerado (sangría de 2 espacios por nivel)
+    | celda | celda |            (tablas)
+    $x^{2}$ / $$\\frac{a}{b}$$    (ecuaciones de Word convertidas a LaTeX)
+    [^nota: texto]              (nota al pie en el lugar de la referencia)
+    ![imagen](figuras_doc/imagen1.png)
+    \\$ \\* \\# \\| \\\\ y, al inicio de un párrafo, \\- o 1\\.   (caracteres literales)
+"""
+
+import io
+import os
+import re
+import posixpath
+
+
+# Estilos de título de Word (inglés y español): "Heading 1", "Título 2", ...
+HEADING_STYLE = re.compile(r'^(Heading|T[ií]tulo|Encabezado)\s*(\d+)$', re.IGNORECASE)
+
+# Estilo del título del documento
+TITLE_STYLES = ('title', 'título', 'titulo')
+
+# Nivel en el nombre de los estilos de lista: "List Bullet 2", "Lista con números 3"
+LIST_STYLE_LEVEL = re.compile(r'^Lista?\b.*?(\d+)$', re.IGNORECASE)
+
+# Espacios al inicio y al final de un fragmento (quedan fuera de las marcas de formato)
+EDGE_SPACE = re.compile(r'^(\s*)(.*?)(\s*)$', re.DOTALL)
+
+# Caracteres con significado en el formato intermedio: en el texto se escapan
+MARKUP_SPECIAL = re.compile(r'([\\$*#|])')
+
+# Inicio de párrafo que se leería como elemento de lista ("- ", "1. ")
+LIST_MARKER_START = re.compile(r'^([ \t]*)(?:(-)|(\d+)\.)(?=\s|$)')
+
+# Carpeta (relativa al directorio del trabajo) para las imágenes extraídas
+IMAGES_FOLDER = 'figuras_doc'
+
+# Formatos de imagen que pdflatex/xelatex incluyen directamente
+SUPPORTED_IMAGES = ('.png', '.jpg', '.jpeg', '.pdf')
+
+# Espacios de nombres OOXML
+NS = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'm': 'http://schemas.openxmlformats.org/officeDocument/2006/math',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+}
+
+
+def _tag(prefix, name):
+    return f"{{{NS[prefix]}}}{name}"
+
+
+def _attr(element, prefix, name):
+    return element.get(_tag(prefix, name)) if element is not None else None
+
+
+# Símbolos Unicode frecuentes en ecuaciones de Word
+MATH_SYMBOLS = {
+    'α': '\\alpha ', 'β': '\\beta ', 'γ': '\\gamma ', 'δ': '\\delta ', 'ε': '\\epsilon ',
+    'θ': '\\theta ', 'λ': '\\lambda ', 'μ': '\\mu ', 'π': '\\pi ', 'ρ': '\\rho ',
+    'σ': '\\sigma ', 'τ': '\\tau ', 'φ': '\\phi ', 'ω': '\\omega ', 'Δ': '\\Delta ',
+    'Σ': '\\Sigma ', 'Ω': '\\Omega ', '≤': '\\leq ', '≥': '\\geq ', '≠': '\\neq ',
+    '±': '\\pm ', '×': '\\times ', '·': '\\cdot ', '∞': '\\infty ', '→': '\\to ',
+    '∈': '\\in ', '≈': '\\approx ', '∂': '\\partial ', '∇': '\\nabla ', '…': '\\ldots ',
+}
+
+# Operadores n-arios (sumatorias, integrales...)
+NARY_OPERATORS = {
+    '∑': '\\sum', '∏': '\\prod', '∫': '\\int', '∬': '\\iint', '∮': '\\oint',
+    '⋃': '\\bigcup', '⋂': '\\bigcap',
+}
+
+# Acentos matemáticos
+MATH_ACCENTS = {
+    '̂': '\\hat', '̃': '\\tilde', '̄': '\\bar', '⃗': '\\vec',
+    '̇': '\\dot', '̈': '\\ddot',
+}
+
+# Funciones con comando propio en LaTeX
+MATH_FUNCTIONS = ('sin', 'cos', 'tan', 'log', 'ln', 'exp', 'lim', 'max', 'min', 'sec', 'csc', 'cot')
+
+
+def omml_to_latex(element):
+    """Convierte una ecuación de Word (OMML) a LaTeX"""
+    if element is None:
+        return ''
+
+    name = element.tag.split('}')[-1] if '}' in element.tag else element.tag
+
+    def child(tag):
+        return element.find(_tag('m', tag))
+
+    def convert(tag):
+        return omml_to_latex(child(tag))
+
+    def prop(tag, default):
+        props = element.find(_tag('m', f"{name}Pr"))
+        node = props.find(_tag('m', tag)) if props is not None else None
+        value = _attr(node, 'm', 'val')
+        return default if value is None else value
+
+    if name == 'r':
+        text = ''.join(node.text or '' for node in element.iter(_tag('m', 't')))
+        return ''.join(MATH_SYMBOLS.get(char, char) for char in text)
+    if name == 'f':
+        return f"\\frac{{{convert('num')}}}{{{convert('den')}}}"
+    if name == 'sSup':
+        return f"{{{convert('e')}}}^{{{convert('sup')}}}"
+    if name == 'sSub':
+        return f"{{{convert('e')}}}_{{{convert('sub')}}}"
+    if name == 'sSubSup':
+        return f"{{{convert('e')}}}_{{{convert('sub')}}}^{{{convert('sup')}}}"
+    if name == 'rad':
+        degree = convert('deg')
+        return f"\\sqrt[{degree}]{{{convert('e')}}}" if degree else f"\\sqrt{{{convert('e')}}}"
+    if name == 'd':
+        opening = prop('begChr', '(')
+        closing = prop('endChr', ')')
+        separator = prop('sepChr', '|')
+        parts = [omml_to_latex(node) for node in element.findall(_tag('m', 'e'))]
+        opening = '\\{' if opening == '{' else (opening or '.')
+        closing = '\\}' if closing == '}' else (closing or '.')
+        return f"\\left{opening}{separator.join(parts)}\\right{closing}"
+    if name == 'nary':
+        operator = NARY_OPERATORS.get(prop('chr', '∫'), '\\int')
+        sub, sup = convert('sub'), convert('sup')
+        limits = (f"_{{{sub}}}" if sub else '') + (f"^{{{sup}}}" if sup else '')
+        return f"{operator}{limits}{{{convert('e')}}}"
+    if name == 'func':
+        function = convert('fName').strip()
+        command = f"\\{function}" if function in MATH_FUNCTIONS else f"\\operatorname{{{function}}}"
+        return f"{command}{{{convert('e')}}}"
+    if name == 'acc':
+        accent = MATH_ACCENTS.get(prop('chr', '̂'), '\\hat')
+        return f"{accent}{{{convert('e')}}}"
+    if name == 'bar':
+        return f"\\overline{{{convert('e')}}}"
+    if name == 'limLow':
+        return f"{{{convert('e')}}}_{{{convert('lim')}}}"
+    if name == 'limUpp':
+        return f"{{{convert('e')}}}^{{{convert('lim')}}}"
+    if name == 'm':
+        rows = [
+            ' & '.join(omml_to_latex(cell) for cell in row.findall(_tag('m', 'e')))
+            for row in element.findall(_tag('m', 'mr'))
+        ]
+        return '\\begin{matrix}' + ' \\\\ '.join(rows) + '\\end{matrix}'
+    if name == 'eqArr':
+        rows = [omml_to_latex(row) for row in element.findall(_tag('m', 'e'))]
+        return '\\begin{aligned}' + ' \\\\ '.join(rows) + '\\end{aligned}'
+    if name.endswith('Pr'):
+        return ''
+
+    # Contenedores (oMath, e, num, den, sub, sup, box, ...): concatenar hijos
+    return ''.join(omml_to_latex(node) for node in element)
+
+
+def escape_markup(text):
+    """Escapa con \\ los caracteres del texto que se leerían como formato"""
+    return MARKUP_SPECIAL.sub(r'\\\1', text)
+
+
+def escape_list_marker(text):
+    """Escapa un "- " o "1. " al inicio del párrafo (no es un elemento de lista)"""
+    return LIST_MARKER_START.sub(
+        lambda m: f"{m.group(1)}\\-" if m.group(2) else f"{m.group(1)}{m.group(3)}\\.", text
+    )
+
+
+def render_markup(segments, table=False):
+    """
+    Formato intermedio de una lista de fragmentos en línea.
+    En tablas, | dentro de una ecuación se escribe \\vert para no partir la celda.
+    Las marcas de negrita y cursiva se abren y cierran al cambiar el formato, con
+    los espacios fuera de ellas (**a** *b*, no ** a*** b*).
+    """
+    markup = []
+    # Marcas abiertas en orden de apertura ('**' negrita, '*' cursiva)
+    opened = []
+
+    def switch(marks, space):
+        """Cierra y abre marcas para pasar al formato marks; space va entre unas y otras"""
+        keep = 0
+        while keep < len(opened) and opened[keep] in marks:
+            keep += 1
+        if not space and keep < len(opened) and any(mark not in opened[:keep] for mark in marks):
+            # Cerrar y abrir sin nada en medio (**a***b*) sería ambiguo:
+            # se mantiene el formato anterior y se le añade el nuevo
+            marks = opened + [mark for mark in marks if mark not in opened]
+            keep = len(opened)
+        closing = ''.join(reversed(opened[keep:]))
+        del opened[keep:]
+        opening = [mark for mark in marks if mark not in opened]
+        opened.extend(opening)
+        markup.append(f"{closing}{space}{''.join(opening)}")
+
+    pending = ''
+    for kind, value, bold, italic in segments:
+        if kind == 'text':
+            lead, text, trail = EDGE_SPACE.match(value).groups()
+            if not text:
+                pending += value
+                continue
+            switch(['**'] * bold + ['*'] * italic, pending + lead)
+            markup.append(escape_markup(text))
+            pending = trail
+            continue
+
+        switch([], pending)
+        pending = ''
+        if kind == 'math':
+            if table:
+                value = value.replace('|', '\\vert{}')
+            markup.append(f"${value}$")
+        elif kind == 'footnote':
+            markup.append(f"[^nota: {escape_markup(value)}]")
+        elif kind == 'image':
+            markup.append(f"![imagen]({value})")
+        elif kind == 'unsupported_image':
+            markup.append(f"[imagen no soportada: {value}]")
+
+    switch([], pending)
+    return ''.join(markup)
+
+
+class Block:
+    """Bloque del documento en orden de lectura"""
+
+    def __init__(self, kind, markup, level=0, segments=None, rows=None, ordered=False):
+        # kind: title, heading, paragraph, list_item, table, equation
+        self.kind = kind
+        self.markup = markup
+        self.level = level
+        # Fragmentos en línea [tipo, valor, negrita, cursiva]
+        # tipo: text, math, footnote, image, unsupported_image
+        self.segments = segments or []
+        # Tablas: filas de celdas, cada celda una lista de fragmentos
+        self.rows = rows or []
+        # Listas: numerada o con viñetas
+        self.ordered = ordered
+
+
+class ExtractedDocument:
+    """Resultado de la extracción: bloques e imágenes"""
+
+    def __init__(self):
+        self.blocks = []
+        # Nombre de archivo (relativo al trabajo) -> contenido binario
+        self.images = {}
+        # Elementos especiales encontrados (table, math, footnote, image)
+        self.features = set()
+
+    def to_markup(self, blocks=None):
+        """Texto intermedio compacto para el prompt"""
+        return '\n'.join(block.markup for block in (blocks or self.blocks) if block.markup.strip())
+
+    def write_images(self, job_dir):
+        """Guarda las imágenes extraídas en el directorio del trabajo"""
+        for filename, data in self.images.items():
+            path = os.path.join(job_dir, *filename.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+
+class _Extractor:
+    """Recorre el cuerpo del documento y produce los bloques"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.result = ExtractedDocument()
+        self.image_names = {}
+        self.footnotes = self._load_footnotes()
+        self.numbering = self._load_numbering()
+
+    def _load_footnotes(self):
+        """Texto de cada nota al pie por id (python-docx no las expone)"""
+        from docx.opc.constants import RELATIONSHIP_TYPE as RT
+        from docx.oxml import parse_xml
+
+        try:
+            part = self.doc.part.part_related_by(RT.FOOTNOTES)
+        except KeyError:
+            return {}
+
+        footnotes = {}
+        root = parse_xml(part.blob)
+        for note in root.findall(_tag('w', 'footnote')):
+            if _attr(note, 'w', 'type'):
+                continue  # Separadores
+            text = ''.join(node.text or '' for node in note.iter(_tag('w', 't')))
+            footnotes[_attr(note, 'w', 'id')] = text.strip()
+        return footnotes
+
+    def _load_numbering(self):
+        """Formato (bullet, decimal...) por (numId, nivel) de las listas"""
+        try:
+            root = self.doc.part.numbering_part.element
+        except (KeyError, NotImplementedError):
+            return {}
+
+        abstract_formats = {}
+        for abstract in root.findall(_tag('w', 'abstractNum')):
+            abstract_id = _attr(abstract, 'w', 'abstractNumId')
+            for level in abstract.findall(_tag('w', 'lvl')):
+                fmt = level.find(_tag('w', 'numFmt'))
+                abstract_formats[(abstract_id, _attr(level, 'w', 'ilvl'))] = _attr(fmt, 'w', 'val')
+
+        formats = {}
+        for num in root.findall(_tag('w', 'num')):
+            abstract_id = _attr(num.find(_tag('w', 'abstractNumId')), 'w', 'val')
+            for (abstract, level), fmt in abstract_formats.items():
+                if abstract == abstract_id:
+                    formats[(_attr(num, 'w', 'numId'), level)] = fmt
+        return formats
+
+    def _image(self, blip):
+        """Extrae una imagen una sola vez y devuelve (tipo, archivo)"""
+        rel_id = _attr(blip, 'r', 'embed')
+        if rel_id not in self.image_names:
+            part = self.doc.part.related_parts.get(rel_id)
+            if part is None:
+                return None
+            ext = posixpath.splitext(str(part.partname))[1].lower()
+            filename = f"{IMAGES_FOLDER}/imagen{len(self.image_names) + 1}{ext}"
+            if ext in SUPPORTED_IMAGES:
+                self.result.images[filename] = part.blob
+            self.image_names[rel_id] = filename
+
+        filename = self.image_names[rel_id]
+        self.result.features.add('image')
+        if posixpath.splitext(filename)[1] not in SUPPORTED_IMAGES:
+            return 'unsupported_image', filename
+        return 'image', filename
+
+    def _run(self, run):
+        """Fragmentos (tipo, valor) de un run y su formato (negrita, cursiva)"""
+        props = run.find(_tag('w', 'rPr'))
+
+        def flag(name):
+            node = props.find(_tag('w', name)) if props is not None else None
+            return node is not None and _attr(node, 'w', 'val') not in ('0', 'false')
+
+        parts = []
+        for node in run:
+            tag = node.tag.split('}')[-1]
+            if tag == 't':
+                parts.append(('text', node.text or ''))
+            elif tag == 'tab':
+                parts.append(('text', ' '))
+            elif tag in ('br', 'cr'):
+                parts.append(('text', '\n'))
+            elif tag == 'footnoteReference':
+                note = self.footnotes.get(_attr(node, 'w', 'id'), '')
+                self.result.features.add('footnote')
+                parts.append(('footnote', note))
+            elif tag in ('drawing', 'pict'):
+                for blip in node.iter(_tag('a', 'blip')):
+                    image = self._image(blip)
+                    if image:
+                        parts.append(image)
+        return parts, flag('b'), flag('i')
+
+    def _segments(self, element):
+        """Fragmentos en línea de un párrafo (o celda), fusionando texto con igual formato"""
+        segments = []
+
+        def add(kind, value, bold=False, italic=False):
+            if (kind == 'text' and segments and segments[-1][0] == 'text'
+                    and segments[-1][2:] == [bold, italic]):
+                segments[-1][1] += value
+            else:
+                segments.append([kind, value, bold, italic])
+
+        def add_run(run):
+            parts, bold, italic = self._run(run)
+            for kind, value in parts:
+                if value:
+                    add(kind, value, bold, italic)
+
+        for node in element:
+            tag = node.tag.split('}')[-1]
+            if tag == 'r':
+                add_run(node)
+            elif tag == 'hyperlink':
+                for run in node.findall(_tag('w', 'r')):
+                    add_run(run)
+            elif tag == 'oMath':
+                self.result.features.add('math')
+                add('math', omml_to_latex(node))
+        return segments
+
+    def _paragraph(self, p):
+        from docx.text.paragraph import Paragraph
+
+        paragraph = Paragraph(p, self.doc)
+        style = paragraph.style.name if paragraph.style is not None else ''
+
+        # Ecuación en bloque
+        math_para = p.find(_tag('m', 'oMathPara'))
+        if math_para is not None:
+            self.result.features.add('math')
+            latex = ' \\\\ '.join(omml_to_latex(node) for node in math_para.findall(_tag('m', 'oMath')))
+            return Block('equation', f"$${latex}$$", segments=[['math', latex, False, False]])
+
+        segments = self._segments(p)
+        text = render_markup(segments)
+        if style.strip().lower() in TITLE_STYLES:
+            return Block('title', f"Título: {text}", segments=segments)
+
+        level = heading_level(style)
+        if level is not None:
+            return Block('heading', f"{'#' * level} {text}", level, segments=segments)
+
+        num_pr = p.find(f"{_tag('w', 'pPr')}/{_tag('w', 'numPr')}")
+        is_list_style = style.lower().startswith(('list', 'lista'))
+        if num_pr is not None or is_list_style:
+            ilvl = _attr(num_pr.find(_tag('w', 'ilvl')), 'w', 'val') if num_pr is not None else None
+            num_id = _attr(num_pr.find(_tag('w', 'numId')), 'w', 'val') if num_pr is not None else None
+            if ilvl is None:
+                # Numeración del estilo: el nivel está en el nombre ("List Bullet 2")
+                ilvl = str(list_style_level(style))
+            fmt = self.numbering.get((num_id, ilvl))
+            ordered = fmt not in (None, 'bullet', 'none') or 'number' in style.lower()
+            depth = int(ilvl)
+            marker = '1.' if ordered else '-'
+            return Block('list_item', f"{'  ' * depth}{marker} {text}", depth,
+                         segments=segments, ordered=ordered)
+
+        return Block('paragraph', escape_list_marker(text), segments=segments)
+
+    def _table(self, tbl):
+        self.result.features.add('table')
+        rows = []
+        markup = []
+        for tr in tbl.findall(_tag('w', 'tr')):
+            cells = []
+            for tc in tr.findall(_tag('w', 'tc')):
+                cell = []
+                for p in tc.findall(_tag('w', 'p')):
+                    if cell:
+                        cell.append(['text', ' ', False, False])
+                    cell.extend(self._segments(p))
+                cells.append(cell)
+            rows.append(cells)
+            markup.append('| ' + ' | '.join(render_markup(cell, table=True) for cell in cells) + ' |')
+        return Block('table', '\n'.join(markup), rows=rows)
+
+    def extract(self):
+        body = self.doc.element.body
+        for element in body.iterchildren():
+            tag = element.tag.split('}')[-1]
+            if tag == 'p':
+                self.result.blocks.append(self._paragraph(element))
+            elif tag == 'tbl':
+                self.result.blocks.append(self._table(element))
+        return self.result
+
+
+def extract_document(word_data):
+    """Extrae el contenido de un .docx en memoria (sin archivos temporales)"""
+    from docx import Document
+
+    doc = Document(io.BytesIO(word_data))
+    return _Extractor(doc).extract()
+
+
+class DocumentSection:
+    """Sección del documento: título y bloques hasta el siguiente título"""
+
+    def __init__(self, title, level, heading):
+        self.title = title
+        self.level = level
+        self.blocks = [heading]
+
+    @property
+    def text(self):
+        return '\n'.join(block.markup for block in self.blocks if block.markup.strip())
+
+
+def heading_level(style_name):
+    """Nivel de título de un estilo de párrafo, o None si no es título"""
+    match = HEADING_STYLE.match((style_name or '').strip())
+    return int(match.group(2)) if match else None
+
+
+def list_style_level(style_name):
+    """Nivel (desde 0) de un estilo de lista por su nombre: "List Bullet 2" es 1"""
+    match = LIST_STYLE_LEVEL.match((style_name or '').strip())
+    return max(0, int(match.group(1)) - 1) if match else 0
+
+
+def split_sections(blocks):
+    """
+    Divide los bloques en el texto inicial (título, autores, resumen...) y
+    las secciones de primer nivel del documento.
+    """
+    levels = [block.level for block in blocks if block.kind == 'heading' and block.markup.strip('# ')]
+    if not levels:
+        return '\n'.join(block.markup for block in blocks), []
+
+    # Se corta en el nivel de título más alto presente en el documento
+    top_level = min(levels)
+    front_matter = []
+    sections = []
+
+    for block in blocks:
+        title = block.markup.lstrip('#').strip()
+        if block.kind == 'heading' and block.level == top_level and title:
+            sections.append(DocumentSection(title, block.level, block))
+        elif sections:
+            sections[-1].blocks.append(block)
+        else:
+            front_matter.append(block.markup)
+
+    return '\n'.join(front_matter), sections
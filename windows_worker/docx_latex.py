@@ -0,0 +1,320 @@
+"""
+Conversión local (sin Gemini) de documentos Word sencillos
+Los bloques extraídos por docx_extract se vuelcan directamente en el main.tex
+de la plantilla. La confianza indica si el resultado es fiable o si conviene
+que el documento pase por Gemini (tablas, ecuaciones, estructura ambigua...).
+"""
+
+import re
+
+
+# Caracteres especiales de LaTeX en texto normal
+LATEX_ESCAPES = {
+    '\\': '\\textbackslash{}', '&': '\\&', '%': '\\%', '$': '\\$', '#': '\\#',
+    '_': '\\_', '{': '\\{', '}': '\\}', '~': '\\textasciitilde{}', '^': '\\textasciicircum{}',
+}
+
+# Caracteres tipográficos de Word con equivalente directo
+TYPOGRAPHIC = {
+    '\u201c': '``', '\u201d': "''", '\u2018': '`', '\u2019': "'", '\u2013': '--',
+    '\u2014': '---', '\u2026': '\\ldots{}', '\u00a0': '~', '\u00ad': '',
+}
+
+ESCAPE_PATTERN = re.compile('[' + re.escape(''.join(LATEX_ESCAPES) + ''.join(TYPOGRAPHIC)) + ']')
+
+# Metadatos de la revista en las plantillas (macro -> campo del trabajo)
+METADATA_MACROS = {
+    'revistaVolumen': 'volumen',
+    'revistaAño': 'año',
+    'revistaNumero': 'numero',
+    'paginaInicial': 'pagina_inicial',
+}
+
+# Niveles de título de Word -> comandos de sección
+SECTION_COMMANDS = ('section', 'subsection', 'subsubsection', 'paragraph')
+
+ABSTRACT_PATTERN = re.compile(r'^\s*(resumen|abstract)\s*(?:[:.\-—]\s*|$)', re.IGNORECASE)
+KEYWORDS_PATTERN = re.compile(r'^\s*(palabras\s+clave|keywords|key\s+words)\s*[:.\-—]\s*', re.IGNORECASE)
+REFERENCES_PATTERN = re.compile(r'^\s*(referencias|bibliograf[ií]a|references)\s*$', re.IGNORECASE)
+
+# Penalizaciones de confianza por elementos que la conversión local resuelve peor
+FEATURE_PENALTIES = {
+    'table': 0.2,
+    'math': 0.2,
+    'footnote': 0.05,
+    'image': 0.1,
+}
+
+# Longitud máxima (caracteres) de una línea de autores antes del resumen
+MAX_AUTHOR_LINE = 120
+
+
+def escape_latex(text):
+    """Escapa texto plano para LaTeX"""
+    def replace(match):
+        char = match.group(0)
+        return LATEX_ESCAPES.get(char) or TYPOGRAPHIC[char]
+
+    text = ESCAPE_PATTERN.sub(replace, text)
+    return text.replace('\n', '\\\\\n')
+
+
+def render_inline(segments):
+    """LaTeX de una lista de fragmentos en línea"""
+    parts = []
+    for kind, value, bold, italic in segments:
+        if kind == 'math':
+            parts.append(f"${value}$")
+        elif kind == 'footnote':
+            parts.append(f"\\footnote{{{escape_latex(value)}}}")
+        elif kind == 'image':
+            parts.append(f"\\includegraphics[width=0.8\\linewidth]{{{value}}}")
+        elif kind == 'unsupported_image':
+            continue
+        elif not value.strip():
+            parts.append(escape_latex(value))
+        else:
+            text = escape_latex(value)
+            if italic:
+                text = f"\\textit{{{text}}}"
+            if bold:
+                text = f"\\textbf{{{text}}}"
+            parts.append(text)
+    return ''.join(parts).strip()
+
+
+def _plain(block):
+    return ''.join(value for kind, value, _, _ in block.segments if kind == 'text').strip()
+
+
+def _strip_prefix(segments, pattern):
+    """Quita del primer fragmento de texto un prefijo como 'Resumen:'"""
+    segments = [list(segment) for segment in segments]
+    for segment in segments:
+        if segment[0] == 'text' and segment[1].strip():
+            segment[1] = pattern.sub('', segment[1], count=1)
+            break
+    return [segment for segment in segments if segment[0] != 'text' or segment[1]]
+
+
+class _Converter:
+    """Recorre los bloques y acumula el cuerpo LaTeX y la confianza"""
+
+    def __init__(self, blocks):
+        self.blocks = [
+            block for block in blocks
+            if block.kind in ('table', 'equation') or _plain(block) or
+            any(kind != 'text' for kind, _, _, _ in block.segments)
+        ]
+        self.lines = []
+        self.penalty = 0.0
+        self.list_stack = []
+        levels = [block.level for block in self.blocks if block.kind == 'heading']
+        self.top_level = min(levels) if levels else 1
+
+    def penalize(self, amount, reason):
+        self.penalty += amount
+        print(f"    Confianza -{amount:.2f}: {reason}")
+
+    def close_lists(self, depth=0):
+        while len(self.list_stack) > depth:
+            self.lines.append(f"\\end{{{self.list_stack.pop()}}}")
+
+    def front_matter(self):
+        """Título, autores, resumen y palabras clave antes de la primera sección"""
+        index = 0
+        title = None
+        authors = []
+        abstract = []
+        keywords = None
+
+        blocks = self.blocks
+        if blocks and blocks[0].kind == 'title':
+            title = render_inline(blocks[0].segments)
+            index = 1
+        elif blocks and blocks[0].kind == 'paragraph' and _plain(blocks[0]) and all(
+                segment[2] for segment in blocks[0].segments if segment[0] == 'text' and segment[1].strip()):
+            # Primer párrafo completamente en negrita: se toma como título
+            title = escape_latex(_plain(blocks[0]))
+            index = 1
+        else:
+            self.penalize(0.3, "no se encontró el título")
+
+        # Autores: líneas cortas hasta el resumen o la primera sección
+        while index < len(blocks) and blocks[index].kind == 'paragraph':
+            block = blocks[index]
+            text = _plain(block)
+            if ABSTRACT_PATTERN.match(text) or KEYWORDS_PATTERN.match(text):
+                break
+            if len(text) > MAX_AUTHOR_LINE:
+                self.penalize(0.2, "texto largo antes del resumen")
+                break
+            authors.append(render_inline(block.segments))
+            index += 1
+
+        # Resumen: párrafo con prefijo "Resumen:" o título "Resumen"
+        if index < len(blocks):
+            block = blocks[index]
+            text = _plain(block)
+            if block.kind == 'heading' and ABSTRACT_PATTERN.fullmatch(text):
+                index += 1
+                while index < len(blocks) and blocks[index].kind == 'paragraph' \
+                        and not KEYWORDS_PATTERN.match(_plain(blocks[index])):
+                    abstract.append(render_inline(blocks[index].segments))
+                    index += 1
+            elif block.kind == 'paragraph' and ABSTRACT_PATTERN.match(text):
+                abstract.append(render_inline(_strip_prefix(block.segments, ABSTRACT_PATTERN)))
+                index += 1
+
+        if index < len(blocks) and blocks[index].kind == 'paragraph':
+            block = blocks[index]
+            if KEYWORDS_PATTERN.match(_plain(block)):
+                keywords = render_inline(_strip_prefix(block.segments, KEYWORDS_PATTERN))
+                index += 1
+
+        if title:
+            self.lines.append(f"\\title{{{title}}}")
+            self.lines.append("\\author{" + ' \\and '.join(authors) + "}")
+            self.lines.append("\\date{}")
+            self.lines.append("\\maketitle")
+            self.lines.append("")
+        elif authors:
+            # Sin título los párrafos iniciales son texto normal
+            self.lines.extend(f"{author}\n" for author in authors)
+
+        if abstract:
+            self.lines.append("\\begin{abstract}")
+            self.lines.append('\n\n'.join(abstract))
+            self.lines.append("\\end{abstract}")
+            self.lines.append("")
+        if keywords:
+            self.lines.append(f"\\noindent\\textbf{{Palabras clave:}} {keywords}")
+            self.lines.append("")
+
+        return index
+
+    def heading(self, block):
+        text = render_inline(block.segments)
+        if REFERENCES_PATTERN.match(_plain(block)):
+            # La bibliografía escrita a mano se deja como lista sin formato
+            self.penalize(0.05, "bibliografía sin BibTeX")
+            self.lines.append(f"\\section*{{{text}}}")
+            return
+
+        depth = block.level - self.top_level
+        if depth >= len(SECTION_COMMANDS):
+            self.penalize(0.1, "títulos con demasiados niveles")
+            depth = len(SECTION_COMMANDS) - 1
+        self.lines.append(f"\\{SECTION_COMMANDS[depth]}{{{text}}}")
+
+    def list_item(self, block):
+        depth = block.level + 1
+        env = 'enumerate' if block.ordered else 'itemize'
+        if depth > len(self.list_stack) + 1:
+            self.penalize(0.05, "lista con niveles saltados")
+            depth = len(self.list_stack) + 1
+        self.close_lists(depth)
+        if len(self.list_stack) == depth and self.list_stack[-1] != env:
+            self.close_lists(depth - 1)
+        while len(self.list_stack) < depth:
+            self.list_stack.append(env)
+            self.lines.append(f"\\begin{{{env}}}")
+        self.lines.append(f"\\item {render_inline(block.segments)}")
+
+    def table(self, block):
+        if not block.rows:
+            return
+        columns = max(len(row) for row in block.rows)
+        self.lines.append("\\begin{table}[h]")
+        self.lines.append("\\centering")
+        self.lines.append(f"\\begin{{tabular}}{{|{'l|' * columns}}}")
+        self.lines.append("\\hline")
+        for row in block.rows:
+            cells = [render_inline(cell) for cell in row] + [''] * (columns - len(row))
+            self.lines.append(' & '.join(cells) + ' \\\\ \\hline')
+        self.lines.append("\\end{tabular}")
+        self.lines.append("\\end{table}")
+
+    def paragraph(self, block):
+        kinds = {kind for kind, value, _, _ in block.segments if kind != 'text' or value.strip()}
+        if kinds == {'image'}:
+            # Imagen sola en su párrafo: figura centrada
+            images = [value for kind, value, _, _ in block.segments if kind == 'image']
+            self.lines.append("\\begin{figure}[h]")
+            self.lines.append("\\centering")
+            for image in images:
+                self.lines.append(f"\\includegraphics[width=0.8\\linewidth]{{{image}}}")
+            self.lines.append("\\end{figure}")
+        else:
+            self.lines.append(render_inline(block.segments))
+        self.lines.append("")
+
+    def convert(self):
+        index = self.front_matter()
+
+        for block in self.blocks[index:]:
+            if block.kind != 'list_item' and self.list_stack:
+                self.close_lists()
+                self.lines.append("")
+
+            if block.kind == 'heading':
+                self.heading(block)
+            elif block.kind == 'list_item':
+                self.list_item(block)
+            elif block.kind == 'table':
+                self.table(block)
+            elif block.kind == 'equation':
+                self.lines.append(f"\\[\n{block.segments[0][1]}\n\\]")
+            elif block.kind == 'title':
+                self.penalize(0.2, "más de un título de documento")
+                self.lines.append(f"\\section*{{{render_inline(block.segments)}}}")
+            else:
+                self.paragraph(block)
+
+        self.close_lists()
+        return '\n'.join(self.lines).strip()
+
+
+def fill_template(plantilla_content, body, job):
+    """Inserta metadatos y cuerpo en el main.tex de la plantilla (None si no encaja)"""
+    begin = plantilla_content.find('\\begin{document}')
+    end = plantilla_content.rfind('\\end{document}')
+    if begin < 0 or end < begin:
+        return None
+
+    preamble = plantilla_content[:begin]
+    for macro, field in METADATA_MACROS.items():
+        value = str(job.get(field) or '')
+        preamble = re.sub(
+            rf'\\{macro}\{{[^}}]*\}}',
+            lambda match: f"\\{macro}{{{escape_latex(value)}}}",
+            preamble
+        )
+
+    return f"{preamble}\\begin{{document}}\n\n{body}\n\n\\end{{document}}\n"
+
+
+def convert_document(extracted, plantilla_content, job):
+    """
+    Convierte el documento extraído sin usar Gemini.
+    Devuelve (LaTeX, confianza entre 0 y 1); LaTeX es None si no se puede.
+    """
+    if not plantilla_content:
+        return None, 0.0
+
+    converter = _Converter(extracted.blocks)
+    if not converter.blocks:
+        return None, 0.0
+
+    for feature, penalty in FEATURE_PENALTIES.items():
+        if feature in extracted.features:
+            converter.penalize(penalty, f"el documento contiene {feature}")
+    if any(kind == 'unsupported_image' for block in converter.blocks for kind, _, _, _ in block.segments):
+        converter.penalize(0.5, "imágenes en formato no soportado")
+
+    body = converter.convert()
+    latex_content = fill_template(plantilla_content, body, job)
+    if latex_content is None:
+        return None, 0.0
+
+    return latex_content, max(0.0, 1.0 - converter.penalty)
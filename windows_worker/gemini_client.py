@@ -0,0 +1,198 @@
+"""
+Cliente de Gemini compartido por todos los hilos del worker
+Limita las peticiones y los tokens por minuto (token bucket), reintenta los
+errores transitorios con backoff exponencial con jitter, respeta un plazo
+máximo por llamada y une las consultas idénticas que están en curso.
+"""
+
+import time
+import random
+import hashlib
+import inspect
+import threading
+from concurrent.futures import Future
+
+try:
+    from google.api_core import exceptions as api_exceptions
+    RETRYABLE_ERRORS = (
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded,
+        api_exceptions.Aborted,
+    )
+except ImportError:
+    RETRYABLE_ERRORS = ()
+
+# Errores de red que también se reintentan
+RETRYABLE_ERRORS = RETRYABLE_ERRORS + (ConnectionError, TimeoutError)
+
+# Caracteres por token aproximados (para reservar cupo antes de la respuesta)
+CHARS_PER_TOKEN = 4
+
+
+class GeminiTimeout(Exception):
+    """Se agotó el plazo de la consulta (esperando cupo o reintentando)"""
+
+
+class TokenBucket:
+    """Cupo por minuto que se repone de forma continua"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount, deadline=None):
+        """Espera hasta poder consumir amount (lanza GeminiTimeout si vence el plazo)"""
+        # Una petición mayor que la capacidad se limita a la capacidad completa
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise GeminiTimeout("Plazo agotado esperando cupo de Gemini")
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, amount):
+        """Corrige el consumo con el valor real (puede dejar saldo negativo)"""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - amount)
+
+
+class GeminiClient:
+    """Envoltorio de GenerativeModel con límites de cuota, reintentos y deduplicación"""
+
+    def __init__(self, model, rpm=60, tpm=1000000, max_retries=5, base_delay=1.0,
+                 max_delay=60.0, timeout=300, metrics=None):
+        self.model = model
+        # Registro de métricas (None = sin métricas)
+        self.metrics = metrics
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Segundos máximos por consulta, incluyendo esperas y reintentos
+        self.timeout = timeout
+
+        # Consultas en curso (hash del prompt -> Future con el texto)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        # Las versiones recientes del SDK aceptan un timeout por petición
+        parameters = inspect.signature(model.generate_content).parameters
+        self._request_options = 'request_options' in parameters
+
+    @staticmethod
+    def estimate_tokens(text):
+        return max(1, len(text) // CHARS_PER_TOKEN)
+
+    def generate(self, prompt, timeout=None, sink=None):
+        """
+        Texto de la respuesta de Gemini para el prompt.
+        Con sink, la respuesta se pide en streaming y cada fragmento se pasa a
+        sink.feed() según llega (sink.reset() antes de cada reintento).
+        """
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            # Misma consulta ya en curso en otro hilo: esperar su resultado
+            print("  → Consulta idéntica en curso, esperando su respuesta...")
+            text = future.result(timeout=max(0, deadline - time.monotonic()))
+            if sink:
+                sink.feed(text)
+            return text
+
+        try:
+            text = self._call(prompt, deadline, sink)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _call(self, prompt, deadline, sink=None):
+        """Consulta con límites de cuota y reintentos"""
+        reserved = 2 * self.estimate_tokens(prompt)  # Entrada + salida aproximada
+
+        for attempt in range(self.max_retries + 1):
+            if self.requests:
+                self.requests.acquire(1, deadline)
+            if self.tokens:
+                self.tokens.acquire(reserved, deadline)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise GeminiTimeout("Plazo agotado consultando Gemini")
+
+            options = {'request_options': {'timeout': remaining}} if self._request_options else {}
+            started = time.monotonic()
+            try:
+                if sink:
+                    sink.reset()
+                    response = self.model.generate_content(prompt, stream=True, **options)
+                    parts = []
+                    for chunk in response:
+                        parts.append(chunk.text)
+                        sink.feed(chunk.text)
+                    text = ''.join(parts)
+                else:
+                    response = self.model.generate_content(prompt, **options)
+                    text = response.text
+            except RETRYABLE_ERRORS as e:
+                if self.metrics:
+                    self.metrics.observe('gemini_request_seconds', time.monotonic() - started, outcome='error')
+                    self.metrics.inc('gemini_retries_total', error=type(e).__name__)
+                if self.tokens:
+                    self.tokens.adjust(-reserved)  # La petición fallida no consumió tokens
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter: espera aleatoria entre 0 y el backoff exponencial
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if time.monotonic() + delay > deadline:
+                    raise GeminiTimeout(f"Plazo agotado reintentando Gemini: {e}") from e
+                print(f"  ⚠ Error transitorio de Gemini ({type(e).__name__}), reintentando en {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+
+            used = self._used_tokens(response, prompt, text)
+            if self.tokens:
+                self.tokens.adjust(used - reserved)
+            if self.metrics:
+                self.metrics.observe('gemini_request_seconds', time.monotonic() - started, outcome='ok')
+                self.metrics.inc('gemini_tokens_total', used)
+            return text
+
+    def _used_tokens(self, response, prompt, text):
+        """Tokens consumidos según la respuesta (o estimados si no los informa)"""
+        usage = getattr(response, 'usage_metadata', None)
+        total = getattr(usage, 'total_token_count', None)
+        if total:
+            return total
+        return self.estimate_tokens(prompt) + self.estimate_tokens(text)
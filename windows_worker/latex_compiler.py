@@ -0,0 +1,276 @@
+"""
+Compilación de LaTeX con detección de pasadas necesarias
+Después de cada pasada se revisan el .log y los archivos auxiliares; se vuelve
+a compilar (y se ejecuta bibtex/biber) solo si algo cambió.
+"""
+
+import os
+import re
+import hashlib
+import subprocess
+
+
+# Avisos que piden otra pasada de LaTeX
+RERUN_PATTERN = re.compile(
+    r'(Rerun to get|Label\(s\) may have changed|Please rerun LaTeX|Rerun LaTeX'
+    r'|has changed\. Rerun)'
+)
+
+# biblatex pide ejecutar biber
+BIBER_PATTERN = re.compile(r'Please \(re\)run Biber')
+
+# Líneas del .aux cuyo cambio afecta a la siguiente pasada
+AUX_FEEDBACK_PREFIXES = ('\\newlabel', '\\bibcite', '\\citation', '\\bibdata', '\\bibstyle', '\\abx@aux', '\\@input')
+
+# Archivos auxiliares que LaTeX lee en la siguiente pasada
+FEEDBACK_EXTENSIONS = ('toc', 'lof', 'lot', 'out', 'nav', 'bbl')
+
+
+# Línea del documento donde TeX detectó el error ("l.42 \\foo")
+ERROR_LINE_PATTERN = re.compile(r'^l\.(\d+)')
+
+# Líneas del .log que acompañan al mensaje de error
+ERROR_CONTEXT_LINES = 6
+
+# TeX parte en el .log las líneas más largas que max_print_line
+LOG_LINE_WIDTH = 79
+
+# Archivo que TeX abre tras "(": ruta con extensión ("./doc.tex", "/texmf/article.cls")
+LOG_FILE_NAME = re.compile(r'"?((?:[A-Za-z]:)?[^\s()"{}\[\]]*\.[A-Za-z][\w-]*)"?')
+
+# Avisos de cajas: debajo copian el texto del documento, con paréntesis sin cerrar
+BOX_WARNING = re.compile(r'^(Overfull|Underfull) \\[hv]box')
+
+# Contenido mínimo para que la compilación de calentamiento genere una página
+WARMUP_BODY = "\\mbox{}\n"
+
+
+class LatexCompileError(Exception):
+    """El compilador terminó con error (el LaTeX generado no es válido)"""
+
+    def __init__(self, message, error=None, line=None, context='', file=None):
+        super().__init__(message)
+        # Primer mensaje "! ..." del .log, línea, extracto del .log y archivo
+        # en el que está la línea (nombre, p. ej. "<job_id>.tex" o "revista.cls")
+        self.error = error
+        self.line = line
+        self.context = context
+        self.file = file
+
+    def __reduce__(self):
+        # Conserva los atributos al volver del pool de procesos
+        return (self.__class__, (str(self), self.error, self.line, self.context, self.file))
+
+
+def warmup_document(latex_content):
+    """Esqueleto de la plantilla con una página vacía (para calentar cachés)"""
+    begin = latex_content.find('\\begin{document}')
+    if begin == -1:
+        return latex_content
+    begin += len('\\begin{document}')
+    return f"{latex_content[:begin]}\n{WARMUP_BODY}{latex_content[begin:]}"
+
+
+def compile_error(error, line=None, context='', file=None, main_file=None):
+    """
+    LatexCompileError con el mensaje del .log y su línea; si el error no está
+    en main_file (el documento del trabajo), el mensaje indica el archivo
+    """
+    if line and file and file != main_file:
+        where = f" en {file}, línea {line}"
+    elif line:
+        where = f" en la línea {line}"
+    else:
+        where = ''
+    return LatexCompileError(
+        f"Error al compilar LaTeX{where}: {error}", error=error, line=line, context=context, file=file
+    )
+
+
+def _unwrap_log_lines(log_text):
+    """Líneas del .log con las que TeX partió por ancho vueltas a unir"""
+    lines = []
+    joining = False
+    for text in log_text.splitlines():
+        if joining and not text.startswith('! '):
+            lines[-1] += text
+        else:
+            lines.append(text)
+        joining = len(text) == LOG_LINE_WIDTH
+    return lines
+
+
+def _open_files(lines):
+    """
+    Pila de archivos abiertos al final de las líneas, según los "(" y ")"
+    del .log (None = paréntesis que no abren un archivo)
+    """
+    stack = []
+    in_box = False
+    for text in lines:
+        # El texto copiado de una caja llega hasta la siguiente línea vacía
+        if BOX_WARNING.match(text):
+            in_box = True
+        if in_box:
+            in_box = bool(text.strip())
+            continue
+        for position, char in enumerate(text):
+            if char == '(':
+                name = LOG_FILE_NAME.match(text, position + 1)
+                stack.append(os.path.basename(name.group(1)) if name else None)
+            elif char == ')' and stack:
+                stack.pop()
+    return stack
+
+
+def parse_log_error(log_text):
+    """
+    Busca el primer error de TeX en el .log.
+    Devuelve (mensaje, número de línea o None, extracto, archivo o None) o None
+    si no hay error. El archivo es el que TeX estaba leyendo al producirse el
+    error, y a él se refiere el número de línea.
+    """
+    lines = _unwrap_log_lines(log_text)
+    for i, text in enumerate(lines):
+        if not text.startswith('! '):
+            continue
+        context = lines[i:i + ERROR_CONTEXT_LINES]
+        line = None
+        for following in lines[i + 1:i + 1 + 20]:
+            match = ERROR_LINE_PATTERN.match(following)
+            if match:
+                line = int(match.group(1))
+                if following not in context:
+                    context.append(following)
+                break
+        files = [name for name in _open_files(lines[:i]) if name]
+        return text[2:].strip(), line, '\n'.join(context), files[-1] if files else None
+    return None
+
+
+def _file_hash(path):
+    """Hash de un archivo, '' si no existe"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ''
+
+
+def _read_text(path):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def _aux_lines(temp_dir, job_id, prefixes):
+    """Líneas del .aux que empiezan por alguno de los prefijos"""
+    aux = _read_text(os.path.join(temp_dir, f"{job_id}.aux"))
+    return [line for line in aux.splitlines() if line.startswith(prefixes)]
+
+
+def _feedback_state(temp_dir, job_id):
+    """Huella de todo lo que LaTeX leerá en la siguiente pasada"""
+    state = ['\n'.join(_aux_lines(temp_dir, job_id, AUX_FEEDBACK_PREFIXES))]
+    for ext in FEEDBACK_EXTENSIONS:
+        state.append(_file_hash(os.path.join(temp_dir, f"{job_id}.{ext}")))
+    return state
+
+
+def _run_bibliography(temp_dir, job_id, env, log_text, last_bib_input):
+    """
+    Ejecuta bibtex o biber si la bibliografía cambió.
+    Devuelve la huella de entrada usada (o la anterior si no se ejecutó).
+    """
+    bcf = os.path.join(temp_dir, f"{job_id}.bcf")
+    if os.path.exists(bcf):
+        tool = 'biber'
+        bib_input = _file_hash(bcf)
+        needed = BIBER_PATTERN.search(log_text) or bib_input != last_bib_input
+    else:
+        citations = _aux_lines(temp_dir, job_id, ('\\citation', '\\bibdata', '\\bibstyle'))
+        if not any(line.startswith('\\bibdata') for line in citations):
+            return last_bib_input
+        tool = 'bibtex'
+        bib_input = hashlib.sha256('\n'.join(citations).encode('utf-8')).hexdigest()
+        bbl = os.path.join(temp_dir, f"{job_id}.bbl")
+        needed = bib_input != last_bib_input or not os.path.exists(bbl)
+
+    if not needed:
+        return last_bib_input
+
+    print(f"    Ejecutando {tool}...")
+    result = subprocess.run(
+        [tool, job_id],
+        cwd=temp_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120
+    )
+    # bibtex devuelve 1 con simples advertencias
+    if result.returncode > 1:
+        print(f"  ⚠ {tool} terminó con código {result.returncode}")
+        print(result.stdout[-500:])
+
+    return bib_input
+
+
+def run_latex_passes(temp_dir, job_id, compilador, env=None, fmt=None, max_passes=5):
+    """
+    Compila hasta que la salida es estable (puede correr en otro proceso).
+    Devuelve (ruta del PDF, número de pasadas).
+    """
+    command = [compilador, '-interaction=nonstopmode']
+    if fmt:
+        command.append(f'-fmt={fmt}')
+    command.append(f"{job_id}.tex")
+
+    log_file = os.path.join(temp_dir, f"{job_id}.log")
+    state = _feedback_state(temp_dir, job_id)
+    last_bib_input = None
+
+    passes = 0
+    for i in range(max_passes):
+        passes = i + 1
+        print(f"    Pasada {passes}...")
+        result = subprocess.run(
+            command,
+            cwd=temp_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=120
+        )
+
+        log_text = _read_text(log_file)
+
+        if result.returncode != 0:
+            print("  ✗ Error en compilación:")
+            print(result.stdout[-1000:])
+            parsed = parse_log_error(log_text)
+            if parsed is None:
+                # Sin .log (p. ej. no se pudo cargar el formato): el motivo está en la salida
+                raise LatexCompileError(
+                    f"Error al compilar LaTeX (código {result.returncode})", context=result.stdout[-1000:]
+                )
+            raise compile_error(*parsed, main_file=f"{job_id}.tex")
+        last_bib_input = _run_bibliography(temp_dir, job_id, env, log_text, last_bib_input)
+
+        new_state = _feedback_state(temp_dir, job_id)
+        rerun = RERUN_PATTERN.search(log_text) or new_state != state
+        state = new_state
+
+        if not rerun:
+            break
+    else:
+        print(f"  ⚠ Se alcanzó el máximo de {max_passes} pasadas")
+
+    # Verificar PDF
+    pdf_file = os.path.join(temp_dir, f"{job_id}.pdf")
+    if not os.path.exists(pdf_file):
+        raise Exception("El PDF no se generó")
+
+    return pdf_file, passes
@@ -0,0 +1,199 @@
+"""
+Formatos precompilados (.fmt) del preámbulo de cada plantilla
+Se usa mylatexformat: el \\documentclass y los \\usepackage del documento se
+vuelcan una vez a un .fmt y cada compilación arranca con ese estado cargado.
+"""
+
+import os
+import re
+import hashlib
+import threading
+import subprocess
+
+
+# Errores propios del formato: no se encuentra, lo escribió otra versión de TeX,
+# está dañado o falla el \endofdump de mylatexformat
+FORMAT_ERROR_PATTERN = re.compile(
+    r"can't find the format file|format file error|\.fmt was written by|endofdump|mylatexformat",
+    re.IGNORECASE
+)
+
+# Líneas que pueden formar parte del preámbulo estático
+PREAMBLE_LINE = re.compile(r'^\\(documentclass|usepackage|RequirePackage|PassOptionsToPackage)\s*[\[{]')
+
+
+def split_static_preamble(latex_content):
+    """
+    Separa el bloque inicial de \\documentclass + paquetes del resto del documento.
+    Devuelve (bloque normalizado, resto) o None si el documento no empieza así.
+    """
+    lines = latex_content.split('\n')
+    block = []
+    seen_class = False
+    end = 0
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%'):
+            continue
+        if not PREAMBLE_LINE.match(stripped):
+            break
+        # Solo líneas completas (sin comentarios ni argumentos partidos)
+        if '%' in stripped or stripped.count('{') != stripped.count('}'):
+            break
+        if stripped.startswith('\\documentclass'):
+            seen_class = True
+        elif stripped.startswith('\\usepackage') and not seen_class:
+            break
+        block.append(stripped)
+        end = i + 1
+
+    if not seen_class:
+        return None
+
+    rest = '\n'.join(lines[end:])
+    return '\n'.join(block), rest
+
+
+def is_format_error(error, dump_line=None):
+    """
+    Indica si un LatexCompileError lo causó el formato y no el documento:
+    un mensaje propio del formato o un error en la línea de \endofdump (dump_line)
+    """
+    if FORMAT_ERROR_PATTERN.search(f"{error.error or ''}\n{error.context}"):
+        return True
+    return dump_line is not None and error.line == dump_line
+
+
+class FormatCache:
+    """Construye y reutiliza formatos .fmt por compilador, plantilla y preámbulo"""
+
+    def __init__(self, folder, compilers=('pdflatex',), max_formats=20):
+        self.folder = os.path.abspath(folder)
+        self.compilers = set(compilers)
+        self.max_formats = max_formats
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # Formatos que fallaron al construirse o al usarse
+        self._failed = set()
+        # Compilaciones que usan cada formato (no se borran mientras tanto)
+        self._in_use = {}
+
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _key_lock(self, name):
+        with self._lock:
+            return self._key_locks.setdefault(name, threading.Lock())
+
+    def mark_failed(self, fmt_path):
+        """Descarta un formato que provocó un error de compilación"""
+        name = os.path.basename(fmt_path)
+        with self._lock:
+            self._failed.add(name)
+        try:
+            os.unlink(f"{fmt_path}.fmt")
+        except OSError:
+            pass
+
+    def prepare(self, latex_content, compilador, template_signature, env=None):
+        """
+        Devuelve (contenido, ruta del formato sin extensión).
+        Si no hay formato aplicable, devuelve (contenido original, None).
+        El formato devuelto queda en uso hasta llamar a release().
+        """
+        if compilador not in self.compilers:
+            return latex_content, None
+
+        split = split_static_preamble(latex_content)
+        if split is None:
+            return latex_content, None
+        block, rest = split
+
+        digest = hashlib.sha256(
+            f"{compilador}\n{template_signature}\n{block}".encode('utf-8')
+        ).hexdigest()[:24]
+        name = f"{compilador}-{digest}"
+        fmt_path = os.path.join(self.folder, name)
+
+        with self._lock:
+            if name in self._failed:
+                return latex_content, None
+            # En uso antes de comprobar que existe: _evict ya no puede borrarlo
+            self._in_use[name] = self._in_use.get(name, 0) + 1
+
+        with self._key_lock(name):
+            if os.path.exists(f"{fmt_path}.fmt"):
+                os.utime(f"{fmt_path}.fmt", None)
+            elif not self._build(name, block, compilador, env):
+                with self._lock:
+                    self._failed.add(name)
+                self.release(fmt_path)
+                return latex_content, None
+
+        # \endofdump: lo anterior ya está en el formato y no se vuelve a leer
+        return f"{block}\n\\endofdump\n{rest}", fmt_path
+
+    def release(self, fmt_path):
+        """Termina el uso de un formato devuelto por prepare()"""
+        name = os.path.basename(fmt_path)
+        with self._lock:
+            count = self._in_use.get(name, 0) - 1
+            if count > 0:
+                self._in_use[name] = count
+            else:
+                self._in_use.pop(name, None)
+
+    def _build(self, name, block, compilador, env):
+        """Vuelca el preámbulo a un .fmt con mylatexformat"""
+        print(f"  → Precompilando formato {name}...")
+
+        # Se construye con otro nombre y se renombra para que sea atómico
+        build_name = f"{name}.{os.getpid()}.{threading.get_ident()}"
+        preamble_file = os.path.join(self.folder, f"{build_name}.tex")
+        with open(preamble_file, 'w', encoding='utf-8') as f:
+            f.write(f"{block}\n\\begin{{document}}\n\\end{{document}}\n")
+
+        try:
+            result = subprocess.run(
+                [compilador, '-ini', '-interaction=nonstopmode', f'-jobname={build_name}',
+                 f'&{compilador}', 'mylatexformat.ltx', f'{build_name}.tex'],
+                cwd=self.folder,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=300
+            )
+            built = os.path.join(self.folder, f"{build_name}.fmt")
+            if result.returncode != 0 or not os.path.exists(built):
+                print(f"  ⚠ No se pudo precompilar el formato (código {result.returncode})")
+                return False
+
+            os.replace(built, os.path.join(self.folder, f"{name}.fmt"))
+            print("  ✓ Formato precompilado")
+            self._evict()
+            return True
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"  ⚠ No se pudo precompilar el formato: {e}")
+            return False
+        finally:
+            for ext in ('tex', 'log', 'fmt'):
+                path = os.path.join(self.folder, f"{build_name}.{ext}")
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def _evict(self):
+        """Conserva solo los formatos usados más recientemente (y los que están en uso)"""
+        formats = [
+            entry for entry in os.scandir(self.folder)
+            if entry.is_file() and entry.name.endswith('.fmt')
+        ]
+        formats.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        # Con el lock tomado para que prepare() no empiece a usar uno mientras se borra
+        with self._lock:
+            for entry in formats[self.max_formats:]:
+                if entry.name[:-len('.fmt')] in self._in_use:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
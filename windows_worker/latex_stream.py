@@ -0,0 +1,157 @@
+"""
+Recepción en streaming de la respuesta de Gemini
+Quita los bloques de código markdown a medida que llega el texto, lo escribe
+en el .tex del trabajo y comprueba la estructura (entornos equilibrados,
+\\begin{document} ... \\end{document}) para detectar pronto una respuesta
+truncada o mal formada.
+"""
+
+import re
+
+
+# Marcas de bloque de código que se eliminan (en este orden, como clean_latex_response)
+FENCES = ('```latex', '```')
+
+# \begin{entorno} y \end{entorno}
+ENVIRONMENT_PATTERN = re.compile(r'\\(begin|end)\s*\{([^}]*)\}')
+
+# Comentario: % no escapado hasta el final de la línea
+COMMENT_PATTERN = re.compile(r'(?<!\\)%.*')
+
+# Entornos cuyo contenido no se analiza
+VERBATIM_ENVIRONMENTS = ('verbatim', 'verbatim*', 'lstlisting', 'minted', 'comment', 'Verbatim')
+
+
+class LatexStreamError(Exception):
+    """La respuesta de Gemini no es un LaTeX bien formado"""
+
+
+class LatexStreamWriter:
+    """Consume los fragmentos de la respuesta y valida el LaTeX a medida que llega"""
+
+    def __init__(self, path=None, require_document=True):
+        # Archivo donde se escribe el LaTeX (None = solo en memoria)
+        self.path = path
+        # Documento completo (True) o fragmento sin preámbulo (False)
+        self.require_document = require_document
+        self.reset()
+
+    def reset(self):
+        """Descarta lo recibido (la consulta se va a repetir)"""
+        self.close()
+        self._file = None
+        self._parts = []
+        self._fence_tail = ''
+        self._whitespace = ''
+        self._started = False
+        self._line = ''
+        self._stack = []
+        self._verbatim = None
+        self._seen_begin = False
+        self._seen_end = False
+        self._first_line = True
+
+    def close(self):
+        file = getattr(self, '_file', None)
+        if file is not None:
+            file.close()
+            self._file = None
+
+    def _strip_fences(self, chunk):
+        """Quita las marcas de código; se retiene el final si puede ser el inicio de una"""
+        data = self._fence_tail + chunk
+        hold = 0
+        for size in range(1, min(len(data), len(FENCES[0]) - 1) + 1):
+            if FENCES[0].startswith(data[-size:]):
+                hold = size
+        self._fence_tail = data[len(data) - hold:] if hold else ''
+        data = data[:len(data) - hold]
+        for fence in FENCES:
+            data = data.replace(fence, '')
+        return data
+
+    def feed(self, chunk):
+        """Procesa un fragmento de la respuesta"""
+        self._emit(self._strip_fences(chunk))
+
+    def _emit(self, text):
+        # Equivalente a strip(): sin espacios iniciales y con los finales retenidos
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+
+        text = self._whitespace + text
+        content_end = len(text.rstrip())
+        self._whitespace = text[content_end:]
+        text = text[:content_end]
+        if not text:
+            return
+
+        self._parts.append(text)
+        if self.path:
+            if self._file is None:
+                self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(text)
+
+        lines = (self._line + text).split('\n')
+        self._line = lines.pop()
+        for line in lines:
+            self._check_line(line)
+
+    def _check_line(self, line):
+        """Comprueba una línea completa"""
+        if self._seen_end:
+            return
+        line = COMMENT_PATTERN.sub('', line) if self._verbatim is None else line
+        if self.require_document and self._first_line and line.strip():
+            # La respuesta debe empezar con código LaTeX, no con una explicación
+            if not line.lstrip().startswith('\\'):
+                raise LatexStreamError(f"La respuesta no empieza con LaTeX: {line.strip()[:80]}")
+            self._first_line = False
+
+        for command, name in ENVIRONMENT_PATTERN.findall(line):
+            name = name.strip()
+            if self._verbatim is not None:
+                if command == 'end' and name == self._verbatim:
+                    self._verbatim = None
+                continue
+
+            if command == 'begin':
+                if name == 'document':
+                    self._seen_begin = True
+                if name in VERBATIM_ENVIRONMENTS:
+                    self._verbatim = name
+                    continue
+                self._stack.append(name)
+                continue
+
+            if not self._stack:
+                raise LatexStreamError(f"\\end{{{name}}} sin \\begin{{{name}}}")
+            if self._stack[-1] != name:
+                raise LatexStreamError(f"\\end{{{name}}} cierra \\begin{{{self._stack[-1]}}}")
+            self._stack.pop()
+            if name == 'document':
+                self._seen_end = True
+                return
+
+    def finish(self):
+        """Cierra el archivo, valida el final y devuelve el LaTeX completo"""
+        if self._fence_tail:
+            self._emit(self._fence_tail.replace(FENCES[1], ''))
+            self._fence_tail = ''
+        if self._line:
+            self._check_line(self._line)
+            self._line = ''
+        self.close()
+
+        if self.require_document:
+            if not self._seen_begin:
+                raise LatexStreamError("Falta \\begin{document}")
+            if not self._seen_end:
+                raise LatexStreamError("Respuesta incompleta: falta \\end{document}")
+        elif self._stack:
+            raise LatexStreamError(f"Respuesta incompleta: falta \\end{{{self._stack[-1]}}}")
+
+        return ''.join(self._parts)
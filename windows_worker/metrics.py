@@ -0,0 +1,147 @@
+"""
+Métricas del worker (tiempos por etapa, bytes, tokens, pasadas de LaTeX)
+Se acumulan en memoria como contadores e histogramas y se exponen en formato
+de texto de Prometheus en http://localhost:METRICS_PORT/metrics.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Límites de los histogramas de tiempo (segundos)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Descripción de cada métrica para el endpoint
+DESCRIPTIONS = {
+    'job_queue_wait_seconds': 'Espera en cola (started_at - created_at)',
+    'job_duration_seconds': 'Duración total del procesamiento de un trabajo',
+    'job_stage_seconds': 'Duración de cada etapa del procesamiento',
+    'pipeline_queue_seconds': 'Espera de los trabajos en la cola de cada etapa del pipeline',
+    'jobs_total': 'Trabajos procesados por resultado',
+    'bytes_total': 'Bytes transferidos por dirección',
+    'blob_dedup_total': 'Archivos que ya estaban en el almacén de blobs (no se vuelven a subir)',
+    'revision_sections_total': 'Secciones de revisiones reutilizadas de la versión anterior o convertidas de nuevo',
+    'gemini_request_seconds': 'Duración de cada consulta a Gemini',
+    'gemini_tokens_total': 'Tokens de Gemini consumidos (reales o estimados)',
+    'gemini_retries_total': 'Reintentos de consultas a Gemini',
+    'latex_passes': 'Pasadas de LaTeX por compilación',
+}
+
+# Métricas cuyos valores no son tiempos
+COUNT_BUCKETS = {
+    'latex_passes': (1, 2, 3, 4, 5, 6, 8, 10),
+}
+
+
+class Histogram:
+    """Histograma acumulativo con límites fijos"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, limit in enumerate(self.buckets):
+            if value <= limit:
+                self.counts[i] += 1
+
+
+def _label_text(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+
+class MetricsRegistry:
+    """Contadores e histogramas con etiquetas, seguros entre hilos"""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(COUNT_BUCKETS.get(name, DEFAULT_BUCKETS))
+                self._histograms[key] = histogram
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Mide la duración del bloque (se registra también si falla)"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus"""
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in DESCRIPTIONS:
+                    lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                header(name, 'counter')
+                lines.append(f"{name}{_label_text(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                header(name, 'histogram')
+                for limit, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{_label_text(labels, ('le', limit))} {count}")
+                lines.append(f"{name}_bucket{_label_text(labels, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Registro global del proceso
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Sin una línea por cada consulta del scraper
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Sirve /metrics en un hilo en segundo plano"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    return server
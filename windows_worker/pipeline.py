@@ -0,0 +1,104 @@
+"""
+Pipeline de etapas con colas acotadas
+Cada etapa (descarga, conversión, compilación, subida) tiene sus propios hilos
+y una cola acotada delante, así mientras unos trabajos esperan a Gemini otros
+se compilan y la red y la CPU están ocupadas a la vez. Si una etapa se satura
+su cola se llena y la anterior se detiene (contrapresión) en lugar de acumular
+trabajos reclamados que otro worker podría estar procesando.
+"""
+
+import queue
+import threading
+import time
+
+from metrics import metrics
+
+
+# Marca de fin para los hilos de una etapa
+_STOP = object()
+
+
+class Stage:
+    """Una etapa: función, hilos que la ejecutan y cola de entrada"""
+
+    def __init__(self, name, fn, workers, queue_size):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.threads = []
+
+
+class StagePipeline:
+    """
+    Etapas en cadena: cada elemento pasa por fn(item) de todas las etapas en
+    orden. Si una etapa lanza una excepción se llama a on_error(item, etapa, error)
+    y el elemento no sigue; al terminar la última se llama a on_done(item).
+    """
+
+    def __init__(self, stages, queue_size=2, on_done=None, on_error=None, on_take=None):
+        # stages: lista de (nombre, función, hilos)
+        self.stages = [Stage(name, fn, workers, queue_size) for name, fn, workers in stages]
+        self.on_done = on_done
+        self.on_error = on_error
+        # Se llama cuando la primera etapa toma un elemento (queda sitio en su cola)
+        self.on_take = on_take
+
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._run, args=(index,), name=f'{stage.name}-{number + 1}', daemon=True
+                )
+                thread.start()
+                stage.threads.append(thread)
+
+    def space(self):
+        """Elementos que caben en la cola de la primera etapa sin bloquear"""
+        entry = self.stages[0].queue
+        return max(0, entry.maxsize - entry.qsize())
+
+    def put(self, item):
+        """Entra un elemento en la primera etapa (bloquea si su cola está llena)"""
+        self.stages[0].queue.put((item, time.monotonic()))
+
+    def _callback(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"✗ Error en el pipeline ({threading.current_thread().name}): {e}")
+
+    def _run(self, index):
+        """Hilo de una etapa: toma de su cola, procesa y pasa a la siguiente"""
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            entry = stage.queue.get()
+            if entry is _STOP:
+                return
+            item, queued_at = entry
+            if index == 0:
+                self._callback(self.on_take)
+            metrics.observe('pipeline_queue_seconds', time.monotonic() - queued_at, stage=stage.name)
+
+            try:
+                stage.fn(item)
+            except Exception as e:
+                self._callback(self.on_error, item, stage.name, e)
+                continue
+
+            if next_stage:
+                # Cola llena: este hilo espera a que la siguiente etapa avance
+                next_stage.queue.put((item, time.monotonic()))
+            else:
+                self._callback(self.on_done, item)
+
+    def shutdown(self):
+        """Termina los elementos en curso y detiene las etapas (en orden, sin perder ninguno)"""
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            for thread in stage.threads:
+                thread.join()
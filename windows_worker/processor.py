@@ -4,6 +4,10 @@ Este script debe ejecutarse en una laptop Windows con:
 - Python 3.8+
 - MiKTeX o TeX Live instalado
 - Gemini API Key configurada
+
+Usa el mismo motor que worker.py (caché, conversión local, compilación en
+procesos, reparación de errores...); solo cambia el origen de los trabajos:
+una carpeta vigilada en lugar de la cola MySQL.
 """
 
 import os
@@ -11,24 +15,28 @@ import sys
 import json
 import time
 import shutil
-import subprocess
+import threading
 from pathlib import Path
 from datetime import datetime
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import google.generativeai as genai
 
+from worker import (
+    WorkerPool, GEMINI_API_KEY, MAX_WORKERS, FETCH_WORKERS, COMPILE_WORKERS, UPLOAD_WORKERS,
+    COMPILE_PROCESSES, POLL_INTERVAL
+)
 
-# ============= CONFIGURACIÓN =============
-# Configura tu API Key de Gemini
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 
+# ============= CONFIGURACIÓN =============
 # Carpetas - ajusta estas rutas según tu configuración
 # Pueden ser rutas locales o rutas de red compartida (ej: \\servidor\share\procesar)
+# (PLANTILLAS_FOLDER, TEMP_FOLDER y el resto de la configuración son los de worker.py)
 PROCESAR_FOLDER = os.environ.get('PROCESAR_FOLDER', r'C:\Editor-LATEX\procesar')
 PROCESADOS_FOLDER = os.environ.get('PROCESADOS_FOLDER', r'C:\Editor-LATEX\procesados')
-PLANTILLAS_FOLDER = os.environ.get('PLANTILLAS_FOLDER', r'C:\Editor-LATEX\plantillas')
-TEMP_FOLDER = os.environ.get('TEMP_FOLDER', r'C:\Editor-LATEX\temp')
+
+# Segundos sin cambios en los archivos de un trabajo antes de procesarlo
+# (evita leer archivos que aún se están copiando)
+FOLDER_SETTLE_SECONDS = float(os.environ.get('FOLDER_SETTLE_SECONDS', '1'))
 
 # Variables configurables desde Windows
 CONFIGURACION_LOCAL = {
@@ -41,296 +49,209 @@ CONFIGURACION_LOCAL = {
 # =========================================
 
 
-class DocumentProcessor:
-    """Procesa documentos Word/LaTeX usando Gemini API"""
-
-    def __init__(self, api_key):
-        if not api_key:
-            raise ValueError("Se requiere GEMINI_API_KEY")
-
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
-
-        # Crear carpetas si no existen
-        os.makedirs(PROCESAR_FOLDER, exist_ok=True)
-        os.makedirs(PROCESADOS_FOLDER, exist_ok=True)
-        os.makedirs(TEMP_FOLDER, exist_ok=True)
-        os.makedirs(PLANTILLAS_FOLDER, exist_ok=True)
-
-    def process_word_to_latex(self, word_file, plantilla, metadata):
-        """Convierte documento Word a LaTeX usando Gemini"""
-        print(f"  → Procesando Word: {word_file}")
-
-        try:
-            # Leer el archivo Word (necesitarás python-docx)
-            from docx import Document
-            doc = Document(word_file)
-
-            # Extraer texto del documento
-            full_text = []
-            for para in doc.paragraphs:
-                full_text.append(para.text)
-
-            content = '\n'.join(full_text)
-
-            # Leer plantilla
-            plantilla_path = os.path.join(PLANTILLAS_FOLDER, plantilla)
-            if os.path.exists(plantilla_path):
-                with open(plantilla_path, 'r', encoding='utf-8') as f:
-                    plantilla_content = f.read()
-            else:
-                plantilla_content = "Plantilla no encontrada"
-
-            # Preparar prompt para Gemini
-            prompt = f"""
-Eres un experto en LaTeX. Convierte el siguiente documento a formato LaTeX siguiendo esta plantilla.
-
-PLANTILLA DE LA REVISTA:
-{plantilla_content}
-
-CONTENIDO DEL DOCUMENTO:
-{content}
-
-INSTRUCCIONES:
-1. Mantén la estructura de la plantilla
-2. Inserta el contenido del documento en las secciones apropiadas
-3. Convierte el formato (negritas, cursivas, listas, etc.) a comandos LaTeX
-4. Mantén las citas y referencias en formato BibTeX si las hay
-5. Asegúrate de que el código LaTeX sea válido y compilable
-
-METADATOS:
-- Volumen: {metadata['configuracion']['volumen']}
-- Año: {metadata['configuracion']['año']}
-- Número: {metadata['configuracion']['numero']}
-- Página inicial: {metadata['configuracion']['pagina_inicial']}
-
-Devuelve SOLO el código LaTeX completo, sin explicaciones adicionales.
-"""
-
-            # Llamar a Gemini
-            print("  → Consultando Gemini API...")
-            response = self.model.generate_content(prompt)
-            latex_content = response.text
-
-            # Limpiar respuesta (remover markdown si existe)
-            latex_content = latex_content.replace('```latex', '').replace('```', '').strip()
-
-            return latex_content
-
-        except ImportError:
-            print("  ⚠ ERROR: python-docx no está instalado. Instalando...")
-            subprocess.run([sys.executable, '-m', 'pip', 'install', 'python-docx'])
-            return self.process_word_to_latex(word_file, plantilla, metadata)
-
-        except Exception as e:
-            print(f"  ✗ Error procesando Word: {e}")
-            raise
-
-    def process_latex_file(self, latex_file, metadata):
-        """Procesa archivo LaTeX existente con Gemini para ajustar a plantilla"""
-        print(f"  → Procesando LaTeX: {latex_file}")
-
+class FolderJobSource:
+    """
+    Origen y destino de trabajos en carpetas: cada trabajo es un <job_id>.json
+    con su archivo en PROCESAR_FOLDER; el PDF y los metadatos finales se
+    escriben en PROCESADOS_FOLDER. Compartido por todos los hilos del pool.
+    """
+
+    def __init__(self, procesar_folder, procesados_folder, configuracion=None):
+        self.procesar_folder = procesar_folder
+        self.procesados_folder = procesados_folder
+        self.configuracion = configuracion or {}
+
+        # Trabajos avisados que aún no se reclamaron y trabajos en curso
+        self._pending = set()
+        self._claimed = set()
+        self._logs = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+        os.makedirs(procesar_folder, exist_ok=True)
+        os.makedirs(procesados_folder, exist_ok=True)
+
+    def metadata_path(self, job_id):
+        return os.path.join(self.procesar_folder, f"{job_id}.json")
+
+    def notify(self, job_id):
+        """Avisa de un trabajo nuevo o modificado (no bloquea)"""
+        with self._lock:
+            if job_id in self._claimed:
+                return
+            self._pending.add(job_id)
+        self._changed.set()
+
+    def scan(self):
+        """Avisa de los trabajos que ya estaban en la carpeta"""
+        for file in os.listdir(self.procesar_folder):
+            if file.endswith('.json'):
+                self.notify(Path(file).stem)
+
+    def wait(self, timeout):
+        """Espera un aviso (True) o hasta timeout (False)"""
+        with self._lock:
+            if self._pending:
+                # Hay trabajos esperando a que terminen de copiarse
+                timeout = min(timeout, FOLDER_SETTLE_SECONDS)
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def _load(self, job_id):
+        """Trabajo listo para procesar, o None si sus archivos aún no están completos"""
+        metadata_file = self.metadata_path(job_id)
         try:
-            # Leer archivo LaTeX
-            with open(latex_file, 'r', encoding='utf-8') as f:
-                latex_content = f.read()
-
-            # Leer plantilla
-            plantilla_path = os.path.join(PLANTILLAS_FOLDER, metadata['plantilla'])
-            if os.path.exists(plantilla_path):
-                with open(plantilla_path, 'r', encoding='utf-8') as f:
-                    plantilla_content = f.read()
-
-                # Usar Gemini para ajustar a la plantilla
-                prompt = f"""
-Eres un experto en LaTeX. Ajusta el siguiente documento LaTeX para que use esta plantilla de revista.
-
-PLANTILLA DE LA REVISTA:
-{plantilla_content}
-
-DOCUMENTO ORIGINAL:
-{latex_content}
-
-INSTRUCCIONES:
-1. Adapta el documento original a la estructura de la plantilla
-2. Mantén todo el contenido del documento original
-3. Actualiza los metadatos:
-   - Volumen: {metadata['configuracion']['volumen']}
-   - Año: {metadata['configuracion']['año']}
-   - Número: {metadata['configuracion']['numero']}
-   - Página inicial: {metadata['configuracion']['pagina_inicial']}
-4. Asegúrate de que sea compilable
-
-Devuelve SOLO el código LaTeX completo.
-"""
-
-                print("  → Ajustando con Gemini API...")
-                response = self.model.generate_content(prompt)
-                latex_content = response.text.replace('```latex', '').replace('```', '').strip()
-
-            return latex_content
-
-        except Exception as e:
-            print(f"  ⚠ Advertencia al procesar LaTeX: {e}")
-            # Si falla, devolver el original
-            with open(latex_file, 'r', encoding='utf-8') as f:
-                return f.read()
-
-    def compile_latex(self, latex_content, output_name, compilador='pdflatex'):
-        """Compila LaTeX a PDF"""
-        print(f"  → Compilando con {compilador}...")
-
-        # Crear directorio temporal para este trabajo
-        temp_dir = os.path.join(TEMP_FOLDER, output_name)
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # Escribir archivo .tex
-        tex_file = os.path.join(temp_dir, f"{output_name}.tex")
-        with open(tex_file, 'w', encoding='utf-8') as f:
-            f.write(latex_content)
-
-        # Compilar (2 veces para referencias)
-        for i in range(2):
-            print(f"    Pasada {i+1}/2...")
-            result = subprocess.run(
-                [compilador, '-interaction=nonstopmode', f"{output_name}.tex"],
-                cwd=temp_dir,
-                capture_output=True,
-                text=True
-            )
-
-            if result.returncode != 0:
-                print(f"  ✗ Error en compilación:")
-                print(result.stdout[-500:])  # Últimas 500 líneas
-                raise Exception(f"Error al compilar LaTeX: {result.returncode}")
-
-        # Verificar que se generó el PDF
-        pdf_file = os.path.join(temp_dir, f"{output_name}.pdf")
-        if not os.path.exists(pdf_file):
-            raise Exception("El PDF no se generó")
-
-        print(f"  ✓ PDF generado exitosamente")
-        return pdf_file
-
-    def process_job(self, job_id):
-        """Procesa un trabajo completo"""
-        print(f"\n{'='*60}")
-        print(f"Procesando trabajo: {job_id}")
-        print(f"{'='*60}")
-
-        metadata_file = os.path.join(PROCESAR_FOLDER, f"{job_id}.json")
-
-        try:
-            # Leer metadata
+            if time.time() - os.path.getmtime(metadata_file) < FOLDER_SETTLE_SECONDS:
+                return None
             with open(metadata_file, 'r', encoding='utf-8') as f:
                 metadata = json.load(f)
+            input_file = os.path.join(self.procesar_folder, metadata['filename'])
+            if time.time() - os.path.getmtime(input_file) < FOLDER_SETTLE_SECONDS:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Actualizar con configuración local de Windows
+        metadata.setdefault('configuracion', {}).update(self.configuracion)
+        plantilla_folder, plantilla_main = os.path.split(os.path.normpath(metadata['plantilla']))
+
+        return {
+            'job_id': job_id,
+            'filename_original': metadata.get('filename_original', metadata['filename']),
+            'file_extension': metadata['tipo_archivo'],
+            'revista_nombre': metadata.get('revista', ''),
+            'compilador': metadata.get('compilador') or 'pdflatex',
+            'plantilla_folder': plantilla_folder,
+            'plantilla_main': plantilla_main,
+            'volumen': metadata['configuracion'].get('volumen'),
+            'año': metadata['configuracion'].get('año'),
+            'numero': metadata['configuracion'].get('numero'),
+            'pagina_inicial': metadata['configuracion'].get('pagina_inicial'),
+            'input_file': input_file,
+            'metadata': metadata,
+        }
+
+    def claim(self, limit=5):
+        """Reclama hasta limit trabajos cuyos archivos ya están completos"""
+        with self._lock:
+            candidates = sorted(self._pending)
+
+        jobs = []
+        for job_id in candidates:
+            if len(jobs) >= limit:
+                break
+            if not os.path.exists(self.metadata_path(job_id)):
+                with self._lock:
+                    self._pending.discard(job_id)
+                continue
+            job = self._load(job_id)
+            if job is None:
+                continue
+            with self._lock:
+                self._pending.discard(job_id)
+                if job_id in self._claimed:
+                    continue
+                self._claimed.add(job_id)
+            jobs.append(job)
+        return jobs
+
+    def fetch(self, job):
+        """Contenido del archivo de entrada"""
+        with open(job['input_file'], 'rb') as f:
+            return f.read()
+
+    def renew_leases(self, job_ids):
+        pass  # Sin leases: la carpeta la atiende un único worker
+
+    def log(self, job_id, level, message):
+        """Los logs se guardan con los metadatos finales del trabajo"""
+        with self._lock:
+            self._logs.setdefault(job_id, []).append({
+                'level': level,
+                'message': message,
+                'at': datetime.now().isoformat()
+            })
+
+    def flush(self):
+        pass
+
+    def _finish(self, job, metadata, remove_input):
+        """Escribe los metadatos finales y retira el trabajo de la carpeta"""
+        job_id = job['job_id']
+        with self._lock:
+            metadata['logs'] = self._logs.pop(job_id, [])
 
-            # Actualizar con configuración local de Windows
-            metadata['configuracion'].update(CONFIGURACION_LOCAL)
-
-            print(f"Revista: {metadata['revista']}")
-            print(f"Archivo: {metadata['filename_original']}")
-            print(f"Tipo: {metadata['tipo_archivo']}")
-
-            # Obtener archivo de entrada
-            input_file = os.path.join(PROCESAR_FOLDER, metadata['filename'])
-
-            if not os.path.exists(input_file):
-                raise Exception(f"Archivo no encontrado: {input_file}")
-
-            # Procesar según tipo
-            latex_content = None
-
-            if metadata['tipo_archivo'] in ['doc', 'docx']:
-                latex_content = self.process_word_to_latex(
-                    input_file,
-                    metadata['plantilla'],
-                    metadata
-                )
-            elif metadata['tipo_archivo'] == 'tex':
-                latex_content = self.process_latex_file(input_file, metadata)
-            else:
-                raise Exception(f"Tipo de archivo no soportado: {metadata['tipo_archivo']}")
-
-            # Compilar LaTeX
-            pdf_file = self.compile_latex(
-                latex_content,
-                job_id,
-                metadata['compilador']
-            )
-
-            # Mover PDF a carpeta de procesados
-            final_pdf = os.path.join(PROCESADOS_FOLDER, f"{job_id}.pdf")
-            shutil.copy2(pdf_file, final_pdf)
-
-            # Actualizar metadata
-            metadata['status'] = 'completed'
-            metadata['completed_at'] = datetime.now().isoformat()
-            metadata['pdf_path'] = final_pdf
-
-            # Guardar metadata en procesados
-            processed_metadata = os.path.join(PROCESADOS_FOLDER, f"{job_id}.json")
+        try:
+            processed_metadata = os.path.join(self.procesados_folder, f"{job_id}.json")
             with open(processed_metadata, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, indent=2, ensure_ascii=False)
 
             # Eliminar archivos de la carpeta procesar
-            os.remove(metadata_file)
-            os.remove(input_file)
-
-            print(f"✓ Trabajo completado exitosamente")
-            print(f"  PDF: {final_pdf}")
-
-        except Exception as e:
-            print(f"✗ Error procesando trabajo: {e}")
-
-            # Actualizar metadata con error
-            try:
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
+            os.remove(self.metadata_path(job_id))
+            if remove_input:
+                os.remove(job['input_file'])
+        finally:
+            with self._lock:
+                self._claimed.discard(job_id)
+
+    def complete(self, job, pdf_path):
+        """Copia el PDF a la carpeta de procesados"""
+        final_pdf = os.path.join(self.procesados_folder, f"{job['job_id']}.pdf")
+        shutil.copy2(pdf_path, final_pdf)
+
+        metadata = job['metadata']
+        metadata['status'] = 'completed'
+        metadata['completed_at'] = datetime.now().isoformat()
+        metadata['pdf_path'] = final_pdf
+        self._finish(job, metadata, remove_input=True)
+
+        print(f"  ✓ PDF: {final_pdf}")
+
+    def fail(self, job, error_message):
+        """Deja los metadatos con el error en la carpeta de procesados"""
+        metadata = job['metadata']
+        metadata['status'] = 'error'
+        metadata['error'] = error_message
+        metadata['error_at'] = datetime.now().isoformat()
+        try:
+            self._finish(job, metadata, remove_input=False)
+        except OSError as e:
+            print(f"  ✗ Error guardando metadatos del error: {e}")
 
-                metadata['status'] = 'error'
-                metadata['error'] = str(e)
-                metadata['error_at'] = datetime.now().isoformat()
+    def previous_sections(self, job):
+        return None  # Sin historial de trabajos anteriores: siempre conversión completa
 
-                error_metadata = os.path.join(PROCESADOS_FOLDER, f"{job_id}.json")
-                with open(error_metadata, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2, ensure_ascii=False)
+    def save_sections(self, job, sections):
+        pass
 
-                os.remove(metadata_file)
-            except:
-                pass
+    def close(self):
+        pass
 
 
 class FileWatcher(FileSystemEventHandler):
-    """Monitorea la carpeta procesar en busca de nuevos trabajos"""
-
-    def __init__(self, processor):
-        self.processor = processor
-        self.processing = set()
-
-    def on_created(self, event):
-        if event.is_directory:
-            return
+    """Monitorea la carpeta procesar y avisa al origen (sin procesar en este hilo)"""
 
-        # Solo procesar archivos .json (metadata)
-        if not event.src_path.endswith('.json'):
-            return
+    def __init__(self, source):
+        self.source = source
 
-        job_id = Path(event.src_path).stem
+    def _notify(self, path):
+        # Solo archivos .json (metadata)
+        if path.endswith('.json'):
+            self.source.notify(Path(path).stem)
 
-        # Evitar procesar el mismo trabajo múltiples veces
-        if job_id in self.processing:
-            return
-
-        # Esperar un poco para asegurar que el archivo esté completamente escrito
-        time.sleep(1)
+    def on_created(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
 
-        self.processing.add(job_id)
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
 
-        try:
-            self.processor.process_job(job_id)
-        finally:
-            self.processing.discard(job_id)
+    def on_moved(self, event):
+        # Copias atómicas: el archivo se escribe con otro nombre y se renombra
+        if not event.is_directory:
+            self._notify(event.dest_path)
 
 
 def main():
@@ -340,11 +261,14 @@ def main():
     print("="*60)
     print(f"Carpeta de procesamiento: {PROCESAR_FOLDER}")
     print(f"Carpeta de procesados: {PROCESADOS_FOLDER}")
-    print(f"Configuración local:")
+    print("Configuración local:")
     print(f"  Volumen: {CONFIGURACION_LOCAL['volumen']}")
     print(f"  Año: {CONFIGURACION_LOCAL['año']}")
     print(f"  Número: {CONFIGURACION_LOCAL['numero']}")
     print(f"  Página inicial: {CONFIGURACION_LOCAL['pagina_inicial']}")
+    print(f"Hilos: descarga {FETCH_WORKERS}, conversión {MAX_WORKERS}, "
+          f"compilación {COMPILE_WORKERS or max(1, COMPILE_PROCESSES)}, "
+          f"subida {UPLOAD_WORKERS} | Procesos de compilación: {COMPILE_PROCESSES}")
     print("="*60)
 
     if not GEMINI_API_KEY:
@@ -352,34 +276,49 @@ def main():
         print("Configura la variable de entorno GEMINI_API_KEY")
         sys.exit(1)
 
-    # Inicializar procesador
-    processor = DocumentProcessor(GEMINI_API_KEY)
+    # Un solo origen compartido por todos los hilos del pool
+    source = FolderJobSource(PROCESAR_FOLDER, PROCESADOS_FOLDER, CONFIGURACION_LOCAL)
+    pool = WorkerPool(GEMINI_API_KEY, source_factory=lambda: source)
 
     # Procesar archivos existentes primero
     print("\nBuscando trabajos pendientes...")
-    for file in os.listdir(PROCESAR_FOLDER):
-        if file.endswith('.json'):
-            job_id = file.replace('.json', '')
-            print(f"Encontrado: {job_id}")
-            processor.process_job(job_id)
+    source.scan()
 
     # Iniciar watchdog
     print("\n✓ Iniciando monitoreo de carpeta...")
     print("Esperando nuevos trabajos... (Ctrl+C para detener)\n")
 
-    event_handler = FileWatcher(processor)
+    event_handler = FileWatcher(source)
     observer = Observer()
     observer.schedule(event_handler, PROCESAR_FOLDER, recursive=False)
     observer.start()
 
     try:
         while True:
-            time.sleep(1)
+            # Sin sitio en el pipeline: esperar a que la descarga tome algún trabajo
+            free_slots = pool.free_slots()
+            if free_slots == 0:
+                pool.slot_freed.wait(POLL_INTERVAL)
+                pool.slot_freed.clear()
+                continue
+
+            jobs = source.claim(limit=free_slots)
+            for job in jobs:
+                print(f"Encontrado: {job['job_id']}")
+                pool.submit(job)
+
+            # Lote lleno: probablemente quedan más, reclamar en cuanto haya sitio
+            if jobs and len(jobs) == free_slots:
+                continue
+
+            source.wait(POLL_INTERVAL)
     except KeyboardInterrupt:
         print("\n\nDeteniendo worker...")
+    finally:
         observer.stop()
+        observer.join()
+        pool.shutdown()
 
-    observer.join()
     print("Worker detenido.")
 
 
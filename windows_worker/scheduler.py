@@ -0,0 +1,87 @@
+"""
+Planificador de la cola de trabajos
+Reparte los hilos libres entre revistas y, dentro de cada revista, entre
+usuarios (weighted fair queuing), de modo que un usuario que sube un número
+completo no retrasa al resto de autores ni de revistas. Los trabajos de mayor
+prioridad (p. ej. reprocesados del editor) van primero, y el envejecimiento
+sube de clase a los que llevan mucho esperando para que nadie quede relegado.
+"""
+
+
+# Clases de prioridad (jobs.priority, mayor = antes)
+PRIORITY_NORMAL = 0
+PRIORITY_EDITOR = 2
+
+
+class FairScheduler:
+    """Ordena los trabajos candidatos por prioridad y reparto justo"""
+
+    def __init__(self, aging_seconds=600):
+        # Segundos de espera que suben un trabajo una clase de prioridad (0 = sin envejecimiento)
+        self.aging_seconds = aging_seconds
+        # Peso de cada revista en el reparto (las que no aparecen pesan 1)
+        self.weights = {}
+
+    def effective_priority(self, job, classes):
+        """
+        Clase en la que compite el trabajo: su prioridad sube una clase por cada
+        aging_seconds de espera, hasta la mayor de las clases presentes que alcance.
+        Solo se asciende a clases con trabajos, así el envejecimiento evita que la
+        prioridad alta relegue a las demás sin romper el reparto dentro de una clase.
+        """
+        priority = job.get('priority') or 0
+        if self.aging_seconds <= 0:
+            return priority
+        reach = priority + int(job['wait_seconds'] // self.aging_seconds)
+        return max(level for level in classes if level <= reach)
+
+    def order(self, candidates, running=()):
+        """
+        job_id de los candidatos en el orden en que deben reclamarse.
+        candidates: dicts con job_id, revista_codigo, user_id, priority y wait_seconds.
+        running: dicts con revista_codigo, user_id y running (trabajos en curso de
+        todos los workers), que cuentan como servicio ya recibido.
+        """
+        revista_load = {}
+        user_load = {}
+        for row in running:
+            revista = row['revista_codigo']
+            revista_load[revista] = revista_load.get(revista, 0) + row['running']
+            user = (revista, row['user_id'])
+            user_load[user] = user_load.get(user, 0) + row['running']
+
+        # Clase -> revista -> usuario -> trabajos (el que más espera primero)
+        present = {job.get('priority') or 0 for job in candidates}
+        classes = {}
+        for job in sorted(candidates, key=lambda job: -job['wait_seconds']):
+            revistas = classes.setdefault(self.effective_priority(job, present), {})
+            users = revistas.setdefault(job['revista_codigo'], {})
+            users.setdefault(job['user_id'], []).append(job)
+
+        ordered = []
+        for priority in sorted(classes, reverse=True):
+            revistas = classes[priority]
+            while revistas:
+                # Revista con menos servicio relativo a su peso; en empate, la que más espera
+                revista = min(revistas, key=lambda codigo: (
+                    (revista_load.get(codigo, 0) + 1) / max(self.weights.get(codigo, 1), 1e-9),
+                    -max(jobs[0]['wait_seconds'] for jobs in revistas[codigo].values())
+                ))
+                users = revistas[revista]
+
+                # Dentro de la revista, el usuario con menos trabajos en curso
+                user = min(users, key=lambda user_id: (
+                    user_load.get((revista, user_id), 0),
+                    -users[user_id][0]['wait_seconds']
+                ))
+                job = users[user].pop(0)
+                ordered.append(job['job_id'])
+
+                revista_load[revista] = revista_load.get(revista, 0) + 1
+                user_load[(revista, user)] = user_load.get((revista, user), 0) + 1
+                if not users[user]:
+                    del users[user]
+                if not users:
+                    del revistas[revista]
+
+        return ordered
@@ -0,0 +1,141 @@
+"""
+Registro de plantillas de revista
+Cada plantilla se carga una sola vez y se invalida cuando cambia en disco.
+El directorio de cada trabajo se prepara sin copiar la carpeta completa.
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+
+# Modos para preparar el directorio de un trabajo
+MODE_TEXINPUTS = 'texinputs'  # La plantilla se busca vía TEXINPUTS (no se copia nada)
+MODE_LINK = 'link'            # Hardlinks para archivos y symlinks para carpetas
+MODE_COPY = 'copy'            # Copia completa (comportamiento original)
+
+
+class TemplateSnapshot:
+    """Estado cargado de una carpeta de plantilla"""
+
+    def __init__(self, folder, path, signature, files):
+        self.folder = folder
+        self.path = path
+        self.signature = signature
+        # Rutas relativas de todos los archivos de la plantilla
+        self.files = files
+        # Contenido de los .tex principales leídos (nombre -> texto)
+        self.main_files = {}
+        self.checked_at = time.monotonic()
+
+
+class TemplateRegistry:
+    """Mantiene en memoria las plantillas y prepara los directorios de trabajo"""
+
+    def __init__(self, plantillas_folder, check_interval=5):
+        self.plantillas_folder = plantillas_folder
+        # Segundos entre comprobaciones de cambios en disco
+        self.check_interval = check_interval
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def _scan(self, path):
+        """Firma (rutas, mtime, tamaño) y lista de archivos de la plantilla"""
+        digest = hashlib.sha256()
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, path)
+                stat = os.stat(full)
+                digest.update(f"{rel}|{stat.st_mtime_ns}|{stat.st_size}\n".encode('utf-8'))
+                files.append(rel)
+        return digest.hexdigest(), files
+
+    def get(self, plantilla_folder):
+        """Devuelve el snapshot vigente de la plantilla, o None si no existe"""
+        path = os.path.abspath(os.path.join(self.plantillas_folder, plantilla_folder))
+
+        with self._lock:
+            snapshot = self._snapshots.get(plantilla_folder)
+            now = time.monotonic()
+            if snapshot and now - snapshot.checked_at < self.check_interval:
+                return snapshot
+
+            if not os.path.isdir(path):
+                self._snapshots.pop(plantilla_folder, None)
+                return None
+
+            signature, files = self._scan(path)
+            if snapshot and snapshot.signature == signature:
+                snapshot.checked_at = now
+                return snapshot
+
+            if snapshot:
+                print(f"  → Plantilla modificada, recargando: {plantilla_folder}")
+            snapshot = TemplateSnapshot(plantilla_folder, path, signature, files)
+            self._snapshots[plantilla_folder] = snapshot
+            return snapshot
+
+    def read_main(self, plantilla_folder, plantilla_main):
+        """Contenido del .tex principal (leído de disco una sola vez por versión)"""
+        snapshot = self.get(plantilla_folder)
+        if snapshot is None:
+            return None
+
+        with self._lock:
+            if plantilla_main not in snapshot.main_files:
+                main_path = os.path.join(snapshot.path, plantilla_main)
+                if not os.path.exists(main_path):
+                    return None
+                with open(main_path, 'r', encoding='utf-8') as f:
+                    snapshot.main_files[plantilla_main] = f.read()
+            return snapshot.main_files[plantilla_main]
+
+    def materialize(self, plantilla_folder, job_dir, mode=MODE_TEXINPUTS):
+        """
+        Prepara job_dir para compilar con la plantilla.
+        Devuelve las variables de entorno extra para el compilador (o {}).
+        """
+        snapshot = self.get(plantilla_folder)
+        if snapshot is None:
+            return None
+
+        if mode == MODE_TEXINPUTS:
+            # '//' busca también en subcarpetas; el separador final añade las rutas por defecto
+            search_path = f"{snapshot.path}//{os.pathsep}"
+            return {
+                var: search_path + os.environ.get(var, '')
+                for var in ('TEXINPUTS', 'BIBINPUTS', 'BSTINPUTS')
+            }
+
+        for item in os.listdir(snapshot.path):
+            source = os.path.join(snapshot.path, item)
+            dest = os.path.join(job_dir, item)
+
+            if os.path.lexists(dest):
+                if os.path.isdir(dest) and not os.path.islink(dest):
+                    shutil.rmtree(dest)
+                else:
+                    os.unlink(dest)
+
+            if mode == MODE_LINK:
+                try:
+                    if os.path.isdir(source):
+                        os.symlink(source, dest, target_is_directory=True)
+                    else:
+                        os.link(source, dest)
+                    continue
+                except OSError:
+                    # Sin permisos para symlinks o distinto volumen: copiar
+                    pass
+
+            if os.path.isdir(source):
+                shutil.copytree(source, dest)
+            else:
+                shutil.copy2(source, dest)
+
+        return {}
@@ -4,17 +4,34 @@ Conexión remota a MySQL de Hostinger
 """
 
 import os
+import re
 import sys
 import io
 import time
-import tempfile
+import queue
+import shutil
+import socket
+import threading
 import subprocess
-from datetime import datetime, time as dt_time
-from pathlib import Path
-import mysql.connector
-from mysql.connector import Error
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait as wait_futures
+from datetime import datetime
+from mysql.connector import Error, errorcode, errors, pooling
 import google.generativeai as genai
 
+from conversion_cache import ConversionCache
+from gemini_client import GeminiClient
+from latex_stream import LatexStreamWriter, LatexStreamError
+from metrics import metrics, start_metrics_server
+from templates import TemplateRegistry, MODE_TEXINPUTS
+from latex_formats import FormatCache, is_format_error
+from latex_compiler import LatexCompileError, compile_error, run_latex_passes, warmup_document
+from scheduler import FairScheduler
+from pipeline import StagePipeline
+from blob_store import MySQLBlobStore
+from docx_extract import extract_document, split_sections
+from docx_latex import convert_document
+
 
 # ============= CONFIGURACIÓN =============
 # Variables de entorno requeridas
@@ -24,92 +41,573 @@ MYSQL_USER = os.environ.get('MYSQL_USER', '')
 MYSQL_PASS = os.environ.get('MYSQL_PASS', '')
 MYSQL_DB = os.environ.get('MYSQL_DB', 'editor_latex')
 
+# Pool de conexiones: tamaño (0 = uno por hilo de trabajo más los auxiliares),
+# segundos máximos esperando una conexión libre, intervalo de keepalive (debe ser
+# menor que wait_timeout del servidor) y compresión del protocolo
+MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', '0'))
+MYSQL_POOL_TIMEOUT = int(os.environ.get('MYSQL_POOL_TIMEOUT', '30'))
+MYSQL_KEEPALIVE = int(os.environ.get('MYSQL_KEEPALIVE', '60'))
+MYSQL_COMPRESS = os.environ.get('MYSQL_COMPRESS', '1') == '1'
+
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-pro')
+
+# Cuota de Gemini compartida por todos los hilos: peticiones y tokens por minuto
+# (0 = sin límite), reintentos ante errores transitorios y segundos máximos por consulta
+GEMINI_RPM = int(os.environ.get('GEMINI_RPM', '60'))
+GEMINI_TPM = int(os.environ.get('GEMINI_TPM', '1000000'))
+GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '5'))
+GEMINI_TIMEOUT = int(os.environ.get('GEMINI_TIMEOUT', '300'))
+
+# Respuestas en streaming: el .tex se escribe y valida mientras llega ('0' = desactivado)
+# y cuántas veces se repite una consulta cuya respuesta resulta mal formada
+GEMINI_STREAM = os.environ.get('GEMINI_STREAM', '1') == '1'
+STREAM_MAX_RESTARTS = int(os.environ.get('STREAM_MAX_RESTARTS', '1'))
 
 # Carpetas locales
 PLANTILLAS_FOLDER = os.environ.get('PLANTILLAS_FOLDER', r'C:\Editor-LATEX\plantillas')
 TEMP_FOLDER = os.environ.get('TEMP_FOLDER', r'C:\Editor-LATEX\temp')
 
+# Caché de conversiones de Gemini (0 = desactivada)
+CACHE_FOLDER = os.environ.get('CACHE_FOLDER', r'C:\Editor-LATEX\cache')
+CACHE_MAX_MB = int(os.environ.get('CACHE_MAX_MB', '500'))
+# Incrementar si cambian los prompts, para no reutilizar conversiones antiguas
+CACHE_VERSION = 4
+
+# Preparación del directorio de cada trabajo a partir de la plantilla:
+# 'texinputs' (sin copiar, vía TEXINPUTS), 'link' (hardlinks/symlinks) o 'copy'
+TEMPLATE_MODE = os.environ.get('TEMPLATE_MODE', 'texinputs')
+
+# Formatos precompilados del preámbulo (mylatexformat)
+# Compiladores que los usan, separados por coma ('' = desactivado). En xelatex
+# las fuentes de fontspec no se pueden volcar al formato, por eso no va por defecto.
+PRECOMPILE_FORMATS = [c for c in os.environ.get('PRECOMPILE_FORMATS', 'pdflatex').split(',') if c]
+FORMATS_FOLDER = os.environ.get('FORMATS_FOLDER', r'C:\Editor-LATEX\formats')
+
+# Documentos largos: se convierten por secciones en paralelo
+# Caracteres a partir de los cuales se divide y consultas simultáneas por documento
+SECTION_SPLIT_THRESHOLD = int(os.environ.get('SECTION_SPLIT_THRESHOLD', '15000'))
+SECTION_PARALLELISM = int(os.environ.get('SECTION_PARALLELISM', '4'))
+
+# Revisiones de un artículo (mismo usuario, revista y nombre de archivo):
+# se reutilizan las secciones sin cambios de la versión anterior ('0' = desactivado)
+REVISION_REUSE = os.environ.get('REVISION_REUSE', '1') == '1'
+
+# Conversión local sin Gemini para documentos Word sencillos
+# Confianza mínima (0-1) para aceptarla; un valor mayor que 1 la desactiva
+RULE_CONFIDENCE_MIN = float(os.environ.get('RULE_CONFIDENCE_MIN', '0.85'))
+
+# Marca donde se insertan las secciones convertidas dentro del documento
+SECTIONS_PLACEHOLDER = '%%SECCIONES%%'
+
+# Inicio de una sección en el LaTeX generado y fin del cuerpo de secciones
+SECTION_COMMAND = re.compile(r'^[ \t]*\\section\*?\s*[\[{]', re.MULTILINE)
+BODY_END_MARKERS = ('\\begin{thebibliography}', '\\bibliography{', '\\printbibliography', '\\end{document}')
+
+# Explicación del formato intermedio de docx_extract para los prompts
+CONTENT_FORMAT_HELP = """FORMATO DEL CONTENIDO:
+- '# ', '## ', '### ' son títulos de sección, subsección y subsubsección
+- **texto** es negrita y *texto* es cursiva
+- '- ' y '1. ' son elementos de lista (la sangría indica el nivel)
+- Las líneas '| a | b |' son filas de una tabla
+- $...$ y $$...$$ ya son ecuaciones en LaTeX
+- [^nota: texto] es una nota al pie en ese punto
+- ![imagen](ruta) es una figura; usa \\includegraphics con esa ruta exacta
+- Una barra invertida delante de $, *, #, |, \\ o de un "-" / "1." al inicio de un
+  párrafo indica que ese carácter es texto literal, no formato (\\$5 es "$5", no una
+  ecuación; \\* es un asterisco). Escríbelo en LaTeX como texto (\\$, \\#, \\textasteriskcentered...)"""
+
+# Máximo de pasadas de LaTeX (se detiene antes si la salida ya es estable)
+MAX_COMPILE_PASSES = int(os.environ.get('MAX_COMPILE_PASSES', '5'))
+
+# Reparación de errores de compilación: se envía a Gemini solo el fragmento que falla
+# Intentos por trabajo, segundos totales y líneas de contexto alrededor del error
+REPAIR_MAX_ATTEMPTS = int(os.environ.get('REPAIR_MAX_ATTEMPTS', '2'))
+REPAIR_TIME_LIMIT = int(os.environ.get('REPAIR_TIME_LIMIT', '120'))
+REPAIR_CONTEXT_LINES = int(os.environ.get('REPAIR_CONTEXT_LINES', '8'))
+
+# Métricas en formato Prometheus en http://localhost:METRICS_PORT/metrics (0 = desactivado)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9108'))
+
 # Horario de trabajo (8am - 5pm)
 WORK_START_HOUR = int(os.environ.get('WORK_START_HOUR', '8'))
 WORK_END_HOUR = int(os.environ.get('WORK_END_HOUR', '17'))
 
-# Intervalo de polling (segundos)
+# Intervalo de polling (segundos); con notificaciones es solo el máximo de espera
 POLL_INTERVAL = int(os.environ.get('POLL_INTERVAL', '30'))
 
+# Notificación de trabajos nuevos (tabla job_queue_signal que actualiza PHP)
+# Intervalo inicial y máximo (backoff) de consulta de la señal cuando está inactivo
+NOTIFY_MIN_INTERVAL = float(os.environ.get('NOTIFY_MIN_INTERVAL', '0.5'))
+# Por defecto llega a POLL_INTERVAL: inactivo, el worker consulta como el polling de antes
+NOTIFY_MAX_INTERVAL = float(os.environ.get('NOTIFY_MAX_INTERVAL', str(POLL_INTERVAL)))
+
+# Concurrencia: los trabajos pasan por etapas (descarga, conversión, compilación,
+# subida), cada una con sus hilos y su conexión MySQL por hilo
+# Hilos de la etapa de conversión (consultas a Gemini)
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '3'))
+# Hilos de las etapas de descarga y de subida
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', '2'))
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '2'))
+# Trabajos que pueden esperar en la cola de cada etapa (con la cola llena, la
+# etapa anterior se detiene y no se reclaman más trabajos)
+STAGE_QUEUE_SIZE = int(os.environ.get('STAGE_QUEUE_SIZE', '2'))
+# Procesos dedicados a compilar LaTeX (0 = compilar en el mismo hilo del trabajo)
+COMPILE_PROCESSES = int(os.environ.get('COMPILE_PROCESSES', str(os.cpu_count() or 1)))
+# Hilos de la etapa de compilación (0 = uno por proceso de compilación)
+COMPILE_WORKERS = int(os.environ.get('COMPILE_WORKERS', '0'))
+# Compilar cada plantilla activa al arrancar para calentar formatos y cachés (1 = sí)
+COMPILE_WARMUP = os.environ.get('COMPILE_WARMUP', '1') == '1'
+
+# Reclamo de trabajos (varios workers comparten la cola)
+WORKER_ID = os.environ.get('WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+# Duración del lease; si el worker muere, otro puede reclamar el trabajo al expirar
+LEASE_SECONDS = int(os.environ.get('LEASE_SECONDS', '300'))
+# Cada cuánto se renuevan los leases de los trabajos en curso
+HEARTBEAT_INTERVAL = int(os.environ.get('HEARTBEAT_INTERVAL', '60'))
+# Intentos máximos antes de marcar como error un trabajo abandonado
+MAX_ATTEMPTS = int(os.environ.get('MAX_ATTEMPTS', '3'))
+
+# Planificador: segundos de espera que suben un trabajo una clase de prioridad,
+# trabajos por usuario y revista que se consideran en cada reclamo y cada
+# cuánto se releen los pesos de las revistas (revista_config.peso)
+SCHEDULER_AGING_SECONDS = int(os.environ.get('SCHEDULER_AGING_SECONDS', '600'))
+SCHEDULER_WINDOW = int(os.environ.get('SCHEDULER_WINDOW', '5'))
+SCHEDULER_WEIGHTS_REFRESH = int(os.environ.get('SCHEDULER_WEIGHTS_REFRESH', '300'))
+
+# Tamaño de bloque al descargar archivos (bytes)
+FETCH_CHUNK_SIZE = int(os.environ.get('FETCH_CHUNK_SIZE', str(1024 * 1024)))
+
+# Tamaño de bloque al subir el PDF al almacén de blobs (bytes, menor que max_allowed_packet)
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+# Optimizar/linearizar el PDF con qpdf antes de subirlo (si está instalado)
+PDF_OPTIMIZE = os.environ.get('PDF_OPTIMIZE', '1') == '1'
+
+# Logs de procesamiento: se insertan en lotes desde un hilo en segundo plano
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '50'))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '2'))
+
+# Columnas de metadatos de un trabajo (sin los LONGBLOB file_data / pdf_data)
+JOB_METADATA_COLUMNS = """
+    job_id, user_id, revista_codigo, filename_original, file_extension,
+    file_size, file_sha256, status, priority, created_at, started_at, nombre, apellidos, email,
+    revista_nombre, revista_nombre_completo, compilador,
+    plantilla_folder, plantilla_main, volumen, año, numero, pagina_inicial
+"""
+
 # =========================================
 
+# Plantillas cargadas en memoria (compartidas por todos los hilos)
+template_registry = TemplateRegistry(PLANTILLAS_FOLDER)
+
+
+class MySQLPool:
+    """
+    Pool de conexiones MySQL compartido por todos los hilos.
+    Un hilo de keepalive hace ping periódicamente a las conexiones libres del
+    pool para que el servidor no las cierre por inactividad.
+    """
+
+    def __init__(self, size, keepalive=MYSQL_KEEPALIVE):
+        # Sin recortar: main() comprueba el máximo de mysql.connector al arrancar
+        self.size = max(1, size)
+        self.keepalive = keepalive
+        self._pool = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _create(self):
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=f"worker-{os.getpid()}",
+            pool_size=self.size,
+            pool_reset_session=False,
+            host=MYSQL_HOST,
+            port=MYSQL_PORT,
+            user=MYSQL_USER,
+            password=MYSQL_PASS,
+            database=MYSQL_DB,
+            charset='utf8mb4',
+            collation='utf8mb4_unicode_ci',
+            # Compresión del protocolo: los bloques de documentos y PDFs viajan comprimidos
+            compress=MYSQL_COMPRESS
+        )
+        print(f"✓ Conectado a MySQL: {MYSQL_HOST}:{MYSQL_PORT} (pool de {self.size})")
+
+        if self.keepalive > 0:
+            self._thread = threading.Thread(target=self._keepalive_loop, name='mysql-keepalive', daemon=True)
+            self._thread.start()
+
+    def get_connection(self, timeout=MYSQL_POOL_TIMEOUT):
+        """Saca una conexión del pool (espera si están todas en uso)"""
+        with self._lock:
+            if self._pool is None:
+                self._create()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self._pool.get_connection()
+            except errors.PoolError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _keepalive_loop(self):
+        """Ping a las conexiones libres (las que usa un hilo las revisa ese hilo)"""
+        while True:
+            time.sleep(self.keepalive)
+            idle = []
+            try:
+                while len(idle) < self.size:
+                    idle.append(self._pool.get_connection())
+            except errors.PoolError:
+                pass  # No quedan conexiones libres
+            except Error as e:
+                print(f"  ⚠ Keepalive MySQL: {e}")
+
+            for connection in idle:
+                try:
+                    connection.ping(reconnect=True, attempts=3, delay=1)
+                except Error as e:
+                    print(f"  ⚠ Keepalive MySQL: {e}")
+                finally:
+                    connection.close()  # Devuelve la conexión al pool
+
+
+# Pool del proceso (se conecta con la primera conexión que se pida); además de
+# los hilos de trabajo: reclamo, logs, heartbeat y calentamiento de plantillas
+mysql_pool = MySQLPool(MYSQL_POOL_SIZE or (
+    FETCH_WORKERS + MAX_WORKERS + (COMPILE_WORKERS or max(1, COMPILE_PROCESSES)) + UPLOAD_WORKERS + 4
+))
+
+
+# Errores del cliente que indican que la conexión con el servidor se perdió
+CONNECTION_LOST_ERRORS = (
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_SERVER_LOST_EXTENDED,
+    errorcode.CR_CONNECTION_ERROR,
+    errorcode.CR_CONN_HOST_ERROR,
+)
+
+
+def connection_lost(error):
+    """Indica si el error se debe a una conexión caída (y no a la consulta)"""
+    return isinstance(error, errors.InterfaceError) or (
+        isinstance(error, errors.OperationalError) and error.errno in CONNECTION_LOST_ERRORS
+    )
+
+
+class _ReusedCursor:
+    """
+    Cursor que devuelve get_cursor: usa el cursor de larga vida de la conexión.
+    close() solo descarta las filas sin leer; el cursor sigue abierto para la
+    siguiente consulta.
+    """
+
+    def __init__(self, db, prepared):
+        self._db = db
+        self._prepared = prepared
+
+    def execute(self, query, params=()):
+        self._db.run(self._prepared, 'execute', query, params)
+
+    def executemany(self, query, seq_params):
+        self._db.run(self._prepared, 'executemany', query, seq_params)
+
+    def __getattr__(self, name):
+        # fetchone, fetchall, rowcount... del cursor actual de la conexión
+        return getattr(self._db.cursor(self._prepared), name)
+
+    def close(self):
+        cursor = self._db.cursors.get(self._prepared)
+        try:
+            if cursor is not None and cursor.with_rows:
+                cursor.fetchall()
+        except Error:
+            pass
+
 
 class MySQLConnection:
-    """Manejo de conexión a MySQL remoto"""
+    """
+    Conexión a MySQL remoto tomada del pool (una por hilo).
+    Cada conexión tiene un cursor de diccionario y uno de sentencias preparadas
+    que se reutilizan en todas las consultas: mysql.connector hace un ping en
+    cada cursor() y así no hay un viaje de ida y vuelta extra por consulta.
+    Una conexión caída se detecta por el error de la consulta. La conexión se
+    toma del pool con la primera consulta, no al crear el objeto.
+    """
 
     def __init__(self):
         self.connection = None
-        self.connect()
+        self.cursors = {}
+        # Hay sentencias ejecutadas desde el último commit/rollback (no se pueden repetir)
+        self.pending = False
 
     def connect(self):
-        """Establece conexión a MySQL"""
+        """Toma una conexión del pool (el pool la revisa al entregarla)"""
         try:
-            self.connection = mysql.connector.connect(
-                host=MYSQL_HOST,
-                port=MYSQL_PORT,
-                user=MYSQL_USER,
-                password=MYSQL_PASS,
-                database=MYSQL_DB,
-                charset='utf8mb4',
-                collation='utf8mb4_unicode_ci'
-            )
-            print(f"✓ Conectado a MySQL: {MYSQL_HOST}:{MYSQL_PORT}")
+            self.connection = mysql_pool.get_connection()
+            self.cursors = {}
+            self.pending = False
         except Error as e:
             print(f"✗ Error conectando a MySQL: {e}")
             raise
 
-    def ensure_connected(self):
-        """Asegura que la conexión esté activa"""
+    def reconnect(self):
+        """Descarta la conexión actual y toma otra del pool"""
+        for cursor in self.cursors.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
         try:
-            if self.connection and self.connection.is_connected():
-                return True
-        except:
+            self.connection.close()
+        except Error:
             pass
+        self.connection = None
+        self.connect()
 
+    def cursor(self, prepared=False):
+        """Cursor de larga vida de la conexión (se crea la primera vez)"""
+        if self.connection is None:
+            self.connect()
+        cursor = self.cursors.get(prepared)
+        if cursor is None:
+            # Los preparados no admiten buffered: sus filas se descartan en close()
+            cursor = self.connection.cursor(dictionary=True, buffered=not prepared, prepared=prepared)
+            self.cursors[prepared] = cursor
+        return cursor
+
+    def get_cursor(self, prepared=False):
+        """
+        Cursor de diccionario; prepared=True reutiliza la sentencia preparada
+        cuando se ejecuta la misma consulta varias veces (p. ej. bloques de un blob)
+        """
+        return _ReusedCursor(self, prepared)
+
+    def _retry(self, error):
+        """
+        Tras un error de conexión, toma otra conexión. Devuelve True si la
+        operación puede repetirse: solo si no había nada pendiente de confirmar
+        """
+        if not connection_lost(error):
+            return False
+        retry = not self.pending
         print("⚠ Reconectando a MySQL...")
-        self.connect()
-        return self.connection.is_connected()
+        self.reconnect()
+        return retry
 
-    def get_cursor(self):
-        """Obtiene cursor asegurando conexión"""
-        self.ensure_connected()
-        return self.connection.cursor(dictionary=True)
+    def run(self, prepared, method, query, params):
+        """Ejecuta en el cursor de la conexión; reconecta si la conexión estaba caída"""
+        try:
+            getattr(self.cursor(prepared), method)(query, params)
+        except (errors.OperationalError, errors.InterfaceError) as e:
+            if not self._retry(e):
+                raise
+            getattr(self.cursor(prepared), method)(query, params)
+        self.pending = True
+
+    def start_transaction(self):
+        """Inicia una transacción explícita"""
+        if self.connection is None:
+            self.connect()
+        try:
+            self.connection.start_transaction()
+        except (errors.OperationalError, errors.InterfaceError) as e:
+            if not self._retry(e):
+                raise
+            self.connection.start_transaction()
+        self.pending = True
 
     def commit(self):
         """Commit de transacción"""
         if self.connection:
             self.connection.commit()
+            self.pending = False
+
+    def rollback(self):
+        """Rollback de transacción"""
+        try:
+            if self.connection:
+                self.connection.rollback()
+        except Error:
+            pass
+        self.pending = False
 
     def close(self):
-        """Cierra conexión"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("✓ Conexión MySQL cerrada")
+        """Devuelve la conexión al pool"""
+        if self.connection:
+            for cursor in self.cursors.values():
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+            self.cursors = {}
+            try:
+                self.connection.close()
+            except Error:
+                pass
+            self.connection = None
+
+
+class ProcessingLogWriter:
+    """Inserta processing_logs en lotes desde un hilo con su propia conexión"""
+
+    def __init__(self, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.db = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, job_id, level, message):
+        """Encola una línea de log (no bloquea)"""
+        self._queue.put((job_id, level, message))
+
+    def flush(self, wait=False):
+        """Fuerza la escritura de lo pendiente (p. ej. al terminar un trabajo)"""
+        done = threading.Event()
+        self._queue.put(done)
+        if wait:
+            done.wait()
 
+    def close(self):
+        """Escribe lo pendiente y detiene el hilo"""
+        self._queue.put(None)
+        self._thread.join()
+        if self.db:
+            self.db.close()
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False  # Se cumplió el intervalo de escritura
+
+            if isinstance(item, tuple):
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size:
+                    continue
+
+            if pending:
+                self._write(pending)
+                pending = []
+            deadline = None
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def _write(self, rows):
+        """Un solo INSERT multi-fila y un commit por lote"""
+        try:
+            if self.db is None:
+                self.db = MySQLConnection()
+            cursor = self.db.get_cursor()
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(rows))
+            cursor.execute(
+                f"INSERT INTO processing_logs (job_id, log_level, message) VALUES {placeholders}",
+                tuple(value for row in rows for value in row)
+            )
+            self.db.commit()
+            cursor.close()
+        except Exception as e:
+            if self.db:
+                self.db.rollback()
+            print(f"  ⚠ Error al guardar {len(rows)} log(s): {e}")
 
-class DocumentProcessor:
-    """Procesa documentos usando Gemini API"""
 
-    def __init__(self, api_key, db_connection):
-        if not api_key:
-            raise ValueError("Se requiere GEMINI_API_KEY")
+class JobNotifier:
+    """Detecta trabajos nuevos consultando una secuencia de una sola fila"""
 
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
+    def __init__(self, db_connection):
         self.db = db_connection
+        self.enabled = True
+        # El backoff se conserva entre esperas: un worker inactivo acaba
+        # consultando cada NOTIFY_MAX_INTERVAL, no cada NOTIFY_MIN_INTERVAL
+        self.interval = NOTIFY_MIN_INTERVAL
+        self.last_seq = self.current_seq()
+
+    def current_seq(self):
+        """Lee la secuencia que PHP incrementa con cada trabajo nuevo"""
+        try:
+            cursor = self.db.get_cursor()
+            cursor.execute("SELECT seq FROM job_queue_signal WHERE id = 1")
+            row = cursor.fetchone()
+            # Terminar la transacción para ver los cambios de otras conexiones
+            self.db.commit()
+            cursor.close()
+            return row['seq'] if row else 0
+        except Exception as e:
+            self.db.rollback()
+            print(f"⚠ Notificaciones desactivadas ({e}). Se usará polling.")
+            self.enabled = False
+            return None
+
+    def reset(self):
+        """Vuelve al intervalo mínimo (hay actividad, puede llegar más trabajo)"""
+        self.interval = NOTIFY_MIN_INTERVAL
+
+    def wait(self, timeout):
+        """
+        Espera hasta que llegue un trabajo nuevo (True) o pase timeout (False).
+        La consulta de la señal se espacia con backoff mientras no hay actividad.
+        """
+        deadline = time.monotonic() + timeout
 
-        # Crear carpetas
-        os.makedirs(PLANTILLAS_FOLDER, exist_ok=True)
-        os.makedirs(TEMP_FOLDER, exist_ok=True)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            # Al volver se consulta la cola de todas formas: si el intervalo ya
+            # alcanza el plazo, leer la señal sería una consulta de más
+            if not self.enabled or self.interval >= remaining:
+                time.sleep(remaining)
+                return False
+
+            time.sleep(self.interval)
+
+            seq = self.current_seq()
+            if seq is not None and seq != self.last_seq:
+                self.last_seq = seq
+                self.reset()
+                return True
+
+            self.interval = min(self.interval * 2, NOTIFY_MAX_INTERVAL)
+
+
+class MySQLJobSource:
+    """
+    Origen y destino de trabajos en la cola MySQL: reclamo con lease, descarga
+    de file_data, PDF por bloques y logs en processing_logs
+    """
+
+    def __init__(self, db_connection, log_writer=None):
+        self.db = db_connection
+        # Escritor de logs en lotes (None = un INSERT por línea)
+        self.log_writer = log_writer
+        # Documentos y PDFs por SHA-256 (deduplicados)
+        self.blobs = MySQLBlobStore(UPLOAD_CHUNK_SIZE)
+        # Orden de reclamo: prioridad, envejecimiento y reparto entre revistas y usuarios
+        self.scheduler = FairScheduler(SCHEDULER_AGING_SECONDS)
+        self._weights_loaded = float('-inf')
 
     def log(self, job_id, level, message):
         """Registra log en base de datos"""
+        if self.log_writer:
+            self.log_writer.write(job_id, level, message)
+            return
+
         try:
             cursor = self.db.get_cursor()
             cursor.execute(
@@ -119,121 +617,495 @@ class DocumentProcessor:
             self.db.commit()
             cursor.close()
         except Exception as e:
+            # Sin autocommit la transacción implícita quedaría abierta en la conexión
+            self.db.rollback()
             print(f"  ⚠ Error al guardar log: {e}")
 
-    def get_pending_jobs(self):
-        """Obtiene trabajos pendientes de la base de datos"""
+    def claim(self, limit=5):
+        """Reclama trabajos pendientes de forma atómica (lease por worker)"""
+        cursor = None
         try:
             cursor = self.db.get_cursor()
+
+            # Trabajos abandonados demasiadas veces se marcan como error
             cursor.execute("""
-                SELECT * FROM v_jobs_with_config
-                WHERE status = 'pending'
-                ORDER BY created_at ASC
-                LIMIT 5
-            """)
+                UPDATE jobs
+                SET status = 'error',
+                    error_message = 'El trabajo se abandonó demasiadas veces',
+                    lease_owner = NULL, lease_expires = NULL
+                WHERE status = 'processing'
+                AND lease_expires < NOW()
+                AND attempts >= %s
+            """, (MAX_ATTEMPTS,))
+            self.db.commit()
+
+            # Orden de reclamo según prioridad y reparto entre revistas y usuarios
+            ordered = self.schedule(cursor, limit)
+
+            # SKIP LOCKED: otros workers saltan las filas que estamos reclamando.
+            # Si otro worker se llevó alguno, se sigue con los siguientes del orden.
+            self.db.start_transaction()
+            job_ids = []
+            position = 0
+            while len(job_ids) < limit and position < len(ordered):
+                batch = ordered[position:position + limit - len(job_ids)]
+                position += len(batch)
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"""
+                    SELECT job_id FROM jobs
+                    WHERE job_id IN ({placeholders})
+                    AND (status = 'pending'
+                    OR (status = 'processing' AND lease_expires < NOW()))
+                    FOR UPDATE SKIP LOCKED
+                """, tuple(batch))
+                locked = {row['job_id'] for row in cursor.fetchall()}
+                job_ids.extend(job_id for job_id in batch if job_id in locked)
+
+            if job_ids:
+                placeholders = ', '.join(['%s'] * len(job_ids))
+                cursor.execute(f"""
+                    UPDATE jobs
+                    SET status = 'processing',
+                        started_at = NOW(),
+                        lease_owner = %s,
+                        lease_expires = DATE_ADD(NOW(), INTERVAL %s SECOND),
+                        heartbeat_at = NOW(),
+                        attempts = attempts + 1
+                    WHERE job_id IN ({placeholders})
+                """, (WORKER_ID, LEASE_SECONDS, *job_ids))
+            self.db.commit()
+
+            if not job_ids:
+                cursor.close()
+                return []
+
+            # Solo metadatos; file_data se descarga al procesar cada trabajo
+            cursor.execute(f"""
+                SELECT {JOB_METADATA_COLUMNS} FROM v_jobs_with_config
+                WHERE job_id IN ({placeholders})
+            """, tuple(job_ids))
             jobs = cursor.fetchall()
             cursor.close()
+            # En el orden del planificador (el pool los empieza en ese orden)
+            jobs.sort(key=lambda job: job_ids.index(job['job_id']))
             return jobs
         except Exception as e:
-            print(f"✗ Error obteniendo trabajos: {e}")
+            self.db.rollback()
+            if cursor:
+                cursor.close()
+            print(f"✗ Error reclamando trabajos: {e}")
             return []
 
-    def update_job_status(self, job_id, status, error_message=None):
-        """Actualiza estado de un trabajo"""
+    def schedule(self, cursor, limit):
+        """job_id reclamables en el orden del planificador (sin bloquear filas)"""
+        # Pesos de las revistas (cambian poco: se releen cada SCHEDULER_WEIGHTS_REFRESH)
+        if time.monotonic() - self._weights_loaded > SCHEDULER_WEIGHTS_REFRESH:
+            cursor.execute("SELECT codigo, peso FROM revista_config")
+            self.scheduler.weights = {row['codigo']: row['peso'] for row in cursor.fetchall()}
+            self._weights_loaded = time.monotonic()
+
+        # Los primeros trabajos de cada usuario en cada revista: basta para repartir
+        # aunque un usuario tenga cientos en cola
+        cursor.execute("""
+            SELECT job_id, user_id, revista_codigo, priority, created_at, checked_at
+            FROM (
+                SELECT job_id, user_id, revista_codigo, priority, created_at,
+                       NOW() AS checked_at,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY revista_codigo, user_id
+                           ORDER BY priority DESC, created_at ASC
+                       ) AS position
+                FROM jobs
+                WHERE status = 'pending'
+                OR (status = 'processing' AND lease_expires < NOW())
+            ) candidates
+            WHERE position <= %s
+        """, (max(limit, SCHEDULER_WINDOW),))
+        candidates = cursor.fetchall()
+        if not candidates:
+            self.db.commit()
+            return []
+        for job in candidates:
+            job['wait_seconds'] = max(0, (job['checked_at'] - job['created_at']).total_seconds())
+
+        # Trabajos en curso de todos los workers (servicio ya recibido)
+        cursor.execute("""
+            SELECT revista_codigo, user_id, COUNT(*) AS running FROM jobs
+            WHERE status = 'processing' AND lease_expires >= NOW()
+            GROUP BY revista_codigo, user_id
+        """)
+        running = cursor.fetchall()
+        self.db.commit()
+
+        return self.scheduler.order(candidates, running)
+
+    def fetch(self, job):
+        """Descarga el archivo del trabajo (del almacén de blobs o, en trabajos antiguos, de file_data)"""
+        job_id = job['job_id']
+        # Sentencias preparadas: la lectura de cada bloque reutiliza la misma
+        cursor = self.db.get_cursor(prepared=True)
         try:
-            cursor = self.db.get_cursor()
+            if job.get('file_sha256'):
+                data = self.blobs.read(cursor, job['file_sha256'])
+                metrics.inc('bytes_total', len(data), direction='download')
+                return data
 
-            if status == 'processing':
-                cursor.execute(
-                    "UPDATE jobs SET status = %s, started_at = NOW() WHERE job_id = %s",
-                    (status, job_id)
-                )
-            elif status == 'completed':
-                cursor.execute(
-                    "UPDATE jobs SET status = %s, completed_at = NOW() WHERE job_id = %s",
-                    (status, job_id)
-                )
-            elif status == 'error':
+            # Trabajos creados antes del almacén: file_data por bloques
+            cursor.execute(
+                "SELECT LENGTH(file_data) AS length FROM jobs WHERE job_id = %s",
+                (job_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                raise Exception(f"Trabajo no encontrado: {job_id}")
+
+            total = row['length'] or 0
+            buffer = io.BytesIO()
+            offset = 1  # SUBSTRING es 1-indexado
+
+            while offset <= total:
                 cursor.execute(
-                    "UPDATE jobs SET status = %s, error_message = %s WHERE job_id = %s",
-                    (status, error_message, job_id)
+                    "SELECT SUBSTRING(file_data, %s, %s) AS chunk FROM jobs WHERE job_id = %s",
+                    (offset, FETCH_CHUNK_SIZE, job_id)
                 )
+                chunk = cursor.fetchone()['chunk']
+                if not chunk:
+                    break
+                buffer.write(chunk)
+                offset += len(chunk)
+
+            metrics.inc('bytes_total', buffer.tell(), direction='download')
+            return buffer.getvalue()
+        finally:
+            # Terminar la transacción de lectura (la conexión se reutiliza)
+            self.db.commit()
+            cursor.close()
 
+    def renew_leases(self, job_ids):
+        """
+        Heartbeat: extiende el lease de los trabajos en curso de este worker.
+        Solo los indicados: el lease de un trabajo que se perdió sin poder marcarlo
+        (p. ej. sin conexión) caduca y otro worker lo vuelve a reclamar.
+        """
+        if not job_ids:
+            return
+        try:
+            placeholders = ', '.join(['%s'] * len(job_ids))
+            cursor = self.db.get_cursor()
+            cursor.execute(f"""
+                UPDATE jobs
+                SET lease_expires = DATE_ADD(NOW(), INTERVAL %s SECOND),
+                    heartbeat_at = NOW()
+                WHERE lease_owner = %s
+                AND status = 'processing'
+                AND job_id IN ({placeholders})
+            """, (LEASE_SECONDS, WORKER_ID, *job_ids))
             self.db.commit()
             cursor.close()
         except Exception as e:
+            self.db.rollback()
+            print(f"  ⚠ Error renovando leases: {e}")
+
+    def fail(self, job, error_message):
+        """Marca el trabajo como error y para notificación en un solo UPDATE"""
+        job_id = job['job_id']
+        try:
+            cursor = self.db.get_cursor()
+            cursor.execute(
+                """UPDATE jobs SET status = 'error', error_message = %s, notified = FALSE,
+                   lease_owner = NULL, lease_expires = NULL
+                   WHERE job_id = %s AND lease_owner = %s""",
+                (error_message, job_id, WORKER_ID)
+            )
+            self.db.commit()
+            cursor.close()
+        except Exception as e:
+            self.db.rollback()
             print(f"  ✗ Error actualizando estado: {e}")
 
-    def save_pdf(self, job_id, pdf_path):
-        """Guarda PDF en la base de datos"""
+    def complete(self, job, pdf_path):
+        """
+        Guarda el PDF en el almacén (si no estaba ya) y marca el trabajo como
+        completado y para notificación, todo en una sola transacción
+        """
+        job_id = job['job_id']
+        cursor = None
         try:
-            with open(pdf_path, 'rb') as f:
-                pdf_data = f.read()
+            cursor = self.db.get_cursor(prepared=True)
+            self.db.start_transaction()
 
-            pdf_size = len(pdf_data)
+            pdf_sha256, pdf_size, chunks, stored = self.blobs.put_file(cursor, pdf_path)
 
-            cursor = self.db.get_cursor()
             cursor.execute(
-                "UPDATE jobs SET pdf_data = %s, pdf_size = %s WHERE job_id = %s",
-                (pdf_data, pdf_size, job_id)
+                """UPDATE jobs SET pdf_data = NULL, pdf_sha256 = %s, pdf_size = %s, pdf_chunks = NULL,
+                   status = 'completed', completed_at = NOW(), notified = FALSE,
+                   lease_owner = NULL, lease_expires = NULL
+                   WHERE job_id = %s AND lease_owner = %s""",
+                (pdf_sha256, pdf_size, job_id, WORKER_ID)
             )
+            if cursor.rowcount == 0:
+                raise Exception("El lease del trabajo expiró y lo reclamó otro worker")
+
             self.db.commit()
             cursor.close()
 
-            print(f"  ✓ PDF guardado ({pdf_size / 1024:.2f} KB)")
+            if stored:
+                metrics.inc('bytes_total', pdf_size, direction='upload')
+                print(f"  ✓ PDF guardado ({pdf_size / 1024:.2f} KB en {chunks} bloque(s))")
+            else:
+                metrics.inc('blob_dedup_total', kind='pdf')
+                print(f"  ✓ PDF ya almacenado ({pdf_size / 1024:.2f} KB), no se vuelve a subir")
         except Exception as e:
+            self.db.rollback()
+            if cursor:
+                cursor.close()
             print(f"  ✗ Error guardando PDF: {e}")
             raise
 
-    def notify_user(self, job_id, status):
-        """Marca trabajo para notificación (PHP enviará el email)"""
+    def previous_sections(self, job):
+        """
+        Secciones de la última versión completada del mismo artículo (mismo
+        usuario, revista y nombre de archivo): {section_index: (hash, latex)}, o None
+        """
+        cursor = self.db.get_cursor()
+        try:
+            cursor.execute("""
+                SELECT j.job_id FROM jobs j
+                WHERE j.user_id = %s AND j.revista_codigo = %s AND j.filename_original = %s
+                AND j.status = 'completed' AND j.job_id <> %s
+                AND EXISTS (SELECT 1 FROM job_sections s WHERE s.job_id = j.job_id)
+                ORDER BY j.completed_at DESC
+                LIMIT 1
+            """, (job['user_id'], job['revista_codigo'], job['filename_original'], job['job_id']))
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            cursor.execute(
+                "SELECT section_index, content_sha256, latex FROM job_sections WHERE job_id = %s",
+                (row['job_id'],)
+            )
+            return {
+                section['section_index']: (section['content_sha256'], section['latex'])
+                for section in cursor.fetchall()
+            }
+        finally:
+            self.db.commit()
+            cursor.close()
+
+    def save_sections(self, job, sections):
+        """Guarda las secciones del trabajo: lista de (section_index, hash, latex)"""
+        cursor = None
         try:
             cursor = self.db.get_cursor()
+            self.db.start_transaction()
+            cursor.execute("DELETE FROM job_sections WHERE job_id = %s", (job['job_id'],))
+            cursor.executemany(
+                "INSERT INTO job_sections (job_id, section_index, content_sha256, latex) "
+                "VALUES (%s, %s, %s, %s)",
+                [(job['job_id'], index, sha256, latex) for index, sha256, latex in sections]
+            )
+            self.db.commit()
+            cursor.close()
+        except Exception:
+            self.db.rollback()
+            if cursor:
+                cursor.close()
+            raise
+
+    def active_templates(self):
+        """Plantillas de las revistas activas (compilador, carpeta y archivo principal)"""
+        cursor = self.db.get_cursor()
+        try:
             cursor.execute(
-                "UPDATE jobs SET notified = FALSE WHERE job_id = %s",
-                (job_id,)
+                "SELECT DISTINCT compilador, plantilla_folder, plantilla_main "
+                "FROM revista_config WHERE activa = TRUE"
             )
+            return cursor.fetchall()
+        finally:
             self.db.commit()
             cursor.close()
-        except Exception as e:
-            print(f"  ⚠ Error marcando para notificación: {e}")
 
-    def process_word_to_latex(self, word_data, plantilla_folder, plantilla_main, job):
-        """Convierte documento Word a LaTeX usando Gemini"""
-        print(f"  → Procesando Word con Gemini...")
+    def flush(self):
+        """Envía los logs pendientes del trabajo"""
+        if self.log_writer:
+            self.log_writer.flush()
+
+    def close(self):
+        self.db.close()
+
+
+def create_gemini_client(api_key):
+    """Cliente de Gemini con los límites configurados"""
+    genai.configure(api_key=api_key)
+    return GeminiClient(
+        genai.GenerativeModel(GEMINI_MODEL),
+        rpm=GEMINI_RPM,
+        tpm=GEMINI_TPM,
+        max_retries=GEMINI_MAX_RETRIES,
+        timeout=GEMINI_TIMEOUT,
+        metrics=metrics
+    )
+
+
+class DocumentProcessor:
+    """
+    Motor de procesamiento: convierte y compila los trabajos de un origen
+    (cola MySQL, carpeta vigilada...) y entrega el resultado a un destino
+    """
+
+    def __init__(self, api_key, source, compile_executor=None, cache=None, formats=None,
+                 gemini=None, sink=None):
+        if not api_key:
+            raise ValueError("Se requiere GEMINI_API_KEY")
+
+        # Cliente de Gemini (compartido entre hilos para respetar la cuota)
+        self.gemini = gemini or create_gemini_client(api_key)
+        # Origen de los trabajos (fetch) y destino de PDFs, errores y logs
+        # (complete, fail, log, flush); por defecto el mismo objeto
+        self.source = source
+        self.sink = sink or source
+        # Pool de procesos para compilar (None = compilar en este hilo)
+        self.compile_executor = compile_executor
+        # Caché de conversiones compartida entre hilos (None = sin caché)
+        self.cache = cache
+        # Formatos .fmt precompilados (None = compilar sin formato)
+        self.formats = formats
+
+        # Crear carpetas
+        os.makedirs(PLANTILLAS_FOLDER, exist_ok=True)
+        os.makedirs(TEMP_FOLDER, exist_ok=True)
+
+    def log(self, job_id, level, message):
+        """Registra una línea de log del trabajo en el destino"""
+        self.sink.log(job_id, level, message)
+
+    def optimize_pdf(self, pdf_path):
+        """Comprime y lineariza el PDF con qpdf; devuelve la ruta a subir"""
+        qpdf = shutil.which('qpdf')
+        if not PDF_OPTIMIZE or not qpdf:
+            return pdf_path
+
+        optimized = f"{pdf_path[:-4]}.opt.pdf"
+        result = subprocess.run(
+            [qpdf, '--linearize', '--object-streams=generate', '--compress-streams=y',
+             pdf_path, optimized],
+            capture_output=True,
+            text=True,
+            timeout=120
+        )
+        # qpdf devuelve 3 cuando termina con advertencias
+        if result.returncode not in (0, 3) or not os.path.exists(optimized):
+            print(f"  ⚠ No se pudo optimizar el PDF: {result.stderr.strip()[:200]}")
+            return pdf_path
+
+        if os.path.getsize(optimized) >= os.path.getsize(pdf_path):
+            return pdf_path
+        return optimized
+
+    def read_plantilla(self, plantilla_folder, plantilla_main):
+        """Plantilla principal (main.tex) desde el registro; None si no existe"""
+        plantilla_content = template_registry.read_main(plantilla_folder, plantilla_main)
+        if plantilla_content is None:
+            print(f"  ⚠ Plantilla no encontrada: {os.path.join(plantilla_folder, plantilla_main)}")
+        return plantilla_content
+
+    def conversion_key(self, kind, file_data, plantilla_content, job):
+        """Clave de caché: documento + plantilla + metadatos + modelo"""
+        return ConversionCache.make_key(
+            CACHE_VERSION, kind, GEMINI_MODEL, file_data, plantilla_content or '',
+            job['volumen'], job['año'], job['numero'], job['pagina_inicial']
+        )
+
+    def job_cache_key(self, job, file_data):
+        """Clave de caché de la conversión de un trabajo"""
+        kind = 'tex' if job['file_extension'] == 'tex' else 'word'
+        plantilla_content = self.read_plantilla(job['plantilla_folder'], job['plantilla_main'])
+        return self.conversion_key(kind, file_data, plantilla_content, job)
+
+    def generate_latex(self, prompt, path=None, document=True):
+        """
+        LaTeX generado por Gemini, sin bloques de código markdown.
+        En streaming se escribe en path según llega y se valida su estructura
+        (document=False para fragmentos sin preámbulo).
+        """
+        if not GEMINI_STREAM:
+            return clean_latex_response(self.gemini.generate(prompt))
+
+        for attempt in range(STREAM_MAX_RESTARTS + 1):
+            sink = LatexStreamWriter(path, require_document=document)
+            try:
+                self.gemini.generate(prompt, sink=sink)
+                return sink.finish()
+            except LatexStreamError as e:
+                if attempt == STREAM_MAX_RESTARTS:
+                    raise Exception(f"Respuesta de Gemini mal formada: {e}") from e
+                print(f"  ⚠ Respuesta de Gemini mal formada ({e}), repitiendo consulta...")
+            finally:
+                sink.close()
+
+    def process_word_to_latex(self, word_data, plantilla_folder, plantilla_main, job, use_local=True):
+        """Convierte documento Word a LaTeX (localmente si es sencillo, si no con Gemini)"""
+        print("  → Procesando Word...")
 
         try:
-            # Guardar archivo Word temporalmente
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-                tmp.write(word_data)
-                word_file = tmp.name
+            # Leer plantilla principal (main.tex)
+            plantilla_content = self.read_plantilla(plantilla_folder, plantilla_main) or ""
 
-            # Leer con python-docx
+            # Extraer contenido en memoria (imágenes, tablas, ecuaciones...)
             try:
-                from docx import Document
-                doc = Document(word_file)
+                extracted = extract_document(word_data)
             except ImportError:
                 print("  → Instalando python-docx...")
                 subprocess.run([sys.executable, '-m', 'pip', 'install', 'python-docx'],
                              capture_output=True)
-                from docx import Document
-                doc = Document(word_file)
-
-            # Extraer texto
-            content = '\n'.join([para.text for para in doc.paragraphs])
-
-            # Limpiar archivo temporal
-            os.unlink(word_file)
-
-            # Leer plantilla principal (main.tex)
-            plantilla_path = os.path.join(PLANTILLAS_FOLDER, plantilla_folder, plantilla_main)
-            plantilla_content = ""
-
-            if os.path.exists(plantilla_path):
-                with open(plantilla_path, 'r', encoding='utf-8') as f:
-                    plantilla_content = f.read()
-            else:
-                print(f"  ⚠ Plantilla no encontrada: {plantilla_path}")
+                extracted = extract_document(word_data)
+
+            # Las imágenes se extraen una vez y se dejan en el directorio del trabajo
+            if extracted.images:
+                extracted.write_images(os.path.join(TEMP_FOLDER, job['job_id']))
+
+            # Hash de cada sección: permite reutilizarlas en una revisión del artículo
+            front_matter, sections = split_sections(extracted.blocks)
+            if sections:
+                job['section_keys'] = self.section_keys(front_matter, sections, plantilla_content, job)
+
+            # Reenvío idéntico: reutilizar la conversión anterior
+            cache_key = self.conversion_key('word', word_data, plantilla_content, job)
+            if self.cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    print("  ✓ LaTeX recuperado de caché")
+                    job['conversion'] = 'cache'
+                    return cached
+
+            # Documento sencillo: conversión directa a la plantilla, sin Gemini
+            if use_local and RULE_CONFIDENCE_MIN <= 1:
+                latex_content, confidence = convert_document(extracted, plantilla_content, job)
+                if latex_content and confidence >= RULE_CONFIDENCE_MIN:
+                    print(f"  ✓ Conversión local (confianza {confidence:.2f})")
+                    job['conversion'] = 'local'
+                    return latex_content
+                print(f"  → Confianza de conversión local {confidence:.2f}, se usa Gemini")
+
+            # Revisión de un artículo ya procesado: solo las secciones que cambiaron
+            if sections and REVISION_REUSE:
+                latex_content = self.convert_revision(front_matter, sections, plantilla_content, job)
+                if latex_content is not None:
+                    job['conversion'] = 'revision'
+                    if self.cache:
+                        self.cache.put(cache_key, latex_content)
+                    return latex_content
+
+            job['conversion'] = 'gemini'
+            content = extracted.to_markup()
+
+            # Documento largo: convertir por secciones en paralelo
+            if len(content) > SECTION_SPLIT_THRESHOLD and len(sections) > 1:
+                latex_content = self.convert_by_sections(front_matter, sections, plantilla_content, job)
+                if self.cache:
+                    self.cache.put(cache_key, latex_content)
+                return latex_content
 
             # Prompt para Gemini
             prompt = f"""
@@ -245,6 +1117,8 @@ PLANTILLA DE LA REVISTA:
 CONTENIDO DEL DOCUMENTO:
 {content}
 
+{CONTENT_FORMAT_HELP}
+
 METADATOS:
 - Volumen: {job['volumen']}
 - Año: {job['año']}
@@ -262,11 +1136,10 @@ Devuelve SOLO el código LaTeX completo, sin bloques de código markdown.
 """
 
             print("  → Consultando Gemini API...")
-            response = self.model.generate_content(prompt)
-            latex_content = response.text
+            latex_content = self.generate_latex(prompt, self.job_tex_path(job['job_id']))
 
-            # Limpiar respuesta
-            latex_content = latex_content.replace('```latex', '').replace('```', '').strip()
+            if self.cache:
+                self.cache.put(cache_key, latex_content)
 
             return latex_content
 
@@ -274,20 +1147,178 @@ Devuelve SOLO el código LaTeX completo, sin bloques de código markdown.
             print(f"  ✗ Error procesando Word: {e}")
             raise
 
+    def convert_frame(self, front_matter, sections, plantilla_content, job):
+        """Documento completo sin el cuerpo: preámbulo, título, autores, resumen"""
+        titles = '\n'.join(f"- {section.title}" for section in sections)
+        prompt = f"""
+Eres un experto en LaTeX. Genera el documento LaTeX completo siguiendo esta plantilla,
+pero SIN el contenido de las secciones.
+
+PLANTILLA DE LA REVISTA:
+{plantilla_content or 'Usa una plantilla estándar de artículo académico'}
+
+INICIO DEL DOCUMENTO (título, autores, resumen, palabras clave):
+{front_matter}
+
+{CONTENT_FORMAT_HELP}
+
+SECCIONES DEL DOCUMENTO (se convierten por separado):
+{titles}
+
+METADATOS:
+- Volumen: {job['volumen']}
+- Año: {job['año']}
+- Número: {job['numero']}
+- Página inicial: {job['pagina_inicial']}
+
+INSTRUCCIONES:
+1. Mantén la estructura de la plantilla
+2. Convierte el inicio del documento (título, autores, resumen) a LaTeX
+3. Escribe una línea que contenga exactamente {SECTIONS_PLACEHOLDER} donde deben ir las secciones
+4. NO escribas el contenido de las secciones
+5. Asegúrate de que el código LaTeX sea compilable
+
+Devuelve SOLO el código LaTeX completo, sin bloques de código markdown.
+"""
+        return self.generate_latex(prompt)
+
+    def convert_section(self, section, plantilla_content, job):
+        """Convierte una sección a un fragmento LaTeX (sin preámbulo)"""
+        prompt = f"""
+Eres un experto en LaTeX. Convierte la siguiente sección de un artículo a LaTeX.
+La sección se insertará dentro del cuerpo de un documento que usa esta plantilla.
+
+PLANTILLA DE LA REVISTA (solo como referencia de comandos disponibles):
+{plantilla_content or 'Plantilla estándar de artículo académico'}
+
+SECCIÓN:
+{section.text}
+
+{CONTENT_FORMAT_HELP}
+
+INSTRUCCIONES:
+1. Empieza con \\section{{{section.title}}}
+2. Convierte formato (negritas, cursivas, listas, subtítulos) a comandos LaTeX
+3. NO incluyas \\documentclass, preámbulo, \\begin{{document}} ni \\end{{document}}
+4. NO incluyas explicaciones, solo devuelve el fragmento LaTeX
+
+Devuelve SOLO el fragmento LaTeX, sin bloques de código markdown.
+"""
+        return strip_document_wrapper(self.generate_latex(prompt, document=False))
+
+    def convert_by_sections(self, front_matter, sections, plantilla_content, job):
+        """Convierte el marco y las secciones en paralelo y los une"""
+        print(f"  → Documento largo: {len(sections)} secciones en paralelo...")
+
+        workers = max(1, SECTION_PARALLELISM)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='seccion') as executor:
+            frame_future = executor.submit(self.convert_frame, front_matter, sections, plantilla_content, job)
+            section_futures = [
+                executor.submit(self.convert_section, section, plantilla_content, job)
+                for section in sections
+            ]
+            frame = frame_future.result()
+            body = '\n\n'.join(future.result() for future in section_futures)
+
+        return insert_sections(frame, body)
+
+    def section_keys(self, front_matter, sections, plantilla_content, job):
+        """Claves del marco y de cada sección: contenido de origen + plantilla + modelo"""
+        context = (CACHE_VERSION, GEMINI_MODEL, plantilla_content or '')
+        frame_key = ConversionCache.make_key(
+            *context, 'frame', front_matter, '\n'.join(section.title for section in sections),
+            job['volumen'], job['año'], job['numero'], job['pagina_inicial']
+        )
+        return frame_key, [ConversionCache.make_key(*context, 'section', section.text) for section in sections]
+
+    def convert_revision(self, front_matter, sections, plantilla_content, job):
+        """
+        Reutiliza el LaTeX de la versión anterior del artículo y convierte con
+        Gemini solo el marco y las secciones que cambiaron. None si no hay
+        versión anterior o no se puede aprovechar ninguna parte.
+        """
+        try:
+            previous = self.source.previous_sections(job)
+        except Exception as e:
+            print(f"  ⚠ Error buscando la versión anterior: {e}")
+            return None
+        if not previous:
+            return None
+
+        frame_key, keys = job['section_keys']
+        # Las secciones se buscan por contenido: da igual si se movieron o se insertaron otras
+        reusable = {sha256: latex for index, (sha256, latex) in previous.items() if index >= 0}
+        previous_frame = previous.get(-1)
+        reuse_frame = previous_frame is not None and previous_frame[0] == frame_key
+        changed = [index for index, key in enumerate(keys) if key not in reusable]
+        if len(changed) == len(sections) and not reuse_frame:
+            return None
+
+        reused = len(sections) - len(changed)
+        print(f"  → Revisión: {reused}/{len(sections)} secciones sin cambios"
+              f"{', marco sin cambios' if reuse_frame else ''}")
+        self.log(job['job_id'], 'info',
+                 f'Revisión de una versión anterior: se reutilizan {reused} de {len(sections)} secciones')
+
+        workers = max(1, SECTION_PARALLELISM)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='seccion') as executor:
+            frame_future = None
+            if not reuse_frame:
+                frame_future = executor.submit(self.convert_frame, front_matter, sections, plantilla_content, job)
+            section_futures = {
+                index: executor.submit(self.convert_section, sections[index], plantilla_content, job)
+                for index in changed
+            }
+            frame = previous_frame[1] if reuse_frame else frame_future.result()
+            body = '\n\n'.join(
+                section_futures[index].result() if index in section_futures else reusable[key]
+                for index, key in enumerate(keys)
+            )
+
+        metrics.inc('revision_sections_total', reused, result='reused')
+        metrics.inc('revision_sections_total', len(changed), result='converted')
+        return insert_sections(frame, body)
+
+    def save_sections(self, job, latex_content):
+        """
+        Guarda el marco y las secciones del LaTeX compilado con sus claves, para
+        reutilizarlos en la próxima revisión del artículo
+        """
+        split = split_latex_sections(latex_content)
+        frame_key, keys = job['section_keys']
+        if not split or len(split[1]) != len(keys):
+            # Las secciones del LaTeX no corresponden una a una con las del documento
+            return
+
+        frame, fragments = split
+        rows = [(-1, frame_key, frame)]
+        rows.extend((index, key, fragment) for index, (key, fragment) in enumerate(zip(keys, fragments)))
+        try:
+            self.sink.save_sections(job, rows)
+        except Exception as e:
+            print(f"  ⚠ Error guardando secciones: {e}")
+
     def process_latex_file(self, latex_data, plantilla_folder, plantilla_main, job):
         """Procesa archivo LaTeX existente"""
-        print(f"  → Procesando LaTeX...")
+        print("  → Procesando LaTeX...")
 
         try:
             latex_content = latex_data.decode('utf-8', errors='ignore')
 
             # Leer plantilla principal
-            plantilla_path = os.path.join(PLANTILLAS_FOLDER, plantilla_folder, plantilla_main)
-            if os.path.exists(plantilla_path):
-                with open(plantilla_path, 'r', encoding='utf-8') as f:
-                    plantilla_content = f.read()
+            plantilla_content = self.read_plantilla(plantilla_folder, plantilla_main)
+            if plantilla_content is not None:
+                # Reenvío idéntico: reutilizar la conversión anterior
+                cache_key = self.conversion_key('tex', latex_data, plantilla_content, job)
+                if self.cache:
+                    cached = self.cache.get(cache_key)
+                    if cached is not None:
+                        print("  ✓ LaTeX recuperado de caché")
+                        job['conversion'] = 'cache'
+                        return cached
 
                 # Ajustar con Gemini
+                job['conversion'] = 'gemini'
                 prompt = f"""
 Eres un experto en LaTeX. Ajusta el siguiente documento LaTeX a esta plantilla de revista.
 
@@ -313,8 +1344,10 @@ Devuelve SOLO el código LaTeX completo.
 """
 
                 print("  → Ajustando con Gemini API...")
-                response = self.model.generate_content(prompt)
-                latex_content = response.text.replace('```latex', '').replace('```', '').strip()
+                latex_content = self.generate_latex(prompt, self.job_tex_path(job['job_id']))
+
+                if self.cache:
+                    self.cache.put(cache_key, latex_content)
 
             return latex_content
 
@@ -323,7 +1356,102 @@ Devuelve SOLO el código LaTeX completo.
             # Retornar original si falla
             return latex_data.decode('utf-8', errors='ignore')
 
+    def job_tex_path(self, job_id):
+        """Ruta del .tex principal en el directorio del trabajo"""
+        temp_dir = os.path.join(TEMP_FOLDER, job_id)
+        os.makedirs(temp_dir, exist_ok=True)
+        return os.path.join(temp_dir, f"{job_id}.tex")
+
     def compile_latex(self, latex_content, job_id, compilador, plantilla_folder):
+        """
+        Compila LaTeX a PDF reparando los errores localizados.
+        Devuelve (ruta del PDF, LaTeX finalmente compilado).
+        """
+        deadline = time.monotonic() + REPAIR_TIME_LIMIT
+        attempts = 0
+
+        while True:
+            try:
+                pdf_file = self._compile(latex_content, job_id, compilador, plantilla_folder)
+                return pdf_file, latex_content
+            except LatexCompileError as e:
+                # Solo se reparan errores del documento del trabajo: con un error en la
+                # plantilla (.cls/.sty) o en un \input, su línea no es del documento
+                if e.line is None or e.file != f"{job_id}.tex":
+                    raise
+                if attempts >= REPAIR_MAX_ATTEMPTS or time.monotonic() > deadline:
+                    raise
+                attempts += 1
+                self.log(job_id, 'warning', f'Reparando error de LaTeX (intento {attempts}): {e}')
+                with metrics.timer('job_stage_seconds', stage='repair'):
+                    repaired = self.repair_latex(latex_content, e)
+                if repaired is None:
+                    raise
+                latex_content = repaired
+
+    def repair_latex(self, latex_content, error):
+        """Pide a Gemini que corrija solo las líneas alrededor del error"""
+        lines = latex_content.split('\n')
+        if error.line > len(lines):
+            return None
+
+        start = max(0, error.line - 1 - REPAIR_CONTEXT_LINES)
+        end = min(len(lines), error.line + REPAIR_CONTEXT_LINES // 2)
+        snippet = '\n'.join(lines[start:end])
+
+        print(f"  → Reparando líneas {start + 1}-{end} con Gemini...")
+        prompt = f"""
+Eres un experto en LaTeX. Al compilar un documento se produjo este error:
+
+{error.context}
+
+El error está en la línea {error.line}. Estas son las líneas {start + 1} a {end} del documento:
+
+{snippet}
+
+INSTRUCCIONES:
+1. Corrige el error cambiando lo mínimo posible
+2. Devuelve las mismas líneas ({start + 1} a {end}) corregidas, sin números de línea
+3. NO añadas \\documentclass, \\begin{{document}} ni contenido de otras partes del documento
+4. NO incluyas explicaciones
+
+Devuelve SOLO las líneas corregidas, sin bloques de código markdown.
+"""
+        patch = clean_latex_response(self.gemini.generate(prompt))
+
+        # Descartar respuestas vacías, idénticas o desproporcionadas
+        if not patch or patch == snippet.strip() or len(patch) > 3 * len(snippet) + 500:
+            print("  ⚠ Gemini no devolvió una corrección utilizable")
+            return None
+
+        return '\n'.join(lines[:start] + [patch] + lines[end:])
+
+    def _prepare_compile(self, latex_content, temp_dir, compilador, plantilla_folder):
+        """
+        Expone la plantilla y prepara el formato precompilado.
+        Devuelve (entorno del compilador, contenido a compilar, formato o None).
+        """
+        # La plantilla (.cls, logos/, figuras/...) se expone sin copiarla en cada trabajo
+        env = None
+        with metrics.timer('job_stage_seconds', stage='template'):
+            template_env = template_registry.materialize(plantilla_folder, temp_dir, TEMPLATE_MODE)
+        if template_env is None:
+            print(f"  ⚠ Carpeta de plantilla no encontrada: {plantilla_folder}")
+        elif template_env:
+            env = dict(os.environ, **template_env)
+
+        # Arrancar desde el formato precompilado del preámbulo si es posible
+        fmt = None
+        compile_content = latex_content
+        snapshot = template_registry.get(plantilla_folder)
+        if self.formats and snapshot:
+            build_env = dict(os.environ, **template_registry.materialize(plantilla_folder, temp_dir, MODE_TEXINPUTS))
+            with metrics.timer('job_stage_seconds', stage='format'):
+                compile_content, fmt = self.formats.prepare(latex_content, compilador, snapshot.signature, build_env)
+
+        return env, compile_content, fmt
+
+    def _compile(self, latex_content, job_id, compilador, plantilla_folder):
         """Compila LaTeX a PDF"""
         print(f"  → Compilando con {compilador}...")
 
@@ -331,64 +1459,98 @@ Devuelve SOLO el código LaTeX completo.
         temp_dir = os.path.join(TEMP_FOLDER, job_id)
         os.makedirs(temp_dir, exist_ok=True)
 
-        # IMPORTANTE: Copiar TODA la carpeta de la plantilla al directorio temporal
-        # Esto incluye: .cls, logos/, figuras/, y cualquier archivo adicional
-        plantilla_source = os.path.join(PLANTILLAS_FOLDER, plantilla_folder)
-
-        if os.path.exists(plantilla_source):
-            print(f"  → Copiando plantilla desde {plantilla_source}...")
-            import shutil
-
-            # Copiar todos los archivos y subcarpetas
-            for item in os.listdir(plantilla_source):
-                source = os.path.join(plantilla_source, item)
-                dest = os.path.join(temp_dir, item)
-
-                if os.path.isdir(source):
-                    # Copiar carpeta completa (logos/, figuras/, etc.)
-                    if os.path.exists(dest):
-                        shutil.rmtree(dest)
-                    shutil.copytree(source, dest)
-                else:
-                    # Copiar archivo (.cls, .sty, etc.)
-                    shutil.copy2(source, dest)
-
-            print(f"  ✓ Plantilla copiada")
-        else:
-            print(f"  ⚠ Carpeta de plantilla no encontrada: {plantilla_source}")
+        env, compile_content, fmt = self._prepare_compile(latex_content, temp_dir, compilador, plantilla_folder)
 
         # Escribir .tex con el contenido procesado
         tex_file = os.path.join(temp_dir, f"{job_id}.tex")
         with open(tex_file, 'w', encoding='utf-8') as f:
-            f.write(latex_content)
-
-        # Compilar (2 pasadas)
-        for i in range(2):
-            print(f"    Pasada {i+1}/2...")
-            result = subprocess.run(
-                [compilador, '-interaction=nonstopmode', f"{job_id}.tex"],
-                cwd=temp_dir,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+            f.write(compile_content)
 
-            if result.returncode != 0:
-                print(f"  ✗ Error en compilación:")
-                print(result.stdout[-1000:])
-                raise Exception(f"Error al compilar LaTeX (código {result.returncode})")
-
-        # Verificar PDF
-        pdf_file = os.path.join(temp_dir, f"{job_id}.pdf")
-        if not os.path.exists(pdf_file):
-            raise Exception("El PDF no se generó")
+        try:
+            pdf_file = self._run_passes(temp_dir, job_id, compilador, env, fmt)
+        except LatexCompileError as e:
+            if not fmt:
+                raise
+            # Con formato, el preámbulo queda reducido a las líneas volcadas y \endofdump
+            compile_lines = compile_content.split('\n')
+            dump_line = compile_lines.index('\\endofdump') + 1
+            format_error = is_format_error(e, dump_line)
+
+            if not format_error and e.line is not None and e.line > dump_line and e.file == f"{job_id}.tex":
+                # Error del documento (en el cuerpo): el formato sigue siendo válido.
+                # La línea se traslada al documento sin formato, que es el que se repara.
+                shift = len(compile_lines) - len(latex_content.split('\n'))
+                raise compile_error(e.error, e.line - shift, e.context, e.file, e.file) from e
+
+            # Formato inservible o error sin ubicar: reintentar sin formato
+            print("  ⚠ Falló la compilación con formato precompilado, reintentando sin él...")
+            if format_error:
+                self.formats.mark_failed(fmt)
+            with open(tex_file, 'w', encoding='utf-8') as f:
+                f.write(latex_content)
+            pdf_file = self._run_passes(temp_dir, job_id, compilador, env)
+            if not format_error:
+                # Sin formato compila: el error también era del formato
+                self.formats.mark_failed(fmt)
+        finally:
+            if fmt:
+                self.formats.release(fmt)
+
+        print("  ✓ PDF generado")
+        return pdf_file
 
-        print(f"  ✓ PDF generado")
+    def _run_passes(self, temp_dir, job_id, compilador, env, fmt=None):
+        """Compila en el pool de procesos si está disponible"""
+        with metrics.timer('job_stage_seconds', stage='latex'):
+            if self.compile_executor:
+                future = self.compile_executor.submit(
+                    run_latex_passes, temp_dir, job_id, compilador, env, fmt, MAX_COMPILE_PASSES
+                )
+                pdf_file, passes = future.result()
+            else:
+                pdf_file, passes = run_latex_passes(temp_dir, job_id, compilador, env, fmt, MAX_COMPILE_PASSES)
+        metrics.observe('latex_passes', passes, compilador=compilador)
         return pdf_file
 
-    def process_job(self, job):
-        """Procesa un trabajo completo"""
+    def warmup_template(self, compilador, plantilla_folder, plantilla_main):
+        """
+        Compila el esqueleto de la plantilla en el pool de procesos (construye
+        el formato y calienta las cachés de archivos y fuentes). Devuelve un Future.
+        """
+        plantilla_content = self.read_plantilla(plantilla_folder, plantilla_main)
+        if plantilla_content is None or not self.compile_executor:
+            return None
+
+        job_id = f"warmup-{compilador}-{plantilla_folder}"
+        temp_dir = os.path.join(TEMP_FOLDER, job_id)
+        os.makedirs(temp_dir, exist_ok=True)
+
+        env, compile_content, fmt = self._prepare_compile(
+            warmup_document(plantilla_content), temp_dir, compilador, plantilla_folder
+        )
+        with open(os.path.join(temp_dir, f"{job_id}.tex"), 'w', encoding='utf-8') as f:
+            f.write(compile_content)
+
+        return self.compile_executor.submit(
+            run_latex_passes, temp_dir, job_id, compilador, env, fmt, 1
+        )
+
+    @contextmanager
+    def stage(self, job, name):
+        """Mide una etapa del trabajo (histograma global y resumen del trabajo)"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.observe('job_stage_seconds', elapsed, stage=name)
+            timings = job.setdefault('timings', {})
+            timings[name] = timings.get(name, 0) + elapsed
+
+    def fetch_job(self, job):
+        """Etapa de descarga: registra el inicio del trabajo y descarga su archivo"""
         job_id = job['job_id']
+        job['start_time'] = time.monotonic()
 
         print(f"\n{'='*60}")
         print(f"Procesando: {job_id}")
@@ -396,21 +1558,33 @@ Devuelve SOLO el código LaTeX completo.
         print(f"Revista: {job['revista_nombre']}")
         print(f"{'='*60}")
 
-        try:
-            # Actualizar a processing
-            self.update_job_status(job_id, 'processing')
-            self.log(job_id, 'info', 'Iniciando procesamiento')
+        if job.get('created_at') and job.get('started_at'):
+            queue_wait = (job['started_at'] - job['created_at']).total_seconds()
+            metrics.observe('job_queue_wait_seconds', max(0, queue_wait))
+
+        # El trabajo ya fue marcado como 'processing' al reclamarlo
+        self.log(job_id, 'info', f'Iniciando procesamiento ({WORKER_ID})')
+
+        # Descargar el archivo solo ahora (el reclamo trae solo metadatos)
+        with self.stage(job, 'fetch'):
+            job['file_data'] = self.source.fetch(job)
 
-            # Procesar según tipo
+    def convert_job(self, job, use_local=True):
+        """Etapa de conversión: LaTeX del documento (Gemini, caché o conversión local)"""
+        job_id = job['job_id']
+
+        # Procesar según tipo
+        with self.stage(job, 'convert'):
             if job['file_extension'] in ['doc', 'docx']:
-                latex_content = self.process_word_to_latex(
+                job['latex_content'] = self.process_word_to_latex(
                     job['file_data'],
                     job['plantilla_folder'],
                     job['plantilla_main'],
-                    job
+                    job,
+                    use_local=use_local
                 )
             elif job['file_extension'] == 'tex':
-                latex_content = self.process_latex_file(
+                job['latex_content'] = self.process_latex_file(
                     job['file_data'],
                     job['plantilla_folder'],
                     job['plantilla_main'],
@@ -419,36 +1593,355 @@ Devuelve SOLO el código LaTeX completo.
             else:
                 raise Exception(f"Tipo de archivo no soportado: {job['file_extension']}")
 
+        if job.get('conversion') == 'local':
+            self.log(job_id, 'info', 'Documento convertido localmente (sin Gemini)')
+        elif job.get('conversion') == 'revision':
+            self.log(job_id, 'info', 'Revisión procesada con Gemini (solo las secciones modificadas)')
+        else:
             self.log(job_id, 'info', 'Documento procesado con Gemini')
 
-            # Compilar (pasa plantilla_folder para copiar archivos .cls, logos, etc.)
-            pdf_file = self.compile_latex(
-                latex_content,
-                job_id,
-                job['compilador'],
-                job['plantilla_folder']
-            )
-            self.log(job_id, 'info', 'PDF compilado')
+    def compile_job(self, job):
+        """Etapa de compilación: PDF del LaTeX convertido (reparando los errores localizados)"""
+        job_id = job['job_id']
 
-            # Guardar PDF
-            self.save_pdf(job_id, pdf_file)
+        # Compilar (pasa plantilla_folder para copiar archivos .cls, logos, etc.)
+        try:
+            with self.stage(job, 'compile'):
+                job['pdf_file'], job['compiled_latex'] = self.compile_latex(
+                    job['latex_content'],
+                    job_id,
+                    job['compilador'],
+                    job['plantilla_folder']
+                )
+        except LatexCompileError:
+            if job.get('conversion') != 'local':
+                raise
+            # La conversión local no compiló: se repite con Gemini. Es raro, así que
+            # se hace en este hilo en lugar de devolver el trabajo a la etapa anterior
+            self.log(job_id, 'warning', 'La conversión local no compiló, se usa Gemini')
+            self.convert_job(job, use_local=False)
+            with self.stage(job, 'compile'):
+                job['pdf_file'], job['compiled_latex'] = self.compile_latex(
+                    job['latex_content'],
+                    job_id,
+                    job['compilador'],
+                    job['plantilla_folder']
+                )
+        self.log(job_id, 'info', 'PDF compilado')
+
+    def upload_job(self, job):
+        """Etapa de subida: entrega el PDF y guarda lo reutilizable en próximos envíos"""
+        job_id = job['job_id']
+        compiled_latex = job['compiled_latex']
 
-            # Actualizar estado
-            self.update_job_status(job_id, 'completed')
-            self.log(job_id, 'info', 'Trabajo completado')
+        # Guardar en caché la versión reparada para no repetir la reparación
+        if compiled_latex != job['latex_content'] and self.cache and job.get('conversion') != 'local':
+            self.cache.put(self.job_cache_key(job, job['file_data']), compiled_latex)
 
-            # Marcar para notificación
-            self.notify_user(job_id, 'completed')
+        # Entregar el PDF (en MySQL: guardar, completar y notificar en una transacción)
+        with self.stage(job, 'upload'):
+            self.sink.complete(job, self.optimize_pdf(job['pdf_file']))
+        self.log(job_id, 'info', 'Trabajo completado')
 
-            print(f"✓ Completado: {job_id}")
+        print(f"✓ Completado: {job_id}")
 
+        # Secciones para la próxima revisión (la conversión local no usa Gemini, no hace falta)
+        if REVISION_REUSE and job.get('section_keys') and job.get('conversion') != 'local':
+            self.save_sections(job, compiled_latex)
+
+    def fail_job(self, job, error):
+        """Marca el trabajo como error (en cualquier etapa)"""
+        error_msg = str(error)
+        print(f"✗ Error: {error_msg}")
+
+        # Una conversión que no compila no debe reutilizarse en un reenvío
+        if isinstance(error, LatexCompileError) and self.cache:
+            self.cache.discard(self.job_cache_key(job, job['file_data']))
+
+        self.sink.fail(job, error_msg)
+        self.log(job['job_id'], 'error', error_msg)
+
+    def finish_job(self, job, status):
+        """Métricas y resumen de tiempos al terminar el trabajo; libera su contenido"""
+        elapsed = time.monotonic() - job.get('start_time', time.monotonic())
+        metrics.observe('job_duration_seconds', elapsed, status=status)
+        metrics.inc('jobs_total', status=status, conversion=job.get('conversion', 'none'))
+
+        # Resumen de tiempos en los logs del trabajo
+        timings = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in job.get('timings', {}).items())
+        self.log(job['job_id'], 'info', f'Tiempos: total {elapsed:.2f}s' + (f' ({timings})' if timings else ''))
+
+        self.sink.flush()
+
+        # El trabajo ya no necesita el documento ni el LaTeX en memoria
+        for key in ('file_data', 'latex_content', 'compiled_latex'):
+            job.pop(key, None)
+
+    def process_job(self, job):
+        """Procesa un trabajo completo en este hilo (todas las etapas seguidas)"""
+        status = 'error'
+        try:
+            self.fetch_job(job)
+            self.convert_job(job)
+            self.compile_job(job)
+            self.upload_job(job)
+            status = 'completed'
         except Exception as e:
-            error_msg = str(e)
-            print(f"✗ Error: {error_msg}")
+            self.fail_job(job, e)
+        finally:
+            self.finish_job(job, status)
+
+
+def clean_latex_response(text):
+    """Quita los bloques de código markdown de la respuesta de Gemini"""
+    return text.replace('```latex', '').replace('```', '').strip()
+
+
+def strip_document_wrapper(fragment):
+    """Elimina preámbulo y \\begin/\\end{document} si Gemini los incluyó"""
+    begin = fragment.find('\\begin{document}')
+    if begin != -1:
+        fragment = fragment[begin + len('\\begin{document}'):]
+    end = fragment.rfind('\\end{document}')
+    if end != -1:
+        fragment = fragment[:end]
+    return fragment.strip()
+
+
+def insert_sections(frame, body):
+    """Inserta las secciones convertidas en el documento marco"""
+    lines = frame.split('\n')
+    for i, line in enumerate(lines):
+        if SECTIONS_PLACEHOLDER in line:
+            lines[i] = body
+            return '\n'.join(lines)
+
+    # Sin marca: antes de la bibliografía o del final del documento
+    for marker in BODY_END_MARKERS:
+        position = frame.find(marker)
+        if position != -1:
+            return f"{frame[:position]}{body}\n\n{frame[position:]}"
+
+    return f"{frame}\n\n{body}"
+
+
+def split_latex_sections(latex):
+    """
+    Inverso de insert_sections: (marco con SECTIONS_PLACEHOLDER, fragmentos de
+    cada \\section en orden), o None si el documento no tiene secciones
+    """
+    begin = latex.find('\\begin{document}')
+    if begin == -1:
+        return None
+    starts = [match.start() for match in SECTION_COMMAND.finditer(latex, begin)]
+    if not starts:
+        return None
+
+    # El cuerpo de secciones termina en la bibliografía o al final del documento
+    ends = [latex.find(marker, starts[-1]) for marker in BODY_END_MARKERS]
+    end = min((position for position in ends if position != -1), default=len(latex))
+
+    fragments = [latex[start:stop].strip() for start, stop in zip(starts, starts[1:] + [end])]
+    frame = f"{latex[:starts[0]]}{SECTIONS_PLACEHOLDER}\n\n{latex[end:]}"
+    return frame, fragments
+
+
+class WorkerPool:
+    """
+    Procesa varios trabajos a la vez en un pipeline de etapas (descarga,
+    conversión, compilación, subida), cada una con sus propios hilos
+    """
+
+    def __init__(self, api_key, max_workers=MAX_WORKERS, compile_processes=COMPILE_PROCESSES,
+                 source_factory=None, sink_factory=None):
+        self.api_key = api_key
+
+        # Pool de procesos para compilar (cada pasada lanza su propio TeX)
+        self.compile_executor = None
+        if compile_processes > 0:
+            self.compile_executor = ProcessPoolExecutor(max_workers=compile_processes)
+
+        # Caché de conversiones compartida por todos los hilos
+        self.cache = None
+        if CACHE_MAX_MB > 0:
+            self.cache = ConversionCache(CACHE_FOLDER, CACHE_MAX_MB * 1024 * 1024)
+
+        # Origen de trabajos de cada hilo (por defecto la cola MySQL, con conexión
+        # propia por hilo y logs en lotes compartidos)
+        self.log_writer = None
+        if source_factory is None:
+            self.log_writer = ProcessingLogWriter()
+            source_factory = lambda: MySQLJobSource(MySQLConnection(), self.log_writer)
+        self.source_factory = source_factory
+        # Destino de los resultados de cada hilo (None = el mismo origen)
+        self.sink_factory = sink_factory
+
+        # Un solo cliente de Gemini para que todos los hilos compartan la cuota
+        self.gemini = create_gemini_client(api_key)
+
+        # Formatos precompilados compartidos por todos los hilos
+        self.formats = None
+        if PRECOMPILE_FORMATS:
+            self.formats = FormatCache(FORMATS_FOLDER, PRECOMPILE_FORMATS)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sources = []
+        self._in_flight = set()
+        # Se activa cada vez que queda sitio para otro trabajo
+        self.slot_freed = threading.Event()
+
+        # Etapas del trabajo: hilos de cada una según lo que la limita (red, Gemini, CPU)
+        self.pipeline = StagePipeline(
+            [
+                ('fetch', self._stage('fetch_job'), FETCH_WORKERS),
+                ('convert', self._stage('convert_job'), max_workers),
+                ('compile', self._stage('compile_job'), COMPILE_WORKERS or max(1, compile_processes)),
+                ('upload', self._stage('upload_job'), UPLOAD_WORKERS),
+            ],
+            queue_size=STAGE_QUEUE_SIZE,
+            on_done=self._done,
+            on_error=self._failed,
+            on_take=self.slot_freed.set
+        )
+
+        # Hilo de heartbeat con conexión propia
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def _get_processor(self):
+        """Procesador del hilo actual (cada hilo tiene su propio origen, p. ej. su conexión MySQL)"""
+        processor = getattr(self._local, 'processor', None)
+        if processor is None:
+            source = self.source_factory()
+            sink = self.sink_factory() if self.sink_factory else None
+            with self._lock:
+                self._sources.extend(item for item in (source, sink) if item is not None)
+            processor = DocumentProcessor(
+                self.api_key, source, self.compile_executor, self.cache, self.formats,
+                self.gemini, sink
+            )
+            self._local.processor = processor
+        return processor
+
+    def warmup(self, wait=False):
+        """Compila el esqueleto de cada plantilla activa en el pool de procesos"""
+        if not self.compile_executor:
+            return None
+        if not wait:
+            thread = threading.Thread(target=self.warmup, args=(True,), name='warmup', daemon=True)
+            thread.start()
+            return thread
+
+        processor = self._get_processor()
+        try:
+            plantillas = processor.source.active_templates()
+        except Exception as e:
+            print(f"  ⚠ No se pudieron leer las plantillas para el calentamiento: {e}")
+            return None
+
+        started = time.time()
+        futures = {}
+        for row in plantillas:
+            try:
+                future = processor.warmup_template(row['compilador'], row['plantilla_folder'], row['plantilla_main'])
+            except Exception as e:
+                print(f"  ⚠ Calentamiento de {row['plantilla_folder']}: {e}")
+                continue
+            if future:
+                futures[future] = row['plantilla_folder']
 
-            self.update_job_status(job_id, 'error', error_msg)
-            self.log(job_id, 'error', error_msg)
-            self.notify_user(job_id, 'error')
+        wait_futures(futures)
+        warmed = 0
+        for future, plantilla_folder in futures.items():
+            try:
+                future.result()
+                warmed += 1
+            except Exception as e:
+                # No es grave: la plantilla se compilará en frío con el primer trabajo
+                print(f"  ⚠ Calentamiento de {plantilla_folder}: {e}")
+        print(f"✓ Plantillas calentadas: {warmed}/{len(plantillas)} ({time.time() - started:.1f}s)")
+        return None
+
+    def _heartbeat_loop(self):
+        """Renueva periódicamente los leases mientras haya trabajos en curso"""
+        processor = None
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._lock:
+                job_ids = sorted(self._in_flight)
+            if not job_ids:
+                continue
+            try:
+                if processor is None:
+                    processor = self._get_processor()
+                processor.source.renew_leases(job_ids)
+            except Exception as e:
+                print(f"  ⚠ Error en heartbeat: {e}")
+
+    def _stage(self, method):
+        """Función de una etapa: el método del procesador del hilo que la ejecuta"""
+        def run(job):
+            getattr(self._get_processor(), method)(job)
+        return run
+
+    def _release(self, job):
+        with self._lock:
+            self._in_flight.discard(job['job_id'])
+        self.slot_freed.set()
+
+    def _done(self, job):
+        """Trabajo que pasó por todas las etapas"""
+        try:
+            self._get_processor().finish_job(job, 'completed')
+        finally:
+            self._release(job)
+
+    def _failed(self, job, stage, error):
+        """
+        Trabajo que falló en una etapa: no sigue por el pipeline. Si ni siquiera
+        se puede marcar el error (p. ej. no hay procesador por falta de conexión)
+        se suelta igualmente: el heartbeat deja de renovar su lease, que caduca y
+        el trabajo se vuelve a reclamar.
+        """
+        try:
+            processor = self._get_processor()
+            processor.fail_job(job, error)
+            processor.finish_job(job, 'error')
+        except Exception as e:
+            print(f"✗ Error en etapa {stage} ({job['job_id']}): {error}")
+            print(f"  ✗ No se pudo marcar el error, el lease caducará: {e}")
+        finally:
+            self._release(job)
+
+    def in_flight(self):
+        """Trabajos en curso (en cualquier etapa o esperando en sus colas)"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def free_slots(self):
+        """Trabajos que se pueden encolar sin esperar (sitio en la cola de descarga)"""
+        return self.pipeline.space()
+
+    def submit(self, job):
+        """Encola un trabajo en el pipeline"""
+        with self._lock:
+            self._in_flight.add(job['job_id'])
+        self.pipeline.put(job)
+
+    def shutdown(self):
+        """Espera a los trabajos en curso y libera recursos"""
+        self.pipeline.shutdown()
+        self._stop.set()
+        self._heartbeat.join()
+        if self.log_writer:
+            self.log_writer.close()
+        if self.compile_executor:
+            self.compile_executor.shutdown(wait=True)
+        with self._lock:
+            for source in self._sources:
+                source.close()
+            self._sources = []
 
 
 def is_work_hours():
@@ -471,7 +1964,11 @@ def main():
     print(f"MySQL: {MYSQL_HOST}:{MYSQL_PORT}")
     print(f"Base de datos: {MYSQL_DB}")
     print(f"Horario: {WORK_START_HOUR}:00 - {WORK_END_HOUR}:00")
-    print(f"Polling: cada {POLL_INTERVAL} segundos")
+    print(f"Polling: señal cada {NOTIFY_MIN_INTERVAL}-{NOTIFY_MAX_INTERVAL} s, cola cada {POLL_INTERVAL} s como máximo")
+    print(f"Hilos: descarga {FETCH_WORKERS}, conversión {MAX_WORKERS}, "
+          f"compilación {COMPILE_WORKERS or max(1, COMPILE_PROCESSES)}, "
+          f"subida {UPLOAD_WORKERS} | Procesos de compilación: {COMPILE_PROCESSES}")
+    print(f"Worker ID: {WORKER_ID}")
     print("="*60)
 
     # Validar configuración
@@ -483,11 +1980,34 @@ def main():
         print("\n✗ ERROR: Configura GEMINI_API_KEY")
         sys.exit(1)
 
+    # El pool no puede superar el máximo de mysql.connector: con menos conexiones
+    # que hilos, los hilos esperarían una conexión que no llega
+    if mysql_pool.size > pooling.CNX_POOL_MAXSIZE:
+        print(f"\n✗ ERROR: Se necesitan {mysql_pool.size} conexiones MySQL y el máximo es "
+              f"{pooling.CNX_POOL_MAXSIZE}. Reduce FETCH_WORKERS, MAX_WORKERS, "
+              f"COMPILE_WORKERS/COMPILE_PROCESSES o UPLOAD_WORKERS")
+        sys.exit(1)
+
     # Conectar a MySQL
     db = MySQLConnection()
+    db.connect()
+
+    # Pool de trabajo y origen (solo para reclamar trabajos de la cola)
+    pool = WorkerPool(GEMINI_API_KEY)
+    source = MySQLJobSource(db)
+    notifier = JobNotifier(db)
+
+    # Endpoint de métricas para Prometheus (o consulta manual con el navegador)
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT)
+            print(f"✓ Métricas en http://localhost:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠ No se pudo iniciar el endpoint de métricas: {e}")
 
-    # Inicializar procesador
-    processor = DocumentProcessor(GEMINI_API_KEY, db)
+    # Calentar formatos y cachés de las plantillas mientras se esperan trabajos
+    if COMPILE_WARMUP:
+        pool.warmup()
 
     print("\n✓ Worker iniciado. Esperando trabajos...\n")
 
@@ -500,28 +2020,41 @@ def main():
                 time.sleep(300)  # Esperar 5 minutos
                 continue
 
-            # Obtener trabajos pendientes
-            jobs = processor.get_pending_jobs()
+            # Sin sitio en el pipeline: esperar a que la descarga tome algún trabajo
+            free_slots = pool.free_slots()
+            if free_slots == 0:
+                pool.slot_freed.wait(POLL_INTERVAL)
+                pool.slot_freed.clear()
+                continue
+
+            jobs = source.claim(limit=free_slots)
 
             if jobs:
-                print(f"\n✓ Encontrados {len(jobs)} trabajo(s) pendiente(s)")
+                print(f"\n✓ Reclamados {len(jobs)} trabajo(s) pendiente(s)")
 
                 for job in jobs:
-                    processor.process_job(job)
+                    pool.submit(job)
+                notifier.reset()
 
-                print("\n✓ Todos los trabajos procesados")
+                # Lote lleno: probablemente quedan más, reclamar en cuanto haya sitio
+                if len(jobs) == free_slots:
+                    continue
+            elif pool.in_flight():
+                now = datetime.now()
+                print(f"[{now.strftime('%H:%M:%S')}] {pool.in_flight()} trabajo(s) en curso...")
             else:
                 now = datetime.now()
                 print(f"[{now.strftime('%H:%M:%S')}] Sin trabajos pendientes. Esperando...")
 
-            # Esperar antes del próximo ciclo
-            time.sleep(POLL_INTERVAL)
+            # Cola vacía: esperar la señal de PHP (o POLL_INTERVAL para leases expirados)
+            notifier.wait(POLL_INTERVAL)
 
     except KeyboardInterrupt:
         print("\n\n✓ Deteniendo worker...")
     except Exception as e:
         print(f"\n\n✗ Error fatal: {e}")
     finally:
+        pool.shutdown()
         db.close()
 
     print("Worker detenido.")